@@ -0,0 +1,291 @@
+"""
+Answer Cache for Dostup Bot
+
+Persistent cache of assistant answers. Questions are normalized
+(case-folded, punctuation stripped, stopwords removed) for exact hits, and
+near-duplicates are found with a local TF-IDF cosine similarity index.
+Negations are kept in the key and must agree for a near-duplicate hit, so
+"нужно ли ..." and "не нужно ли ..." never share an answer.
+Entries live in SQLite with a TTL and are evicted least-recently-used
+once the cache exceeds its size limit; database access runs on the
+executor thread of a SqliteStore connection, off the event loop.
+"""
+import logging
+import math
+import os
+import re
+import sqlite3
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlite_store import SqliteStore
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+DEFAULT_TTL = 7 * 24 * 60 * 60  # seconds
+DEFAULT_MAX_ENTRIES = 5000
+DEFAULT_SIMILARITY = 0.85
+# Near-duplicate matching needs some content; very short questions only hit exactly
+MIN_TOKENS_FOR_SIMILARITY = 3
+
+STOPWORDS = {
+    # Russian
+    "а", "бы", "в", "во", "вот", "вы", "да", "для", "до", "же", "за", "и", "из", "или",
+    "им", "их", "к", "как", "ко", "ли", "мне", "мой", "мы", "на", "над",
+    "но", "ну", "о", "об", "он", "она", "они", "оно", "от", "по", "под", "при", "с",
+    "со", "так", "также", "то", "ты", "у", "уж", "чем", "что", "чтобы", "это", "этот",
+    "я", "ещё", "еще", "мою", "мой", "моя", "мои", "можно", "пожалуйста", "подскажите",
+    "скажите", "привет", "здравствуйте",
+    # English
+    "a", "an", "and", "are", "do", "does", "for", "how", "i", "in", "is", "it", "my",
+    "of", "on", "or", "please", "the", "to", "what", "with", "you",
+}
+
+# Kept in the key (not stopwords): they flip the meaning of a question
+NEGATIONS = {"не", "нет", "ни", "no", "not", "never"}
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+
+
+def tokenize(question: str) -> list:
+    """Case-fold, strip punctuation and stopwords"""
+    text = _PUNCTUATION.sub(" ", (question or "").casefold().replace("ё", "е"))
+    return [token for token in text.split() if token not in STOPWORDS]
+
+
+def normalize_question(question: str) -> str:
+    """Normalized cache key of a question"""
+    return " ".join(tokenize(question))
+
+
+class AnswerCache:
+    """SQLite-backed answer cache with near-duplicate lookup"""
+
+    def __init__(self, db_path: str = "answer_cache.db", ttl: int = DEFAULT_TTL,
+                 max_entries: int = DEFAULT_MAX_ENTRIES,
+                 similarity: float = DEFAULT_SIMILARITY):
+        """
+        Initialize the answer cache
+
+        Args:
+            db_path: Path to the SQLite database file
+            ttl: Lifetime of an answer in seconds
+            max_entries: Maximum number of cached answers (LRU eviction)
+            similarity: Minimum TF-IDF cosine similarity for a near-duplicate hit
+        """
+        self.db_path = db_path
+        self.store = SqliteStore(db_path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity = similarity
+
+        # In-memory similarity index: key -> token counts, token -> keys
+        self._docs: Dict[str, Counter] = {}
+        self._postings: Dict[str, Set[str]] = defaultdict(set)
+
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+
+        self._init_db()
+        self._load_index()
+
+    def _init_db(self) -> None:
+        """Initialize the SQLite database with required tables"""
+        try:
+            self.store.run_sync(self._create_tables)
+        except sqlite3.Error as e:
+            logger.error(f"Answer cache initialization error: {e}")
+
+    @staticmethod
+    def _create_tables(conn: sqlite3.Connection) -> None:
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS answer_cache (
+            question_key TEXT PRIMARY KEY,  -- normalized question
+            question TEXT,  -- original wording of the first asker
+            answer TEXT,
+            created_at INTEGER,  -- Unix timestamp
+            last_hit_at INTEGER,  -- Unix timestamp (LRU order)
+            hits INTEGER DEFAULT 0
+        )
+        ''')
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_answer_cache_lru ON answer_cache (last_hit_at)"
+        )
+
+    def _load_index(self) -> None:
+        try:
+            keys = self.store.run_sync(self._load_keys, int(time.time()) - self.ttl)
+        except sqlite3.Error as e:
+            logger.error(f"Error loading answer cache: {e}")
+            return
+        for key in keys:
+            self._index(key)
+        logger.info(f"Answer cache loaded with {len(self._docs)} answers")
+
+    @staticmethod
+    def _load_keys(conn: sqlite3.Connection, expired_before: int) -> List[str]:
+        """Drop expired entries and entries keyed by an older normalization"""
+        conn.execute("DELETE FROM answer_cache WHERE created_at < ?", (expired_before,))
+        rows = conn.execute("SELECT question_key, question FROM answer_cache").fetchall()
+        # Keys from before negations were kept may answer the opposite question
+        stale = [(key,) for key, question in rows if normalize_question(question) != key]
+        if stale:
+            conn.executemany("DELETE FROM answer_cache WHERE question_key = ?", stale)
+            logger.info(f"Dropped {len(stale)} answers cached under an outdated question key")
+        return [key for key, question in rows if normalize_question(question) == key]
+
+    def _index(self, key: str) -> None:
+        tokens = Counter(key.split())
+        self._docs[key] = tokens
+        for token in tokens:
+            self._postings[token].add(key)
+
+    def _unindex(self, key: str) -> None:
+        for token in self._docs.pop(key, ()):
+            keys = self._postings.get(token)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._postings[token]
+
+    def _idf(self, token: str) -> float:
+        return math.log((len(self._docs) + 1) / (len(self._postings.get(token, ())) + 1)) + 1
+
+    def _vector_norm(self, tokens: Counter) -> float:
+        return math.sqrt(sum((count * self._idf(token)) ** 2 for token, count in tokens.items()))
+
+    def _most_similar(self, key: str) -> Tuple[Optional[str], float]:
+        """Best TF-IDF cosine match for a normalized question"""
+        query = Counter(key.split())
+        if sum(query.values()) < MIN_TOKENS_FOR_SIMILARITY:
+            return None, 0.0
+
+        candidates = set()
+        for token in query:
+            candidates.update(self._postings.get(token, ()))
+        # A negated question is never a near-duplicate of the plain one
+        negations = NEGATIONS.intersection(query)
+        candidates = {
+            candidate for candidate in candidates
+            if NEGATIONS.intersection(self._docs[candidate]) == negations
+        }
+        if not candidates:
+            return None, 0.0
+
+        query_norm = self._vector_norm(query)
+        best_key, best_score = None, 0.0
+        for candidate in candidates:
+            doc = self._docs[candidate]
+            dot = sum(
+                count * doc[token] * self._idf(token) ** 2
+                for token, count in query.items() if token in doc
+            )
+            score = dot / (query_norm * self._vector_norm(doc) or 1.0)
+            if score > best_score:
+                best_key, best_score = candidate, score
+        return best_key, best_score
+
+    async def get(self, question: str) -> Optional[str]:
+        """
+        Look up a cached answer
+
+        Returns:
+            Cached answer or None
+        """
+        key = normalize_question(question)
+        if not key:
+            return None
+
+        matched_key = key if key in self._docs else None
+        if matched_key is None:
+            candidate, score = self._most_similar(key)
+            if candidate is not None and score >= self.similarity:
+                logger.debug(f"Near-duplicate question '{key}' ~ '{candidate}' ({score:.2f})")
+                matched_key = candidate
+
+        if matched_key is None:
+            self.misses += 1
+            return None
+
+        try:
+            answer = await self.store.run(self._read_answer, matched_key, int(time.time()))
+        except sqlite3.Error as e:
+            logger.error(f"Error reading answer cache: {e}")
+            self.misses += 1
+            return None
+        if answer is None:
+            self._unindex(matched_key)
+            self.misses += 1
+            return None
+
+        if matched_key == key:
+            self.exact_hits += 1
+        else:
+            self.similar_hits += 1
+        return answer
+
+    def _read_answer(self, conn: sqlite3.Connection, key: str, now: int) -> Optional[str]:
+        """Read an answer and mark the hit; expired entries are deleted (store thread)"""
+        row = conn.execute(
+            "SELECT answer, created_at FROM answer_cache WHERE question_key = ?", (key,)
+        ).fetchone()
+        if row is None or row[1] < now - self.ttl:
+            conn.execute("DELETE FROM answer_cache WHERE question_key = ?", (key,))
+            return None
+        conn.execute(
+            "UPDATE answer_cache SET last_hit_at = ?, hits = hits + 1 WHERE question_key = ?",
+            (now, key)
+        )
+        return row[0]
+
+    async def put(self, question: str, answer: str) -> None:
+        """Store an answer and evict the least recently used entries over the limit"""
+        key = normalize_question(question)
+        if not key or not answer:
+            return
+
+        try:
+            evicted = await self.store.run(self._write_answer, key, question, answer, int(time.time()))
+        except sqlite3.Error as e:
+            logger.error(f"Error writing answer cache: {e}")
+            return
+
+        self._index(key)
+        for (evicted_key,) in evicted:
+            self._unindex(evicted_key)
+
+    def _write_answer(self, conn: sqlite3.Connection, key: str, question: str, answer: str,
+                      now: int) -> List[Tuple[str]]:
+        """Store an answer and evict over the limit (store thread)"""
+        conn.execute(
+            """INSERT OR REPLACE INTO answer_cache
+               (question_key, question, answer, created_at, last_hit_at, hits)
+               VALUES (?, ?, ?, ?, ?, 0)""",
+            (key, question, answer, now, now)
+        )
+        evicted = conn.execute(
+            """SELECT question_key FROM answer_cache
+               ORDER BY last_hit_at DESC LIMIT -1 OFFSET ?""",
+            (self.max_entries,)
+        ).fetchall()
+        conn.executemany("DELETE FROM answer_cache WHERE question_key = ?", evicted)
+        return evicted
+
+    def stats(self) -> Dict[str, float]:
+        """Return hit-rate metrics"""
+        lookups = self.exact_hits + self.similar_hits + self.misses
+        return {
+            "entries": len(self._docs),
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": ((self.exact_hits + self.similar_hits) / lookups * 100) if lookups else 0.0,
+        }
+
+    async def close(self) -> None:
+        """Close the database connection"""
+        await self.store.close()
@@ -0,0 +1,214 @@
+"""
+Assistant Run Manager for Dostup Bot
+
+Tracks many in-flight OpenAI Assistant runs and polls them together from a
+single task with adaptive backoff, instead of one polling loop per run.
+Futures resolve as runs finish, runs past their deadline are cancelled and
+threads are deleted once their answer has been read.
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Optional
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+RUN_POLL_MIN = float(os.getenv("ASSISTANT_RUN_POLL_MIN", "0.5"))  # seconds
+RUN_POLL_MAX = float(os.getenv("ASSISTANT_RUN_POLL_MAX", "5"))  # seconds
+RUN_POLL_BACKOFF = 1.5
+RUN_DEADLINE = float(os.getenv("ASSISTANT_RUN_DEADLINE", "60"))  # seconds
+
+RUN_PENDING_STATUSES = {"queued", "in_progress", "cancelling"}
+
+
+class RunTimeoutError(Exception):
+    """Raised when a run does not finish before its deadline"""
+
+
+class _TrackedRun:
+    __slots__ = ("thread_id", "run_id", "deadline", "future", "interval", "next_poll", "status")
+
+    def __init__(self, thread_id: str, run_id: str, deadline: float,
+                 future: asyncio.Future, interval: float):
+        self.thread_id = thread_id
+        self.run_id = run_id
+        self.deadline = deadline
+        self.future = future
+        self.interval = interval
+        self.next_poll = time.monotonic() + interval
+        self.status = None
+
+
+class RunManager:
+    """Multiplexed poller for OpenAI Assistant runs"""
+
+    def __init__(self, openai_client, poll_min: float = RUN_POLL_MIN,
+                 poll_max: float = RUN_POLL_MAX, deadline: float = RUN_DEADLINE,
+                 call_site: str = "assistant"):
+        """
+        Initialize the run manager
+
+        Args:
+            openai_client: AsyncOpenAIClient used for all requests
+            poll_min: First (and minimum) poll interval of a run in seconds
+            poll_max: Maximum poll interval of a run in seconds
+            deadline: Default time a run may take before it is cancelled
+            call_site: Metrics label of the OpenAI calls made here
+        """
+        self.openai_client = openai_client
+        self.poll_min = poll_min
+        self.poll_max = poll_max
+        self.deadline = deadline
+        self.call_site = call_site
+        self._runs: Dict[str, _TrackedRun] = {}
+        self._wakeup = None
+        self.task = None
+        self.polls = 0
+
+    def submit(self, thread_id: str, run_id: str, deadline: Optional[float] = None) -> asyncio.Future:
+        """
+        Track a run; the returned future resolves with the finished run object
+
+        The future raises RunTimeoutError if the run is still pending after
+        `deadline` seconds (the run is cancelled on the OpenAI side).
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._runs[run_id] = _TrackedRun(
+            thread_id, run_id, time.monotonic() + (deadline or self.deadline), future, self.poll_min
+        )
+
+        if self._wakeup is None or self.task is None or self.task.done():
+            self._wakeup = asyncio.Event()
+            self.task = asyncio.create_task(self._poll_loop())
+        self._wakeup.set()
+        return future
+
+    async def _poll(self, run: _TrackedRun) -> None:
+        try:
+            result = await self.openai_client.call(lambda c: c.beta.threads.runs.retrieve(
+                thread_id=run.thread_id,
+                run_id=run.run_id
+            ), call_site=self.call_site, operation="threads.runs.retrieve")
+        except Exception as e:
+            logger.warning(f"Error polling run {run.run_id}: {e}")
+            result = None
+        self.polls += 1
+
+        now = time.monotonic()
+        if result is not None and result.status not in RUN_PENDING_STATUSES:
+            self._runs.pop(run.run_id, None)
+            if not run.future.done():
+                run.future.set_result(result)
+            return
+
+        if now >= run.deadline:
+            self._runs.pop(run.run_id, None)
+            await self._cancel(run)
+            if not run.future.done():
+                run.future.set_exception(RunTimeoutError(f"Run {run.run_id} exceeded its deadline"))
+            return
+
+        # Adaptive backoff: poll quickly while the status changes, slow down while it doesn't
+        status = result.status if result is not None else run.status
+        if status == run.status:
+            run.interval = min(self.poll_max, run.interval * RUN_POLL_BACKOFF)
+        else:
+            run.interval = self.poll_min
+        run.status = status
+        run.next_poll = min(now + run.interval, run.deadline)
+
+    async def _cancel(self, run: _TrackedRun) -> None:
+        try:
+            await self.openai_client.call(lambda c: c.beta.threads.runs.cancel(
+                thread_id=run.thread_id,
+                run_id=run.run_id
+            ), call_site=self.call_site, operation="threads.runs.cancel")
+            logger.warning(f"Cancelled run {run.run_id} after its deadline")
+        except Exception as e:
+            logger.warning(f"Error cancelling run {run.run_id}: {e}")
+
+    async def _poll_loop(self) -> None:
+        while self._runs:
+            self._wakeup.clear()
+            now = time.monotonic()
+            # Runs whose waiter gave up need no more polling
+            for run_id in [run_id for run_id, run in self._runs.items() if run.future.done()]:
+                del self._runs[run_id]
+            due = [run for run in self._runs.values() if run.next_poll <= now]
+            if due:
+                await asyncio.gather(*(self._poll(run) for run in due))
+                continue
+            if not self._runs:
+                break
+            delay = min(run.next_poll for run in self._runs.values()) - now
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(0.0, delay))
+            except asyncio.TimeoutError:
+                pass
+
+    async def delete_thread(self, thread_id: str) -> None:
+        """Delete a thread, ignoring errors"""
+        try:
+            await self.openai_client.call(
+                lambda c: c.beta.threads.delete(thread_id),
+                call_site=self.call_site, operation="threads.delete"
+            )
+        except Exception as e:
+            logger.warning(f"Error deleting thread {thread_id}: {e}")
+
+    async def run_prompt(self, assistant_id: str, prompt: str,
+                         deadline: Optional[float] = None) -> Optional[str]:
+        """
+        Run the assistant on a one-off prompt in a fresh thread
+
+        Args:
+            assistant_id: OpenAI Assistant ID
+            prompt: User message
+            deadline: Seconds the run may take (defaults to the manager deadline)
+
+        Returns:
+            Text of the assistant's answer or None if the run did not complete
+        """
+        # Thread, message and run in a single request
+        run = await self.openai_client.call(lambda c: c.beta.threads.create_and_run(
+            assistant_id=assistant_id,
+            thread={"messages": [{"role": "user", "content": prompt}]}
+        ), call_site=self.call_site, operation="threads.create_and_run")
+        try:
+            if run.status in RUN_PENDING_STATUSES:
+                run = await self.submit(run.thread_id, run.id, deadline)
+            if run.status != "completed":
+                logger.warning(f"OpenAI run {run.id} finished with status: {run.status}")
+                return None
+
+            messages = await self.openai_client.call(lambda c: c.beta.threads.messages.list(
+                thread_id=run.thread_id,
+                run_id=run.id
+            ), call_site=self.call_site, operation="threads.messages.list")
+            for message in messages.data:
+                if message.role == "assistant":
+                    for content_item in message.content:
+                        if hasattr(content_item, "text"):
+                            return content_item.text.value
+            return None
+        finally:
+            await self.delete_thread(run.thread_id)
+
+    async def close(self) -> None:
+        """Cancel all tracked runs and stop polling"""
+        runs = list(self._runs.values())
+        self._runs.clear()
+        if self.task and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        for run in runs:
+            await self._cancel(run)
+            if not run.future.done():
+                run.future.cancel()
@@ -0,0 +1,231 @@
+"""
+Payment-check benchmark for Dostup Bot
+
+Drives the `PaymentCheckStates` flow (/check_payment -> email -> name) through
+the real aiogram dispatcher against the fake Stripe server, and reports
+p50/p95/p99 latency and Stripe API call counts per history size.
+Telegram API calls are answered locally, nothing leaves the machine.
+
+Usage:
+    python benchmarks/bench_payment_check.py --sizes 1000 10000 100000 \
+        --checks 200 --concurrency 20 --latency 0.02
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# bot.py refuses to start without a token; none of these ever reach a real API
+os.environ.setdefault("BOT_TOKEN", "123456:BENCHMARK")
+os.environ.setdefault("STRIPE_API_KEY", "sk_test_benchmark")
+os.environ.pop("OPENAI_API_KEY", None)
+os.environ.pop("STRIPE_WEBHOOK_SECRET", None)
+
+from fake_stripe import FakeStripeData, FakeStripeServer  # noqa: E402
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """p50/p95/p99 in milliseconds"""
+    if not samples:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))] * 1000
+
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)}
+
+
+def report(title: str, samples: List[float], calls: Dict[str, int]) -> None:
+    p = percentiles(samples)
+    total_calls = sum(calls.values())
+    per_check = total_calls / len(samples) if samples else 0.0
+    print(
+        f"  {title:<28} n={len(samples):<5} p50={p['p50']:8.1f}ms  p95={p['p95']:8.1f}ms  "
+        f"p99={p['p99']:8.1f}ms  api_calls={total_calls} ({per_check:.2f}/op) {dict(calls)}"
+    )
+
+
+class TelegramStub:
+    """Answers Bot API requests locally and counts them"""
+
+    def __init__(self):
+        self.requests = 0
+        self._message_id = 0
+
+    async def request(self, method, data=None, files=None, **kwargs):
+        self.requests += 1
+        if method == "sendMessage":
+            self._message_id += 1
+            return {
+                "message_id": self._message_id, "date": int(time.time()),
+                "chat": {"id": int(data["chat_id"]), "type": "private"},
+                "text": data.get("text", ""),
+            }
+        if method == "getMe":
+            return {"id": 123456, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        return True
+
+
+class PaymentCheckBenchmark:
+    """Runs the payment-check flow for one history size"""
+
+    def __init__(self, bot_module, server: FakeStripeServer, data: FakeStripeData,
+                 workdir: str, seed: int = 1):
+        self.bot_module = bot_module
+        self.server = server
+        self.data = data
+        self.workdir = workdir
+        self.rng = random.Random(seed)
+        self._update_id = 0
+
+    def install(self) -> None:
+        """Give the bot fresh, isolated stores for this run"""
+        from customer_cache import CustomerCache
+        from payment_index import PaymentIndex
+        from stripe_client import AsyncStripeClient
+
+        m = self.bot_module
+        db_path = os.path.join(self.workdir, f"payment_index_{len(self.data.customers)}.db")
+        m.payment_index = PaymentIndex(
+            db_path=db_path,
+            stripe_client=AsyncStripeClient(customer_cache=CustomerCache())
+        )
+        m.reminder_system = m.ReminderSystem(
+            bot=m.bot, db_path=os.path.join(self.workdir, "reminder_data.db")
+        )
+
+    def _update(self, user_id: int, text: str):
+        from aiogram import types
+
+        self._update_id += 1
+        return types.Update(**{
+            "update_id": self._update_id,
+            "message": {
+                "message_id": self._update_id, "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": "Bench"},
+                "text": text,
+            },
+        })
+
+    def _check_inputs(self, miss_ratio: float):
+        if self.rng.random() < miss_ratio:
+            n = self.rng.randint(10 ** 6, 10 ** 7)
+            return f"nobody{n}@example.org", f"Nobody {n}"
+        obj = self.data.sample(self.rng, self.rng.choice(list(self.data.lists)))
+        if "customer_details" in obj:
+            return obj["customer_details"]["email"], obj["customer_details"]["name"]
+        customer = self.data.customers.get(obj["customer"]) if obj["customer"] else None
+        source = customer or obj["metadata"]
+        return source["email"], source["name"]
+
+    async def _process(self, user_id: int, text: str) -> None:
+        # Each update gets its own task (and context), as under polling -
+        # aiogram caches the FSM state in a context variable per update
+        await asyncio.create_task(self.bot_module.dp.process_update(self._update(user_id, text)))
+
+    async def run_flow(self, user_id: int, email: str, name: str) -> float:
+        """Walk the FSM; returns the latency of the final (checking) step"""
+        await self._process(user_id, "/check_payment")
+        await self._process(user_id, email)
+        start = time.perf_counter()
+        await self._process(user_id, name)
+        return time.perf_counter() - start
+
+    async def run(self, checks: int, concurrency: int, miss_ratio: float) -> None:
+        m = self.bot_module
+
+        # Cold start: the first check backfills the whole history into the index
+        self.server.reset_calls()
+        email, name = self._check_inputs(0.0)
+        latency = await self.run_flow(1, email, name)
+        report("cold check (backfill)", [latency], self.server.calls)
+
+        # Warm checks through the full handler flow, `concurrency` users at once
+        self.server.reset_calls()
+        semaphore = asyncio.Semaphore(concurrency)
+        samples = []
+
+        async def one(i: int):
+            email, name = self._check_inputs(miss_ratio)
+            async with semaphore:
+                samples.append(await self.run_flow(1000 + i, email, name))
+
+        await asyncio.gather(*(one(i) for i in range(checks)))
+        report(f"handler flow (c={concurrency})", samples, self.server.calls)
+
+        # Individual helpers
+        for title, func, pick in [
+            ("check_stripe_payment_by_email", m.check_stripe_payment_by_email, 0),
+            ("check_stripe_payment_by_name", m.check_stripe_payment_by_name, 1),
+        ]:
+            self.server.reset_calls()
+            samples = []
+            for _ in range(checks):
+                value = self._check_inputs(miss_ratio)[pick]
+                start = time.perf_counter()
+                await func(value)
+                samples.append(time.perf_counter() - start)
+            report(title, samples, self.server.calls)
+
+        self.server.reset_calls()
+        samples = []
+        for i in range(checks):
+            start = time.perf_counter()
+            await m.send_course_access(5000 + i)
+            samples.append(time.perf_counter() - start)
+        report("send_course_access", samples, self.server.calls)
+
+
+async def main(args) -> None:
+    import stripe
+    from aiogram import Bot, Dispatcher
+
+    import bot as bot_module
+
+    telegram = TelegramStub()
+    bot_module.bot.request = telegram.request
+    Bot.set_current(bot_module.bot)
+    Dispatcher.set_current(bot_module.dp)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            data = FakeStripeData(size, seed=args.seed)
+            server = FakeStripeServer(data, latency=args.latency)
+            stripe.api_base = await server.start()
+            print(
+                f"\n== {size} payments ({len(data.customers)} customers, "
+                f"{len(data.lists['checkout/sessions'])} sessions), latency {args.latency * 1000:.0f}ms =="
+            )
+            try:
+                benchmark = PaymentCheckBenchmark(bot_module, server, data, workdir, seed=args.seed)
+                benchmark.install()
+                await benchmark.run(args.checks, args.concurrency, args.miss_ratio)
+            finally:
+                await server.stop()
+
+    print(f"\nTelegram API requests answered locally: {telegram.requests}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the payment-check flow")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--checks", type=int, default=200, help="Checks per scenario")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.02, help="Fake Stripe latency in seconds")
+    parser.add_argument("--miss-ratio", type=float, default=0.2, help="Share of checks without a payment")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    import logging
+    logging.disable(logging.CRITICAL)
+    asyncio.run(main(args))
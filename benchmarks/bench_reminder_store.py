@@ -0,0 +1,309 @@
+"""
+Reminder-store benchmark for Dostup Bot
+
+Compares per-operation latency of the reminder database access before and
+after the shared WAL connection (sqlite_store.py):
+
+  before  a fresh sqlite3.connect per operation, run on the event loop
+          (the previous ReminderSystem code path, reproduced here)
+  after   ReminderSystem methods going through the SqliteStore thread
+
+For each mode it reports p50/p95/p99 per operation and the event-loop stalls
+seen by a 1ms ticker while the operations run. With --concurrency above 1
+the store latencies include waiting for the store thread; the old code made
+the whole event loop wait instead, which shows up in the stall figures.
+
+A second run replays a spike of lesson views (mostly new users) and reports
+the handler-side latency and the views per second until every view is in
+the database: one transaction per view before, write-behind batches after.
+
+Usage:
+    python benchmarks/bench_reminder_store.py --users 10000 --ops 2000 --concurrency 20 \
+        --views 20000
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import closing
+from typing import Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from reminder_stats import create_stats_tables  # noqa: E402
+from reminder_system import ReminderSystem  # noqa: E402
+
+logger = logging.getLogger("reminder_system")
+
+OPERATIONS = ("view", "purchase", "due", "sent", "stats")
+DAY = 24 * 60 * 60
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """p50/p95/p99 in milliseconds"""
+    if not samples:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+    ordered = sorted(samples)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))] * 1000
+
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99)}
+
+
+async def seed(db_path: str, users: int) -> None:
+    """Create the schema through ReminderSystem and fill it with users and history"""
+    system = ReminderSystem(bot=None, db_path=db_path)
+    await system.store.close()
+
+    now = int(time.time())
+    rng = random.Random(users)
+    with closing(sqlite3.connect(db_path)) as conn:
+        rows = []
+        for user_id in range(1, users + 1):
+            view_time = now - rng.randint(0, 14 * DAY)
+            last_reminder_index = rng.choice((-1, -1, 0, 1, 2))
+            rows.append((
+                user_id, f"user{user_id}", "Имя", None, view_time, int(rng.random() < 0.05),
+                last_reminder_index, system._next_reminder_at(view_time, last_reminder_index)
+            ))
+        conn.executemany(
+            """INSERT INTO lesson_views (user_id, username, first_name, last_name, view_time,
+                                         has_purchased, last_reminder_index, next_reminder_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+            rows
+        )
+        conn.executemany(
+            "INSERT INTO reminder_history (user_id, reminder_index, sent_time) VALUES (?, ?, ?)",
+            [(row[0], index, now) for row in rows for index in range(row[6] + 1)]
+        )
+        # Rebuild the materialized counters from the seeded rows
+        conn.execute("DELETE FROM reminder_stats")
+        create_stats_tables(conn)
+        conn.commit()
+
+
+class LegacyReminders:
+    """The previous access pattern: connect per call, blocking the event loop"""
+
+    def __init__(self, db_path: str, system: ReminderSystem):
+        self.db_path = db_path
+        self.system = system  # only for the reminder interval arithmetic
+
+    def _connect(self) -> sqlite3.Connection:
+        db_dir = os.path.dirname(os.path.abspath(self.db_path))
+        if not os.path.exists(db_dir):
+            os.makedirs(db_dir, exist_ok=True)
+        return sqlite3.connect(self.db_path)
+
+    async def view(self, user_id: int) -> None:
+        current_time = int(time.time())
+        with self._connect() as conn:
+            existing = conn.execute(
+                "SELECT last_reminder_index FROM lesson_views WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            next_reminder_at = self.system._next_reminder_at(current_time, existing[0] if existing else -1)
+            if existing:
+                conn.execute(
+                    """UPDATE lesson_views
+                       SET view_time = ?, username = ?, first_name = ?, last_name = ?,
+                           next_reminder_at = ?, is_blocked = 0
+                       WHERE user_id = ?""",
+                    (current_time, "user", "Имя", None, next_reminder_at, user_id)
+                )
+            else:
+                conn.execute(
+                    """INSERT INTO lesson_views
+                       (user_id, username, first_name, last_name, view_time, next_reminder_at)
+                       VALUES (?, ?, ?, ?, ?, ?)""",
+                    (user_id, "user", "Имя", None, current_time, next_reminder_at)
+                )
+            conn.commit()
+
+    async def drain(self) -> None:
+        pass
+
+    async def purchase(self, user_id: int) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE lesson_views SET has_purchased = 1, next_reminder_at = NULL WHERE user_id = ?",
+                (user_id,)
+            )
+            conn.commit()
+
+    async def due(self, user_id: int) -> None:
+        with self._connect() as conn:
+            rows = conn.execute(
+                """SELECT user_id, last_reminder_index, view_time FROM lesson_views
+                   WHERE has_purchased = 0 AND next_reminder_at <= ? ORDER BY next_reminder_at""",
+                (int(time.time()),)
+            ).fetchall()
+        # Same per-row work as ReminderSystem._get_users_needing_reminders
+        users = []
+        for user_id, last_reminder_index, view_time in rows:
+            if last_reminder_index + 1 < len(self.system.reminder_intervals):
+                users.append((user_id, last_reminder_index + 1, view_time))
+                logger.debug(f"User {user_id} needs reminder {last_reminder_index + 1}")
+
+    async def sent(self, user_id: int) -> None:
+        with self._connect() as conn:
+            conn.execute("SELECT first_name, view_time FROM lesson_views WHERE user_id = ?", (user_id,))
+            self.system._record_reminder_sent(conn, user_id, 0, False, int(time.time()))
+            conn.commit()
+
+    async def stats(self, user_id: int) -> None:
+        # Four COUNT(*) scans, as before the materialized counters
+        with self._connect() as conn:
+            for sql in ("SELECT COUNT(*) FROM lesson_views",
+                        "SELECT COUNT(*) FROM lesson_views WHERE last_reminder_index >= 0",
+                        "SELECT COUNT(*) FROM reminder_history",
+                        "SELECT COUNT(*) FROM lesson_views WHERE has_purchased = 1"):
+                conn.execute(sql).fetchone()
+
+
+class StoreReminders:
+    """The same operations through ReminderSystem and its SqliteStore"""
+
+    def __init__(self, system: ReminderSystem):
+        self.system = system
+
+    async def view(self, user_id: int) -> None:
+        await self.system.track_lesson_view(user_id, "user", "Имя")
+
+    async def purchase(self, user_id: int) -> None:
+        await self.system.mark_user_purchased(user_id)
+
+    async def due(self, user_id: int) -> None:
+        # Claim every due user (as the old query read them all), then give the claims back
+        await self.system._claim_users_needing_reminders(limit=1 << 30)
+        await self.system._release_claims()
+
+    async def sent(self, user_id: int) -> None:
+        await self.system.store.fetchone(
+            "SELECT first_name, view_time FROM lesson_views WHERE user_id = ?", (user_id,)
+        )
+        await self.system.store.run(
+            self.system._record_reminder_sent, user_id, 0, False, int(time.time())
+        )
+
+    async def stats(self, user_id: int) -> None:
+        await self.system.get_stats()
+
+    async def drain(self) -> None:
+        """Wait until every buffered view is written"""
+        await asyncio.gather(*self.system._flush_tasks)
+        await self.system.flush_views()
+
+
+async def measure(impl, users: int, ops: int, concurrency: int) -> None:
+    samples: Dict[str, List[float]] = defaultdict(list)
+    rng = random.Random(ops)
+    plan = [(rng.choice(OPERATIONS), rng.randint(1, users)) for _ in range(ops)]
+    queue: asyncio.Queue = asyncio.Queue()
+    for job in plan:
+        queue.put_nowait(job)
+
+    stalls: List[float] = []
+    ticking = True
+
+    async def ticker() -> None:
+        interval = 0.001
+        while ticking:
+            before = time.perf_counter()
+            await asyncio.sleep(interval)
+            stalls.append(time.perf_counter() - before - interval)
+
+    async def worker() -> None:
+        while not queue.empty():
+            name, user_id = queue.get_nowait()
+            operation: Callable = getattr(impl, name)
+            start_time = time.perf_counter()
+            await operation(user_id)
+            samples[name].append(time.perf_counter() - start_time)
+            # Handlers yield between operations; the ticker sees single-operation stalls
+            await asyncio.sleep(0)
+
+    tick_task = asyncio.create_task(ticker())
+    start_time = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start_time
+    ticking = False
+    await tick_task
+
+    for name in OPERATIONS:
+        p = percentiles(samples[name])
+        print(
+            f"  {name:<10} n={len(samples[name]):<5} p50={p['p50']:7.2f}ms  "
+            f"p95={p['p95']:7.2f}ms  p99={p['p99']:7.2f}ms"
+        )
+    stall = percentiles(stalls)
+    print(
+        f"  total {elapsed:.2f}s ({ops / elapsed:.0f} ops/s), event-loop stalls "
+        f"p99={stall['p99']:.1f}ms max={max(stalls) * 1000:.1f}ms"
+    )
+
+
+async def measure_view_burst(impl, views: int, users: int) -> None:
+    """Replay a spike of lesson views; time until all of them are in the database"""
+    rng = random.Random(views)
+    user_ids = [rng.randint(1, users * 10) for _ in range(views)]
+    samples: List[float] = []
+
+    start_time = time.perf_counter()
+    for user_id in user_ids:
+        view_start = time.perf_counter()
+        await impl.view(user_id)
+        samples.append(time.perf_counter() - view_start)
+        await asyncio.sleep(0)
+    handled = time.perf_counter() - start_time
+    await impl.drain()
+    elapsed = time.perf_counter() - start_time
+
+    p = percentiles(samples)
+    print(
+        f"  handler p50={p['p50']:.3f}ms p99={p['p99']:.3f}ms, handled in {handled:.2f}s, "
+        f"durable after {elapsed:.2f}s ({views / elapsed:.0f} views/s)"
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, "legacy.db")
+        store_path = os.path.join(tmp, "store.db")
+        await seed(legacy_path, args.users)
+        await seed(store_path, args.users)
+        # Databases created by the old code use the default rollback journal
+        with sqlite3.connect(legacy_path) as conn:
+            conn.execute("PRAGMA journal_mode = DELETE")
+
+        system = ReminderSystem(bot=None, db_path=store_path)
+        print(f"Reminder store benchmark: {args.users} users, {args.ops} ops, concurrency {args.concurrency}")
+        print("before (connect per operation, on the event loop):")
+        await measure(LegacyReminders(legacy_path, system), args.users, args.ops, args.concurrency)
+
+        print("after (SqliteStore, WAL, executor thread):")
+        await measure(StoreReminders(system), args.users, args.ops, args.concurrency)
+        await StoreReminders(system).drain()
+
+        print(f"Lesson-view spike: {args.views} views")
+        print("before (one transaction per view):")
+        await measure_view_burst(LegacyReminders(legacy_path, system), args.views, args.users)
+        print("after (write-behind batches):")
+        await measure_view_burst(StoreReminders(system), args.views, args.users)
+        await system.store.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--ops", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--views", type=int, default=20000)
+    asyncio.run(main(parser.parse_args()))
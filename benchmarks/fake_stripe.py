@@ -0,0 +1,206 @@
+"""
+Fake Stripe API server for offline benchmarks
+
+Serves the small subset of the Stripe REST API used by the bot
+(PaymentIntent list, Checkout Session list, Customer retrieve) from
+synthetic in-memory data, with configurable per-request latency and
+per-endpoint call counters.
+
+Standalone usage:
+    python benchmarks/fake_stripe.py --payments 10000 --latency 0.05 --port 12111
+Then point the bot at it with STRIPE_API_BASE=http://127.0.0.1:12111
+"""
+import argparse
+import asyncio
+import bisect
+import logging
+import random
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from aiohttp import web
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+FIRST_NAMES = ["Ivan", "Olga", "Anna", "Sergei", "Dmitry", "Maria", "Elena", "Alexei",
+               "Natalia", "Andrei", "Юлия", "Александр", "Tetiana", "Mykola", "Katharina", "Jonas"]
+LAST_NAMES = ["Petrov", "Ivanova", "Smirnov", "Kuznetsova", "Popov", "Sokolova", "Müller",
+              "Schmidt", "Шевченко", "Коваленко", "Bondarenko", "Fischer", "Weber", "Волков"]
+
+
+class FakeStripeData:
+    """Synthetic PaymentIntents, Customers and Checkout Sessions"""
+
+    def __init__(self, payments: int, seed: int = 42, span_days: int = 365,
+                 customer_ratio: float = 0.7, session_ratio: float = 0.5):
+        """
+        Args:
+            payments: Number of PaymentIntents to generate
+            seed: Random seed
+            span_days: Payments are spread over this many days back from now
+            customer_ratio: Share of PaymentIntents attached to a Customer
+            session_ratio: Share of PaymentIntents created through a Checkout Session
+        """
+        rng = random.Random(seed)
+        now = int(time.time())
+        self.customers: Dict[str, Dict[str, Any]] = {}
+        payment_intents = []
+        sessions = []
+
+        for i in range(payments):
+            created = now - rng.randint(0, span_days * 24 * 60 * 60)
+            name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i}"
+            email = f"user{i}@example.com"
+            status = "succeeded" if rng.random() < 0.9 else "requires_payment_method"
+
+            customer_id = None
+            if rng.random() < customer_ratio:
+                customer_id = f"cus_{i:08d}"
+                self.customers[customer_id] = {
+                    "id": customer_id, "object": "customer", "email": email, "name": name,
+                    "created": created,
+                }
+
+            payment_intents.append({
+                "id": f"pi_{i:08d}", "object": "payment_intent", "status": status,
+                "amount": 14900, "currency": "eur", "created": created,
+                "customer": customer_id, "receipt_email": None,
+                "metadata": {} if customer_id else {"email": email, "name": name},
+            })
+
+            if rng.random() < session_ratio:
+                sessions.append({
+                    "id": f"cs_{i:08d}", "object": "checkout.session",
+                    "status": "complete" if status == "succeeded" else "expired",
+                    "payment_status": "paid" if status == "succeeded" else "unpaid",
+                    "amount_total": 14900, "currency": "eur", "created": created,
+                    "customer": customer_id, "client_reference_id": None,
+                    "customer_details": {"email": email, "name": name},
+                    "metadata": {},
+                })
+
+        # Stripe lists newest first
+        self.lists = {
+            "payment_intents": sorted(payment_intents, key=lambda o: -o["created"]),
+            "checkout/sessions": sorted(sessions, key=lambda o: -o["created"]),
+        }
+        self._neg_created = {
+            key: [-o["created"] for o in objects] for key, objects in self.lists.items()
+        }
+        self._positions = {
+            key: {o["id"]: i for i, o in enumerate(objects)} for key, objects in self.lists.items()
+        }
+
+    def sample(self, rng: random.Random, kind: str = "payment_intents") -> Dict[str, Any]:
+        """Pick a random succeeded object (used to build check requests)"""
+        while True:
+            obj = rng.choice(self.lists[kind])
+            if obj.get("status") == "succeeded" or obj.get("payment_status") == "paid":
+                return obj
+
+    def page(self, key: str, limit: int, created_gte: Optional[int],
+             starting_after: Optional[str]) -> Dict[str, Any]:
+        objects = self.lists[key]
+        end = len(objects)
+        if created_gte is not None:
+            # Objects with created >= gte form a prefix of the newest-first list
+            end = bisect.bisect_right(self._neg_created[key], -created_gte)
+        start = 0
+        if starting_after:
+            start = self._positions[key].get(starting_after, -1) + 1
+        data = objects[start:min(end, start + limit)]
+        return {
+            "object": "list", "url": f"/v1/{key}",
+            "data": data, "has_more": start + limit < end,
+        }
+
+
+class FakeStripeServer:
+    """aiohttp application that serves FakeStripeData"""
+
+    def __init__(self, data: FakeStripeData, latency: float = 0.0):
+        self.data = data
+        self.latency = latency
+        self.calls = Counter()
+        self.runner = None
+        self.port = None
+
+    async def _delay(self) -> None:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def _list(self, request, key: str):
+        self.calls[key] += 1
+        await self._delay()
+        query = request.query
+        created_gte = query.get("created[gte]")
+        page = self.data.page(
+            key,
+            limit=min(int(query.get("limit", 10)), 100),
+            created_gte=int(created_gte) if created_gte is not None else None,
+            starting_after=query.get("starting_after"),
+        )
+        return web.json_response(page)
+
+    async def list_payment_intents(self, request):
+        return await self._list(request, "payment_intents")
+
+    async def list_checkout_sessions(self, request):
+        return await self._list(request, "checkout/sessions")
+
+    async def retrieve_customer(self, request):
+        self.calls["customers"] += 1
+        await self._delay()
+        customer = self.data.customers.get(request.match_info["customer_id"])
+        if customer is None:
+            return web.json_response(
+                {"error": {"type": "invalid_request_error", "message": "No such customer"}}, status=404
+            )
+        return web.json_response(customer)
+
+    async def stats(self, request):
+        return web.json_response(dict(self.calls))
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/v1/payment_intents", self.list_payment_intents)
+        app.router.add_get("/v1/checkout/sessions", self.list_checkout_sessions)
+        app.router.add_get("/v1/customers/{customer_id}", self.retrieve_customer)
+        app.router.add_get("/_stats", self.stats)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Start serving; returns the base URL"""
+        self.runner = web.AppRunner(self.make_app())
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{self.port}"
+
+    async def stop(self) -> None:
+        if self.runner:
+            await self.runner.cleanup()
+
+    def reset_calls(self) -> None:
+        self.calls.clear()
+
+
+async def _serve(args) -> None:
+    data = FakeStripeData(args.payments, seed=args.seed)
+    server = FakeStripeServer(data, latency=args.latency)
+    url = await server.start(port=args.port)
+    print(f"Fake Stripe with {args.payments} payments listening on {url}")
+    while True:
+        await asyncio.sleep(3600)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Stripe API server")
+    parser.add_argument("--payments", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request")
+    parser.add_argument("--port", type=int, default=12111)
+    parser.add_argument("--seed", type=int, default=42)
+    asyncio.run(_serve(parser.parse_args()))
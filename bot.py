@@ -11,9 +11,18 @@ from aiogram.dispatcher import FSMContext
 from aiogram.dispatcher.filters.state import State, StatesGroup
 from aiogram.types import (InlineKeyboardButton, InlineKeyboardMarkup,
                            KeyboardButton, ReplyKeyboardMarkup)
+from aiogram.utils.exceptions import MessageNotModified, RetryAfter, TelegramAPIError
 from dotenv import load_dotenv
 import stripe
 
+from answer_cache import AnswerCache
+from customer_cache import CustomerCache
+from faq_index import FaqIndex
+from openai_client import AsyncOpenAIClient, UserBusyError
+from payment_index import PaymentIndex
+from stripe_client import AsyncStripeClient, configure_http_client
+from stripe_webhook import STRIPE_WEBHOOK_SECRET, WebhookWorker, get_webhook_queue
+
 # Импорт системы напоминаний
 # Попытка импорта ReminderSystem с разных путей
 ReminderSystem = None
@@ -27,7 +36,7 @@ def create_placeholder_reminder_system():
             self.bot = bot
             self.is_running = False
 
-        async def start(self):
+        async def start(self, send_reminders=True):
             print("Placeholder ReminderSystem.start() called")
             self.is_running = True
 
@@ -38,13 +47,13 @@ def create_placeholder_reminder_system():
         async def track_free_lesson_view(self, user_id):
             print(f"Placeholder track_free_lesson_view called for user {user_id}")
 
-        async def track_lesson_view(self, user_id, username=None, first_name=None, last_name=None):
+        async def track_lesson_view(self, user_id, username=None, first_name=None, last_name=None, language_code=None):
             print(f"Placeholder track_lesson_view called for user {user_id}")
             
         async def mark_user_purchased(self, user_id):
             print(f"Placeholder mark_user_purchased called for user {user_id}")
             
-        def get_stats(self):
+        async def get_stats(self):
             return {"error": "ReminderSystem not available"}
     
     print("Created placeholder ReminderSystem class to prevent crashes")
@@ -116,6 +125,13 @@ OPENAI_ASSISTANT_ID = os.getenv('OPENAI_ASSISTANT_ID')
 STRIPE_PAYMENT_URL  = os.getenv('STRIPE_PAYMENT_URL', 'https://buy.stripe.com/9B6fZg4TTcbwc6V7gT3Nm00')
 # ID администратора для команд управления
 ADMIN_USER_ID = int(os.getenv('ADMIN_USER_ID', '403758011'))
+# Потоковые ответы ассистента: текст появляется по мере генерации
+ASSISTANT_STREAMING = os.getenv('ASSISTANT_STREAMING', '1') != '0'
+# Минимальный интервал между правками сообщения при стриминге (лимиты Telegram на edit)
+STREAM_EDIT_INTERVAL = float(os.getenv('STREAM_EDIT_INTERVAL', '1.0'))
+TELEGRAM_MESSAGE_LIMIT = 4096
+# Отправлять напоминания из процесса бота (0 — их отправляет отдельный reminder_worker.py)
+REMINDERS_IN_BOT = os.getenv('REMINDERS_IN_BOT', '1') != '0'
 
 logger.info(f"Конфигурация загружена: BOT_TOKEN={'Настроен' if BOT_TOKEN else 'Не настроен'}, COURSE_CHANNEL_ID={COURSE_CHANNEL_ID}")
 
@@ -126,8 +142,11 @@ if not BOT_TOKEN or BOT_TOKEN == 'YOUR_REAL_BOT_TOKEN_HERE':
 
 # [OpenAI]
 openai_client_ready = False
+openai_pool = None
 if OPENAI_API_KEY and OPENAI_API_KEY != 'your_openai_api_key_here':
     openai.api_key = OPENAI_API_KEY
+    # Общий асинхронный клиент: пул соединений, лимиты параллельности, таймауты и ретраи
+    openai_pool = AsyncOpenAIClient(api_key=OPENAI_API_KEY)
     openai_client_ready = True
     logger.info("OpenAI API ініціалізовано")
 else:
@@ -140,6 +159,11 @@ stripe_client_ready = False
 STRIPE_API_KEY = os.getenv('STRIPE_API_KEY')
 if STRIPE_API_KEY and STRIPE_API_KEY != 'your_stripe_api_key_here':
     stripe.api_key = STRIPE_API_KEY
+    # Альтернативный адрес API (например, локальный fake-сервер из benchmarks/)
+    if os.getenv('STRIPE_API_BASE'):
+        stripe.api_base = os.getenv('STRIPE_API_BASE')
+    # HTTP-клиент с keep-alive и таймаутом настраивается один раз для всего процесса
+    configure_http_client()
     stripe_client_ready = True
     logger.info("Stripe API успешно инициализирован")
 else:
@@ -165,7 +189,7 @@ if openai_client_ready:
     reminder_system = ReminderSystem(
         bot=bot, 
         db_path=reminder_db_path,
-        openai_client=openai,
+        openai_client=openai_pool,
         openai_assistant_id=OPENAI_ASSISTANT_ID
     )
     logger.info(f"Система напоминаний инициализирована с поддержкой OpenAI (БД: {reminder_db_path})")
@@ -176,6 +200,41 @@ else:
     )
     logger.info(f"Система напоминаний инициализирована без поддержки OpenAI (БД: {reminder_db_path})")
 
+# [Payment Index]
+# Локальный индекс успешных платежей Stripe (рядом с базой напоминаний)
+payment_index_db_path = os.path.join(os.path.dirname(reminder_db_path), "payment_index.db")
+payment_index = None
+if stripe_client_ready:
+    # Кэш клиентов Stripe (память + SQLite), чтобы не запрашивать одних и тех же клиентов повторно
+    customer_cache = CustomerCache(db_path=payment_index_db_path)
+    payment_index = PaymentIndex(
+        db_path=payment_index_db_path,
+        stripe_client=AsyncStripeClient(customer_cache=customer_cache)
+    )
+    logger.info(f"Индекс платежей инициализирован (БД: {payment_index_db_path})")
+
+# [Answer Cache]
+# Кэш ответов ассистента: повторные и почти одинаковые вопросы отвечаются без запроса к OpenAI
+answer_cache_db_path = os.path.join(os.path.dirname(reminder_db_path), "answer_cache.db")
+answer_cache = AnswerCache(db_path=answer_cache_db_path)
+logger.info(f"Кэш ответов инициализирован (БД: {answer_cache_db_path})")
+
+# [Stripe Webhooks]
+# Воркер выдаёт доступ по событиям Stripe, принятым веб-сервером (cloud_run_adapter)
+webhook_worker = None
+if STRIPE_WEBHOOK_SECRET:
+    webhook_worker = WebhookWorker(
+        queue=get_webhook_queue(),
+        grant_access=lambda user_id: send_course_access(user_id),
+        payment_index=payment_index
+    )
+    logger.info("Обработка Stripe webhook включена")
+
+def get_payment_url(user_id: int) -> str:
+    """Ссылка на оплату с Telegram ID пользователя (client_reference_id для webhook)"""
+    separator = "&" if "?" in STRIPE_PAYMENT_URL else "?"
+    return f"{STRIPE_PAYMENT_URL}{separator}client_reference_id={user_id}"
+
 # [FSM]
 class QuestionStates(StatesGroup):
     waiting_for_question = State()
@@ -321,6 +380,17 @@ async def get_document(doc_name: str) -> str:
         end_time = time.time()
         logger.debug(f"Время получения документа {doc_name}: {end_time - start_time:.4f} сек")
 
+# [FAQ Index]
+# Локальный BM25-индекс по FAQ и юридическим документам: известные вопросы
+# отвечаются без OpenAI, остальные получают найденные фрагменты как контекст
+DOCUMENTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "documents")
+faq_index = FaqIndex.build(
+    faq_path=os.path.join(DOCUMENTS_DIR, "faq.txt"),
+    documents_dir=DOCUMENTS_DIR,
+    documents=LEGAL_DOCS,
+    variables={"COURSE_TITLE": COURSE_TITLE, "COURSE_PRICE_EUR": COURSE_PRICE_EUR}
+)
+
 # Клавиатуры для юридических документов
 def get_agreement_keyboard(doc_type: str) -> InlineKeyboardMarkup:
     """Returns keyboard for legal document agreement"""
@@ -334,163 +404,176 @@ def get_agreement_keyboard(doc_type: str) -> InlineKeyboardMarkup:
 
 # [OpenAI helper]
 # Для работы с OpenAI Assistant API требуется openai>=1.3.0
-async def ask_assistant(question: str) -> str:
+def assistant_request_params(question: str, context: list = None) -> dict:
+    system_prompt = "Вы — помощник, который отвечает на вопросы о курсе 'Успешный YouTube-бизнес с нуля'. Отвечайте кратко и точно."
+    if context:
+        # Фрагменты из FAQ и документов, найденные локальным индексом
+        system_prompt += "\n\nСправочная информация (используйте, если она относится к вопросу):\n" + "\n\n".join(
+            passage.answer for passage in context
+        )
+    # Правильно разделяем роли: system для инструкций, user для вопроса
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": question}
+    ]
+    return {
+        "model": "gpt-3.5-turbo",  # Используем модель gpt-3.5-turbo
+        "messages": messages,
+        "temperature": 0.7,
+        "max_tokens": 500
+    }
+
+async def local_answer(question: str):
+    """
+    Ищет ответ без обращения к OpenAI: сначала FAQ, затем кэш ответов.
+    Возвращает (ответ или None, фрагменты контекста для промпта).
+    """
+    faq_answer, context = faq_index.lookup(question)
+    if faq_answer is not None:
+        logger.info(f"Ответ из FAQ: {question[:50]}")
+        return faq_answer, []
+    cached = await answer_cache.get(question)
+    if cached is not None:
+        logger.info(f"Ответ из кэша (hit rate {answer_cache.stats()['hit_rate']:.1f}%): {question[:50]}")
+        return cached, []
+    return None, context
+
+async def ask_assistant(question: str, user_id: int = None) -> str:
     if not openai_client_ready:
         return "❌ OpenAI Assistant недоступен."
     try:
-        logger.info(f"Отправка вопроса в OpenAI: {question[:50]}...")
+        answer, context = await local_answer(question)
+        if answer is not None:
+            return answer
         
-        # Используем Chat Completions API с правильным разделением ролей
-        # Правильно разделяем роли: system для инструкций, user для вопроса
-        messages = [
-            {"role": "system", "content": "Вы — помощник, который отвечает на вопросы о курсе 'Успешный YouTube-бизнес с нуля'. Отвечайте кратко и точно."},
-            {"role": "user", "content": question}
-        ]
+        logger.info(f"Отправка вопроса в OpenAI: {question[:50]}...")
         
-        # Отправляем запрос используя новый формат API для версии >= 1.3.0
-        import time
+        # Асинхронный запрос: цикл событий не блокируется, пока GPT думает
         start_time = time.time()
-        response = openai.chat.completions.create(
-            model="gpt-3.5-turbo",  # Используем модель gpt-3.5-turbo
-            messages=messages,
-            temperature=0.7,
-            max_tokens=500
-        )
+        response = await openai_pool.chat_completion(user_id=user_id, call_site="question", **assistant_request_params(question, context))
         
-        # Получаем ответ (новый формат API)
         answer = response.choices[0].message.content
         logger.info(f"Получен ответ от OpenAI за {time.time() - start_time:.2f} сек.")
+        await answer_cache.put(question, answer)
         return answer
         
+    except UserBusyError:
+        return "⏳ Я ещё отвечаю на ваш предыдущий вопрос, подождите немного."
     except Exception as e:
         logger.error(f"OpenAI Assistant error: {e}")
         return "❌ Ошибка OpenAI Assistant, попробуйте позже."
+
+async def stream_assistant_reply(message: types.Message, question: str) -> None:
+    """
+    Отвечает на вопрос потоково: ответ постепенно появляется в сообщении «Думаю...».
+    Правки объединяются и отправляются не чаще раза в STREAM_EDIT_INTERVAL секунд.
+    Reply-клавиатуру нельзя прикрепить при редактировании, поэтому в конце
+    заглушка заменяется итоговым сообщением с main_menu.
+    """
+    user_id = message.from_user.id
+    local, context = await local_answer(question)
+    if local is not None:
+        await message.answer(f"💡 {local}", reply_markup=main_menu)
+        return
+    
+    placeholder = await message.answer("🤔 Думаю...")
+    answer = ""
+    reply = None
+    next_edit = 0.0
+    start_time = time.time()
+    try:
+        logger.info(f"Потоковый запрос к OpenAI: {question[:50]}...")
+        async for delta in openai_pool.stream_chat_completion(user_id=user_id, call_site="question", **assistant_request_params(question, context)):
+            if not answer:
+                logger.info(f"Первый токен от OpenAI через {time.time() - start_time:.2f} сек.")
+            answer += delta
+            now = time.monotonic()
+            if now < next_edit or not answer.strip():
+                continue
+            next_edit = now + STREAM_EDIT_INTERVAL
+            try:
+                await placeholder.edit_text(f"💡 {answer} ▌"[:TELEGRAM_MESSAGE_LIMIT])
+            except RetryAfter as e:
+                next_edit = time.monotonic() + e.timeout
+            except MessageNotModified:
+                pass
+            except TelegramAPIError as e:
+                logger.warning(f"Не удалось обновить сообщение при стриминге: {e}")
+        logger.info(f"Получен ответ от OpenAI за {time.time() - start_time:.2f} сек.")
+        if answer:
+            await answer_cache.put(question, answer)
+            reply = f"💡 {answer}"
+    except UserBusyError:
+        reply = "⏳ Я ещё отвечаю на ваш предыдущий вопрос, подождите немного."
     except Exception as e:
-        logger.error(f"OpenAI Assistant error: {e}")
-        return "❌ Ошибка OpenAI Assistant, попробуйте позже."
+        logger.error(f"OpenAI Assistant streaming error: {e}")
+        if answer:
+            reply = f"💡 {answer}\n\n❌ Ответ прерван, попробуйте спросить ещё раз."
+    if reply is None:
+        reply = "❌ Ошибка OpenAI Assistant, попробуйте позже."
+    
+    # Финальная отправка: заменяем заглушку полным ответом с главным меню
+    try:
+        await placeholder.delete()
+    except TelegramAPIError as e:
+        logger.warning(f"Не удалось удалить сообщение-заглушку: {e}")
+    await message.answer(reply, reply_markup=main_menu)
 
 # [Stripe helper]
-async def check_stripe_payment_by_email(email: str) -> bool:
-    """Проверяет наличие успешного платежа по email покупателя"""
-    if not stripe_client_ready:
-        return False
+async def find_stripe_payment(email: str = None, name: str = None):
+    """
+    Ищет успешный платеж по email и имени покупателя за один проход.
+    Сначала проверяется локальный индекс; Stripe опрашивается (один раз, инкрементально)
+    только если точного совпадения нет. Возвращает PaymentMatch (payment_id, criterion) или None.
+    Совпадение "name_fuzzy" (только похожее имя) не даёт доступа — его проверяет администратор.
+    """
+    if not stripe_client_ready or not payment_index:
+        return None
     
     try:
-        logger.info(f"Проверка платежа по email: {email}")
-        # Ищем платежи за последние 30 дней (максимум 100 записей)
-        thirty_days_ago = int(time.time() - 30 * 24 * 60 * 60)
-        
-        # Проверяем платежи через Payment Intents
-        payment_intents = stripe.PaymentIntent.list(
-            limit=100,
-            created={"gte": thirty_days_ago}
-        )
-        
-        # Проверяем платежи
-        for payment in payment_intents.data:
-            if payment.status == 'succeeded':
-                # Получаем данные о клиенте
-                if hasattr(payment, 'customer') and payment.customer:
-                    try:
-                        customer = stripe.Customer.retrieve(payment.customer)
-                        if customer.email and customer.email.lower() == email.lower():
-                            logger.info(f"Найден успешный платеж для {email}: {payment.id}")
-                            return True
-                    except Exception as e:
-                        logger.error(f"Ошибка при получении данных о клиенте: {e}")
-                
-                # Проверяем данные в метаданных платежа
-                if hasattr(payment, 'metadata') and payment.metadata:
-                    payment_email = payment.metadata.get('email')
-                    if payment_email and payment_email.lower() == email.lower():
-                        logger.info(f"Найден успешный платеж для {email} в метаданных: {payment.id}")
-                        return True
+        logger.info(f"Проверка платежа: email={email}, имя={name}")
+        match = await payment_index.match(email=email, name=name)
+        if not match or match.criterion == "name_fuzzy":
+            # Подтягиваем новые платежи из Stripe (инкрементально, по курсору created)
+            await payment_index.sync()
+            match = await payment_index.match(email=email, name=name)
         
-        # Дополнительно проверяем через Checkout Sessions
-        try:
-            checkout_sessions = stripe.checkout.Session.list(
-                limit=100,
-                created={"gte": thirty_days_ago}
-            )
-            
-            for session in checkout_sessions.data:
-                if session.payment_status == 'paid' and hasattr(session, 'customer_details'):
-                    if session.customer_details.email and session.customer_details.email.lower() == email.lower():
-                        logger.info(f"Найден успешный платеж в сессии для {email}: {session.id}")
-                        return True
-        except Exception as e:
-            logger.error(f"Ошибка при проверке сессий: {e}")
-                        
-        logger.info(f"Платежи для {email} не найдены")
-        return False
+        if match:
+            logger.info(f"Найден успешный платеж {match.payment_id} (совпадение по {match.criterion})")
+        else:
+            logger.info(f"Платежи для email={email}, имя={name} не найдены")
+        return match
     except Exception as e:
         logger.error(f"Ошибка при проверке платежа: {e}")
-        return False
+        return None
+
+def is_confirmed_payment(match) -> bool:
+    """Достаточно ли совпадения, чтобы выдать доступ автоматически (похожего имени — нет)"""
+    return match is not None and match.criterion != "name_fuzzy"
+
+async def check_stripe_payment_by_email(email: str) -> bool:
+    """Проверяет наличие успешного платежа по email покупателя"""
+    return is_confirmed_payment(await find_stripe_payment(email=email))
 
 async def check_stripe_payment_by_name(name: str) -> bool:
-    """Проверяет наличие успешного платежа по имени покупателя (неточный поиск)"""
-    if not stripe_client_ready:
-        return False
-    
+    """Проверяет наличие успешного платежа по имени покупателя (без учёта регистра и пробелов)"""
+    return is_confirmed_payment(await find_stripe_payment(name=name))
+
+async def request_manual_payment_review(user: types.User, email: str, name: str, match) -> None:
+    """Отправляет администратору платёж, найденный только по похожему имени, на ручную проверку"""
     try:
-        logger.info(f"Проверка платежа по имени: {name}")
-        # Ищем платежи за последние 30 дней
-        thirty_days_ago = int(time.time() - 30 * 24 * 60 * 60)
-        
-        # Нормализуем имя для поиска (убираем пробелы, приводим к нижнему регистру)
-        normalized_name = name.lower().replace(' ', '')
-        
-        # Проверяем через Checkout Sessions (они содержат больше информации о клиенте)
-        try:
-            checkout_sessions = stripe.checkout.Session.list(
-                limit=100,
-                created={"gte": thirty_days_ago}
-            )
-            
-            for session in checkout_sessions.data:
-                if session.payment_status == 'paid' and hasattr(session, 'customer_details'):
-                    if session.customer_details.name:
-                        customer_name = session.customer_details.name.lower().replace(' ', '')
-                        if normalized_name in customer_name or customer_name in normalized_name:
-                            logger.info(f"Найден успешный платеж в сессии для {name}: {session.id}")
-                            return True
-        except Exception as e:
-            logger.error(f"Ошибка при проверке сессий: {e}")
-        
-        # Проверяем платежи через Payment Intents
-        payment_intents = stripe.PaymentIntent.list(
-            limit=100,
-            created={"gte": thirty_days_ago}
+        await bot.send_message(
+            chat_id=ADMIN_USER_ID,
+            text=f"🔎 Платёж найден только по похожему имени — нужна ручная проверка!\n\n"
+                 f"👤 Пользователь: {user.full_name} (@{user.username})\n"
+                 f"🆔 ID: {user.id}\n"
+                 f"📧 Email: {email}\n"
+                 f"✍️ Имя: {name}\n"
+                 f"💳 Платёж: {match.payment_id} (сходство {match.score:.2f})"
         )
-        
-        for payment in payment_intents.data:
-            if payment.status == 'succeeded':
-                # Проверяем данные клиента
-                if hasattr(payment, 'customer') and payment.customer:
-                    try:
-                        customer = stripe.Customer.retrieve(payment.customer)
-                        if customer.name:
-                            customer_name = customer.name.lower().replace(' ', '')
-                            if normalized_name in customer_name or customer_name in normalized_name:
-                                logger.info(f"Найден успешный платеж для {name}: {payment.id}")
-                                return True
-                    except Exception as e:
-                        logger.error(f"Ошибка при получении данных о клиенте: {e}")
-                
-                # Проверяем метаданные платежа
-                if hasattr(payment, 'metadata') and payment.metadata:
-                    customer_name = payment.metadata.get('name')
-                    if customer_name:
-                        customer_name = customer_name.lower().replace(' ', '')
-                        if normalized_name in customer_name or customer_name in normalized_name:
-                            logger.info(f"Найден успешный платеж для {name} в метаданных: {payment.id}")
-                            return True
-                
-        logger.info(f"Платежи для {name} не найдены")
-        return False
+        logger.info(f"Платёж {match.payment_id} пользователя {user.id} отправлен на ручную проверку")
     except Exception as e:
-        logger.error(f"Ошибка при проверке платежа: {e}")
-        return False
+        logger.error(f"Ошибка при отправке платежа на ручную проверку: {e}")
 
 # Доступ к курсу
 async def send_course_access(user_id: int):
@@ -614,7 +697,8 @@ async def send_free_lesson(message: types.Message):
             user_id=user_id,
             username=user.username,
             first_name=user.first_name,
-            last_name=user.last_name
+            last_name=user.last_name,
+            language_code=user.language_code
         )
         logger.debug(f"Просмотр урока записан в систему напоминаний для пользователя {user_id}")
     
@@ -773,7 +857,7 @@ async def process_widerruf_agreement(callback_query: types.CallbackQuery, state:
         
         # Создаем inline клавиатуру для оплаты
         keyboard = InlineKeyboardMarkup()
-        keyboard.add(InlineKeyboardButton("💳 Оплатить курс (149€)", url=STRIPE_PAYMENT_URL))
+        keyboard.add(InlineKeyboardButton("💳 Оплатить курс (149€)", url=get_payment_url(user_id)))
         
         await callback_query.message.answer(
             f"� Оплата курса '{COURSE_TITLE}' — {COURSE_PRICE_EUR}€\n\n"
@@ -874,9 +958,12 @@ async def handle_question(message: types.Message, state: FSMContext):
         await state.finish()
         await message.answer("❌ Отменено.", reply_markup=main_menu)
         return
-    await message.answer("🤔 Думаю...")
-    reply = await ask_assistant(message.text)
-    await message.answer(f"💡 {reply}", reply_markup=main_menu)
+    if ASSISTANT_STREAMING:
+        await stream_assistant_reply(message, message.text)
+    else:
+        await message.answer("🤔 Думаю...")
+        reply = await ask_assistant(message.text, user_id=message.from_user.id)
+        await message.answer(f"💡 {reply}", reply_markup=main_menu)
     await state.finish()
     
 # ─────────[ Проверка оплаты ]───────────────────────────
@@ -957,18 +1044,23 @@ async def check_payment_by_name(message: types.Message, state: FSMContext):
     # Сообщаем о начале проверки
     await message.answer("🔄 Проверяем оплату... Это может занять несколько секунд.")
     
-    # Проверяем оплату по email
+    # Проверяем оплату сразу по email и имени (один проход)
     logger.info(f"Проверяем платеж для {email} и {name}")
-    email_payment_found = await check_stripe_payment_by_email(email)
-    
-    # Проверяем оплату по имени, если по email не нашли
-    name_payment_found = False
-    if not email_payment_found:
-        name_payment_found = await check_stripe_payment_by_name(name)
+    payment_match = await find_stripe_payment(email=email, name=name)
     
+    # Похожее имя без подтверждения по email — только ручная проверка, доступ не выдаём
+    if payment_match and not is_confirmed_payment(payment_match):
+        logger.info(f"Платеж {payment_match.payment_id} для пользователя {user_id} найден только по похожему имени")
+        await request_manual_payment_review(message.from_user, email, name, payment_match)
+        await message.answer(
+            "🔎 Мы нашли платеж на похожее имя, но не можем подтвердить его автоматически.\n\n"
+            "Мы проверим его вручную и выдадим доступ — обычно это занимает не более 24 часов. "
+            "Как только доступ будет предоставлен, вы получите уведомление в этом боте.",
+            reply_markup=main_menu
+        )
     # Если платеж найден - отправляем доступ
-    if email_payment_found or name_payment_found:
-        logger.info(f"Платеж найден для пользователя {user_id}")
+    elif payment_match:
+        logger.info(f"Платеж найден для пользователя {user_id} (по {payment_match.criterion})")
         await send_course_access(message.from_user.id)
         await message.answer(
             "✅ Мы нашли ваш платеж! Доступ к курсу предоставлен.",
@@ -1061,9 +1153,8 @@ async def check_reminder_stats(message: types.Message):
         return
     
     try:
-        # Получаем статистику из модуля напоминаний
-        from reminder_system import get_reminder_stats
-        stats = await get_reminder_stats(reminder_system.db_path)
+        # Получаем статистику через общее соединение системы напоминаний
+        stats = await reminder_system.get_stats()
         
         # Формируем сообщение
         stats_message = (
@@ -1074,6 +1165,53 @@ async def check_reminder_stats(message: types.Message):
             f"💰 Конверсия в покупки: {stats['conversion_rate']:.2f}%"
         )
         
+        # Конверсия по напоминаниям: покупки после последнего полученного напоминания
+        if stats.get("by_reminder"):
+            stats_message += "\n\n📈 Покупки по напоминаниям:"
+            for row in stats["by_reminder"]:
+                if row["reminder_index"] < 0:
+                    stats_message += f"\nБез напоминаний: {row['purchases']} покупок"
+                else:
+                    stats_message += (
+                        f"\n#{row['reminder_index'] + 1}: отправлено {row['sent']}, "
+                        f"покупок {row['purchases']} ({row['conversion_rate']:.1f}%)"
+                    )
+        
+        # A/B-варианты текстов: конверсия на отправленное сообщение
+        variant_rows = stats.get("by_variant", [])
+        if any(row["variant_id"] != "default" for row in variant_rows):
+            stats_message += "\n\n🧪 Варианты напоминаний:"
+            for row in variant_rows:
+                stats_message += (
+                    f"\n#{row['reminder_index'] + 1} {row['variant_id']}: отправлено {row['sent']}, "
+                    f"покупок {row['purchases']} ({row['conversion_rate']:.1f}%)"
+                )
+        
+        # Динамика по дням: просмотры / новые / напоминания / покупки
+        if stats.get("daily"):
+            stats_message += "\n\n📅 По дням (просмотры / новые / напоминания / покупки):"
+            for day in stats["daily"]:
+                stats_message += (
+                    f"\n{day['day'][5:]}: {day['views']} / {day['new_users']} / "
+                    f"{day['reminders_sent']} / {day['purchases']}"
+                )
+        
+        cache_stats = answer_cache.stats()
+        stats_message += (
+            "\n\n💾 Кэш ответов ассистента:\n"
+            f"Записей: {cache_stats['entries']}, "
+            f"попаданий: {cache_stats['exact_hits']} + {cache_stats['similar_hits']} похожих, "
+            f"промахов: {cache_stats['misses']} ({cache_stats['hit_rate']:.1f}% hit rate)"
+        )
+        
+        faq_stats = faq_index.stats()
+        stats_message += (
+            "\n\n📚 FAQ-индекс:\n"
+            f"Фрагментов: {faq_stats['passages']} (построен за {faq_stats['build_ms']:.1f} мс), "
+            f"запросов: {faq_stats['queries']}, среднее время: {faq_stats['avg_query_ms']:.2f} мс, "
+            f"прямых ответов: {faq_stats['direct_answers']}"
+        )
+        
         await message.answer(stats_message)
     except Exception as e:
         logger.error(f"Ошибка при получении статистики напоминаний: {e}")
@@ -1136,10 +1274,22 @@ async def on_startup(dp):
     # Запускаем систему напоминаний
     if reminder_system:
         try:
-            await reminder_system.start()
+            await reminder_system.start(send_reminders=REMINDERS_IN_BOT)
             logger.info("Система напоминаний запущена")
         except Exception as e:
             logger.error(f"Ошибка при запуске системы напоминаний: {e}")
+    
+    # Запускаем обработку Stripe webhook
+    if webhook_worker:
+        try:
+            await webhook_worker.start()
+            logger.info("Обработчик Stripe webhook запущен")
+        except Exception as e:
+            logger.error(f"Ошибка при запуске обработчика Stripe webhook: {e}")
+    
+    # Первичная синхронизация индекса платежей идёт в фоне, а не в запросе пользователя
+    if payment_index:
+        await payment_index.start()
 
 async def on_shutdown(dp):
     import os
@@ -1179,6 +1329,25 @@ async def on_shutdown(dp):
         except Exception as e:
             logger.error(f"Ошибка при остановке системы напоминаний: {e}")
     
+    # Останавливаем обработку Stripe webhook
+    if webhook_worker:
+        try:
+            await webhook_worker.stop()
+            logger.info("Обработчик Stripe webhook остановлен")
+        except Exception as e:
+            logger.error(f"Ошибка при остановке обработчика Stripe webhook: {e}")
+    
+    # Закрываем базы индекса платежей и кэша ответов
+    if payment_index:
+        try:
+            await payment_index.close()
+        except Exception as e:
+            logger.error(f"Ошибка при закрытии индекса платежей: {e}")
+    try:
+        await answer_cache.close()
+    except Exception as e:
+        logger.error(f"Ошибка при закрытии кэша ответов: {e}")
+    
     logger.info("=== БОТ ОСТАНОВЛЕН ===")
     
     # Для гарантированной остановки, принудительно завершаем процесс после всех операций
@@ -1197,9 +1366,16 @@ async def on_shutdown(dp):
 async def main():
     # Запускаем систему напоминаний, если она создана
     if reminder_system and not reminder_system.is_running:
-        await reminder_system.start()
+        await reminder_system.start(send_reminders=REMINDERS_IN_BOT)
         logger.info("Система напоминаний запущена")
     
+    if webhook_worker and not webhook_worker.is_running:
+        await webhook_worker.start()
+        logger.info("Обработчик Stripe webhook запущен")
+    
+    if payment_index:
+        await payment_index.start()
+    
     # Запускаем поллинг бота
     try:
         logger.info("Бот запущен!")
@@ -1212,6 +1388,11 @@ async def main():
         if reminder_system and reminder_system.is_running:
             await reminder_system.stop()
             logger.info("Система напоминаний остановлена")
+        if webhook_worker and webhook_worker.is_running:
+            await webhook_worker.stop()
+        if payment_index:
+            await payment_index.close()
+        await answer_cache.close()
         logger.info("Бот остановлен!")
 
 # Функция для запуска бота из внешнего скрипта (для Render)
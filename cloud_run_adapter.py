@@ -1,3 +1,4 @@
+import hmac
 import os
 import sys
 import logging
@@ -14,6 +15,25 @@ logging.basicConfig(
 )
 logger = logging.getLogger("cloud_run_adapter")
 
+def metrics_allowed(request):
+    """
+    Check access to /metrics
+    
+    With METRICS_TOKEN set the request must send `Authorization: Bearer <token>`;
+    without it only requests from the container itself (loopback) are served.
+    
+    Args:
+        request: The aiohttp request
+        
+    Returns:
+        bool: True if the metrics may be returned
+    """
+    token = os.getenv("METRICS_TOKEN", "")
+    if token:
+        header = request.headers.get("Authorization", "")
+        return hmac.compare_digest(header.encode("utf-8"), f"Bearer {token}".encode("utf-8"))
+    return request.remote in ("127.0.0.1", "::1")
+
 def init_cloud_run_adapter(bot_main_func):
     """
     Initialize Cloud Run adapter to make the Telegram bot work in Cloud Run environment
@@ -31,7 +51,7 @@ def init_cloud_run_adapter(bot_main_func):
     # Log environment variables
     logger.info("Environment variables:")
     for key, value in os.environ.items():
-        if key in ["BOT_TOKEN", "ADMIN_USER_ID", "COURSE_CHANNEL_ID"]:
+        if key in ["BOT_TOKEN", "ADMIN_USER_ID", "COURSE_CHANNEL_ID", "STRIPE_API_KEY", "STRIPE_WEBHOOK_SECRET", "METRICS_TOKEN"]:
             # Mask sensitive values but show if they're set
             logger.info(f"  - {key}: {'[SET]' if value else '[NOT SET]'}")
         else:
@@ -50,15 +70,37 @@ def init_cloud_run_adapter(bot_main_func):
             "python_path": sys.path,
             "current_directory": os.getcwd(),
             "files_in_app": os.listdir('/app') if os.path.exists('/app') else "Not available",
-            "environment_vars": {k: ('[SET]' if k in ["BOT_TOKEN", "ADMIN_USER_ID"] else v) for k, v in os.environ.items()}
+            "environment_vars": {k: ('[SET]' if k in ["BOT_TOKEN", "ADMIN_USER_ID", "METRICS_TOKEN"] else v) for k, v in os.environ.items()}
         }
         return web.json_response(debug_info)
     
+    async def metrics_handler(request):
+        # OpenAI call metrics in the Prometheus text format (recorded by the bot thread)
+        if not metrics_allowed(request):
+            raise web.HTTPForbidden()
+        from openai_metrics import get_openai_metrics
+        return web.Response(
+            text=get_openai_metrics().render(),
+            content_type="text/plain"
+        )
+    
     async def run_web_server():
         app = web.Application()
         app.router.add_get("/", health_handler)
         app.router.add_get("/health", health_handler)
         app.router.add_get("/debug", debug_handler)
+        app.router.add_get("/metrics", metrics_handler)
+        
+        # Stripe webhooks (access is granted by the worker running in the bot loop)
+        webhook_secret = os.getenv("STRIPE_WEBHOOK_SECRET")
+        if webhook_secret:
+            try:
+                from stripe_webhook import WEBHOOK_PATH, create_webhook_handler, get_webhook_queue
+                app.router.add_post(WEBHOOK_PATH, create_webhook_handler(get_webhook_queue(), webhook_secret))
+                logger.info(f"Stripe webhook endpoint registered at {WEBHOOK_PATH}")
+            except Exception as e:
+                logger.error(f"Failed to register Stripe webhook endpoint: {e}")
+                logger.error(traceback.format_exc())
         
         runner = web.AppRunner(app)
         await runner.setup()
@@ -0,0 +1,183 @@
+"""
+Stripe Customer Cache for Dostup Bot
+
+Bounded in-process LRU cache with TTL expiry for Stripe Customer lookups,
+with an optional SQLite-backed second tier so cached customers survive restarts.
+Only the fields used for payment matching (email, name) are stored.
+
+get_memory() only touches memory and is safe on the event loop; get() and
+set() may do disk I/O and are meant for worker threads (see
+AsyncStripeClient.retrieve_customer).
+"""
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+DEFAULT_MAX_SIZE = 10000
+DEFAULT_TTL = 6 * 60 * 60  # seconds
+DEFAULT_PERSISTENT_TTL = 7 * 24 * 60 * 60  # seconds
+
+
+class CustomerCache:
+    """Two-tier (memory LRU + optional SQLite) cache of Stripe customers"""
+
+    def __init__(self, max_size: int = DEFAULT_MAX_SIZE, ttl: int = DEFAULT_TTL,
+                 db_path: Optional[str] = None,
+                 persistent_ttl: int = DEFAULT_PERSISTENT_TTL):
+        """
+        Initialize the customer cache
+
+        Args:
+            max_size: Maximum number of customers kept in memory
+            ttl: Lifetime of an in-memory entry in seconds
+            db_path: Optional path to a SQLite file for the second tier
+            persistent_ttl: Lifetime of a SQLite entry in seconds
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.db_path = db_path
+        self.persistent_ttl = persistent_ttl
+        # customer_id -> (expires_at, {"email": ..., "name": ...})
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        # Memory lookups happen on the loop, disk-tier lookups on Stripe worker threads
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if self.db_path:
+            self._init_db()
+
+    def _init_db(self) -> None:
+        """Initialize the SQLite database with required tables"""
+        try:
+            db_dir = os.path.dirname(os.path.abspath(self.db_path))
+            if not os.path.exists(db_dir):
+                os.makedirs(db_dir, exist_ok=True)
+
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute('''
+                CREATE TABLE IF NOT EXISTS stripe_customers (
+                    customer_id TEXT PRIMARY KEY,
+                    email TEXT,
+                    name TEXT,
+                    cached_at INTEGER  -- Unix timestamp
+                )
+                ''')
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Customer cache initialization error: {e}")
+            self.db_path = None
+
+    def _load_persistent(self, customer_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                row = conn.execute(
+                    "SELECT email, name FROM stripe_customers WHERE customer_id = ? AND cached_at >= ?",
+                    (customer_id, int(time.time()) - self.persistent_ttl)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Error reading customer cache: {e}")
+            return None
+        if row is None:
+            return None
+        return {"id": customer_id, "email": row[0], "name": row[1]}
+
+    def _store_persistent(self, customer: Dict[str, Any]) -> None:
+        try:
+            with sqlite3.connect(self.db_path) as conn:
+                conn.execute(
+                    """INSERT OR REPLACE INTO stripe_customers (customer_id, email, name, cached_at)
+                       VALUES (?, ?, ?, ?)""",
+                    (customer["id"], customer["email"], customer["name"], int(time.time()))
+                )
+                conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error writing customer cache: {e}")
+
+    def _remember(self, customer: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[customer["id"]] = (time.monotonic() + self.ttl, customer)
+            self._entries.move_to_end(customer["id"])
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get_memory(self, customer_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a customer in memory only (no I/O, safe on the event loop)
+
+        Returns:
+            Dict with id, email and name, or None if not in memory
+        """
+        with self._lock:
+            entry = self._entries.get(customer_id)
+            if entry is not None:
+                expires_at, customer = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(customer_id)
+                    self.hits += 1
+                    return customer
+                del self._entries[customer_id]
+        return None
+
+    def get(self, customer_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a customer in memory, then in the SQLite tier (blocking)
+
+        Returns:
+            Dict with id, email and name, or None on a miss
+        """
+        customer = self.get_memory(customer_id)
+        if customer is not None:
+            return customer
+
+        if self.db_path:
+            customer = self._load_persistent(customer_id)
+            if customer is not None:
+                self._remember(customer)
+                with self._lock:
+                    self.disk_hits += 1
+                return customer
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, customer) -> Dict[str, Any]:
+        """
+        Store a Stripe Customer object (or dict); writes the SQLite tier (blocking)
+
+        Returns:
+            The cached dict with id, email and name
+        """
+        if isinstance(customer, dict):
+            get = customer.get
+        else:
+            get = lambda key: getattr(customer, key, None)
+        cached = {"id": get("id"), "email": get("email"), "name": get("name")}
+
+        self._remember(cached)
+        if self.db_path:
+            self._store_persistent(cached)
+        return cached
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss counters"""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": ((self.hits + self.disk_hits) / lookups * 100) if lookups else 0.0,
+            }
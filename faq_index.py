@@ -0,0 +1,236 @@
+"""
+FAQ Retrieval for Dostup Bot
+
+Local BM25 index over a curated FAQ file and the legal documents, built at
+startup. Questions that closely and unambiguously match a FAQ entry are
+answered directly without calling OpenAI; weaker matches supply the top
+passages as context for the assistant prompt. A direct answer needs
+several matched query terms and a clear lead over the best hit with a
+different answer, so one-word queries such as "курс" go to the assistant.
+"""
+import glob
+import logging
+import math
+import os
+import re
+import time
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from answer_cache import tokenize
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Terms are cut to this many characters - a crude stemmer for Russian and German
+STEM_LENGTH = 6
+# Share of the query's IDF weight a FAQ question must cover to be answered directly
+FAQ_DIRECT_CONFIDENCE = float(os.getenv("FAQ_DIRECT_CONFIDENCE", "0.8"))
+# Query terms a FAQ question must contain to be answered directly
+FAQ_DIRECT_MIN_TERMS = int(os.getenv("FAQ_DIRECT_MIN_TERMS", "2"))
+# Score lead over the best hit with a different answer needed for a direct answer
+FAQ_DIRECT_MARGIN = float(os.getenv("FAQ_DIRECT_MARGIN", "1.5"))
+# Minimum coverage for a passage to be used as prompt context
+FAQ_CONTEXT_CONFIDENCE = float(os.getenv("FAQ_CONTEXT_CONFIDENCE", "0.3"))
+
+SOURCE_FAQ = "faq"
+
+_SECTION_SPLIT = re.compile(r"\n\s*\n")
+
+
+class Passage(NamedTuple):
+    source: str  # "faq" or document name
+    text: str  # text matched against (FAQ: question wording)
+    answer: str  # text shown to the user / model
+
+
+class FaqHit(NamedTuple):
+    passage: Passage
+    score: float  # BM25 score
+    confidence: float  # share of query IDF weight found in the passage (0..1)
+    matched: int = 0  # number of query terms found in the passage
+
+
+def terms(text: str) -> List[str]:
+    """Normalized, stemmed terms of a text"""
+    return [token[:STEM_LENGTH] for token in tokenize(text)]
+
+
+def parse_faq(text: str, variables: Optional[Dict[str, str]] = None) -> List[Passage]:
+    """
+    Parse the FAQ file: "В:" lines with question wordings followed by an "О:" answer
+
+    Every wording becomes its own passage with the shared answer.
+    """
+    for key, value in (variables or {}).items():
+        text = text.replace("{" + key + "}", str(value))
+
+    passages = []
+    for block in _SECTION_SPLIT.split(text):
+        questions, answer_lines = [], []
+        for line in block.strip().splitlines():
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line[:2] in ("В:", "Q:"):
+                questions.append(line[2:].strip())
+            elif line[:2] in ("О:", "A:"):
+                answer_lines.append(line[2:].strip())
+            elif answer_lines:
+                answer_lines.append(line)
+        answer = "\n".join(answer_lines)
+        if answer:
+            passages.extend(Passage(SOURCE_FAQ, question, answer) for question in questions)
+    return passages
+
+
+def split_document(name: str, text: str) -> List[Passage]:
+    """Split a document into paragraph passages"""
+    return [
+        Passage(name, section.strip(), section.strip())
+        for section in _SECTION_SPLIT.split(text) if terms(section)
+    ]
+
+
+class FaqIndex:
+    """In-memory BM25 index of FAQ entries and document passages"""
+
+    def __init__(self, passages: Iterable[Passage]):
+        start_time = time.perf_counter()
+        self.passages: List[Passage] = []
+        self._terms: List[Counter] = []
+        self._postings: Dict[str, List[int]] = defaultdict(list)
+        seen = set()
+        for passage in passages:
+            # Documents exist both as files and in LEGAL_DOCS - index them once
+            key = (passage.source == SOURCE_FAQ, " ".join(passage.text.split()))
+            if key in seen:
+                continue
+            seen.add(key)
+            counts = Counter(terms(passage.text))
+            if not counts:
+                continue
+            passage_id = len(self.passages)
+            self.passages.append(passage)
+            self._terms.append(counts)
+            for term in counts:
+                self._postings[term].append(passage_id)
+
+        self._lengths = [sum(counts.values()) for counts in self._terms]
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+        self.build_ms = (time.perf_counter() - start_time) * 1000
+        self.queries = 0
+        self.query_ms_total = 0.0
+        self.direct_answers = 0
+        logger.info(f"FAQ index built: {len(self.passages)} passages in {self.build_ms:.1f}ms")
+
+    @classmethod
+    def build(cls, faq_path: Optional[str] = None, documents_dir: Optional[str] = None,
+              documents: Optional[Dict[str, str]] = None,
+              variables: Optional[Dict[str, str]] = None) -> "FaqIndex":
+        """
+        Build the index from the FAQ file, documents/*.txt and in-memory documents
+
+        Args:
+            faq_path: Path to the curated FAQ file
+            documents_dir: Directory with .txt documents
+            documents: Mapping of document name to text (e.g. LEGAL_DOCS)
+            variables: Values substituted for {NAME} placeholders in the FAQ
+        """
+        passages = []
+        if faq_path and os.path.exists(faq_path):
+            with open(faq_path, encoding="utf-8") as f:
+                passages.extend(parse_faq(f.read(), variables))
+        else:
+            logger.warning(f"FAQ file not found: {faq_path}")
+        for name, text in (documents or {}).items():
+            passages.extend(split_document(name, text))
+        if documents_dir:
+            for path in sorted(glob.glob(os.path.join(documents_dir, "*.txt"))):
+                if faq_path and os.path.abspath(path) == os.path.abspath(faq_path):
+                    continue
+                name = os.path.splitext(os.path.basename(path))[0]
+                with open(path, encoding="utf-8") as f:
+                    passages.extend(split_document(name, f.read()))
+        return cls(passages)
+
+    def _idf(self, term: str) -> float:
+        n = len(self._postings.get(term, ()))
+        return math.log(1 + (len(self.passages) - n + 0.5) / (n + 0.5))
+
+    def search(self, query: str, limit: int = 3) -> List[FaqHit]:
+        """
+        Rank passages for a question
+
+        Returns:
+            Best hits first
+        """
+        start_time = time.perf_counter()
+        query_terms = set(terms(query))
+        idf = {term: self._idf(term) for term in query_terms}
+        total_weight = sum(idf.values())
+
+        scores: Dict[int, float] = defaultdict(float)
+        for term in query_terms:
+            for passage_id in self._postings.get(term, ()):
+                tf = self._terms[passage_id][term]
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[passage_id] / self._avg_length)
+                scores[passage_id] += idf[term] * tf * (BM25_K1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        hits = []
+        for passage_id, score in ranked:
+            matched = [term for term in query_terms if term in self._terms[passage_id]]
+            covered = sum(idf[term] for term in matched)
+            hits.append(FaqHit(self.passages[passage_id], score,
+                               covered / total_weight if total_weight else 0.0, len(matched)))
+
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        self.queries += 1
+        self.query_ms_total += elapsed_ms
+        logger.debug(f"FAQ search took {elapsed_ms:.2f}ms ({len(scores)} candidates)")
+        return hits
+
+    def lookup(self, question: str, limit: int = 3) -> Tuple[Optional[str], List[Passage]]:
+        """
+        Direct answer or prompt context for a question
+
+        Returns:
+            Tuple (direct answer or None, context passages)
+        """
+        # Extra hits to find the runner-up among several wordings of one answer
+        hits = self.search(question, limit=limit + 5)
+        if hits and self._is_direct(hits):
+            self.direct_answers += 1
+            return hits[0].passage.answer, []
+
+        context, answers = [], set()
+        for hit in hits[:limit]:
+            if hit.confidence >= FAQ_CONTEXT_CONFIDENCE and hit.passage.answer not in answers:
+                answers.add(hit.passage.answer)
+                context.append(hit.passage)
+        return None, context
+
+    @staticmethod
+    def _is_direct(hits: List[FaqHit]) -> bool:
+        """Whether the best hit is a confident, unambiguous FAQ answer"""
+        best = hits[0]
+        if best.passage.source != SOURCE_FAQ or best.confidence < FAQ_DIRECT_CONFIDENCE:
+            return False
+        if best.matched < FAQ_DIRECT_MIN_TERMS:
+            return False
+        runner_up = next((hit for hit in hits[1:] if hit.passage.answer != best.passage.answer), None)
+        return runner_up is None or best.score >= FAQ_DIRECT_MARGIN * runner_up.score
+
+    def stats(self) -> Dict[str, float]:
+        """Index size, build time and query latency"""
+        return {
+            "passages": len(self.passages),
+            "build_ms": self.build_ms,
+            "queries": self.queries,
+            "avg_query_ms": (self.query_ms_total / self.queries) if self.queries else 0.0,
+            "direct_answers": self.direct_answers,
+        }
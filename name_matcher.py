@@ -0,0 +1,182 @@
+"""
+Fuzzy Name Matching for Dostup Bot
+
+Trigram index over payer names used by the payment index. Names are folded
+to a canonical Latin form (Cyrillic transliteration plus a few common
+spelling variants) so that "Юлия Петрова", "Yulia Petrova" and
+"Julia Petrowa" all land on the same trigrams, and candidates are ranked
+by Dice similarity of their trigram sets.
+
+A whole-name score is lenient ("Elena" is 0.63 similar to "Elena Popova"),
+so a candidate only counts as the same name if tokens_match() pairs every
+word of both names one-to-one under the much stricter TOKEN_THRESHOLD.
+"""
+import itertools
+import logging
+import math
+import re
+import unicodedata
+from collections import defaultdict
+from typing import Dict, FrozenSet, List, Set, Tuple
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+DEFAULT_THRESHOLD = 0.6  # candidate search
+TOKEN_THRESHOLD = 0.85  # per word in tokens_match ("ivanov" vs "ivanova" is 0.8)
+MAX_MATCH_TOKENS = 6  # longer names are never matched word by word
+
+CYRILLIC_TO_LATIN = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ё": "e",
+    "ж": "zh", "з": "z", "и": "i", "й": "i", "к": "k", "л": "l", "м": "m",
+    "н": "n", "о": "o", "п": "p", "р": "r", "с": "s", "т": "t", "у": "u",
+    "ф": "f", "х": "h", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "sch", "ъ": "",
+    "ы": "y", "ь": "", "э": "e", "ю": "yu", "я": "ya",
+    # Ukrainian / Belarusian
+    "і": "i", "ї": "i", "є": "e", "ґ": "g", "ў": "u",
+}
+
+# Latin spellings that transliterate the same sound differently
+LATIN_VARIANTS = [
+    ("kh", "h"), ("ph", "f"), ("w", "v"), ("x", "ks"), ("j", "i"), ("y", "i"),
+]
+
+_NON_ALNUM = re.compile(r"[^a-z0-9 ]+")
+_DOUBLE_LETTERS = re.compile(r"(.)\1+")
+
+
+def fold_name(name: str) -> str:
+    """
+    Fold a name to its canonical Latin form
+
+    Example: "Юлия  Петрова" -> "iulia petrova"
+    """
+    text = unicodedata.normalize("NFKD", (name or "").lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = "".join(CYRILLIC_TO_LATIN.get(ch, ch) for ch in text)
+    for variant, canonical in LATIN_VARIANTS:
+        text = text.replace(variant, canonical)
+    text = _NON_ALNUM.sub(" ", text)
+    text = _DOUBLE_LETTERS.sub(r"\1", text)
+    return " ".join(text.split())
+
+
+def trigrams(folded: str) -> Set[str]:
+    """Trigrams of every word (padded), independent of word order"""
+    grams = set()
+    for word in folded.split():
+        padded = f"  {word} "
+        for i in range(len(padded) - 2):
+            grams.add(padded[i:i + 3])
+    return grams
+
+
+def _dice(a: Set[str], b: Set[str]) -> float:
+    return 2.0 * len(a & b) / (len(a) + len(b)) if a or b else 0.0
+
+
+def tokens_match(query: str, name: str, threshold: float = TOKEN_THRESHOLD) -> bool:
+    """
+    Check that two names consist of the same words, in any order
+
+    Every word of the query must pair up with a different word of the name
+    (and vice versa) with a trigram similarity of at least `threshold`, so a
+    missing first name, a different first name or a different surname
+    ending never match.
+
+    Args:
+        query: Name entered by the user
+        name: Payer name (raw or folded)
+        threshold: Minimum Dice similarity per word pair
+
+    Returns:
+        True if the names match word for word
+    """
+    query_words = fold_name(query).split()
+    name_words = fold_name(name).split()
+    if not query_words or len(query_words) != len(name_words) or len(query_words) > MAX_MATCH_TOKENS:
+        return False
+    query_grams = [trigrams(word) for word in query_words]
+    name_grams = [trigrams(word) for word in name_words]
+    return any(
+        all(_dice(query_grams[i], name_grams[j]) >= threshold for i, j in enumerate(order))
+        for order in itertools.permutations(range(len(name_words)))
+    )
+
+
+class NameIndex:
+    """In-memory trigram index of payer names"""
+
+    def __init__(self):
+        # trigram -> ids of folded names containing it
+        self._postings: Dict[str, Set[int]] = defaultdict(set)
+        self._names: List[str] = []
+        self._grams: List[FrozenSet[str]] = []
+        self._payments: List[Set[str]] = []
+        self._ids: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def add(self, name: str, payment_id: str) -> None:
+        """Index a payer name for a payment"""
+        folded = fold_name(name)
+        if not folded:
+            return
+
+        name_id = self._ids.get(folded)
+        if name_id is None:
+            grams = frozenset(trigrams(folded))
+            name_id = len(self._names)
+            self._ids[folded] = name_id
+            self._names.append(folded)
+            self._grams.append(grams)
+            self._payments.append(set())
+            for gram in grams:
+                self._postings[gram].add(name_id)
+        self._payments[name_id].add(payment_id)
+
+    def search(self, query: str, threshold: float = DEFAULT_THRESHOLD,
+               limit: int = 5) -> List[Tuple[str, float, str]]:
+        """
+        Find names similar to the query
+
+        Args:
+            query: Name entered by the user
+            threshold: Minimum Dice similarity (0..1)
+            limit: Maximum number of results
+
+        Returns:
+            List of tuples (payment_id, score, folded_name), best first
+        """
+        query_grams = trigrams(fold_name(query))
+        if not query_grams:
+            return []
+
+        # Prefix filtering: a name reaching the threshold shares at least
+        # `min_overlap` trigrams with the query, so it must contain one of the
+        # (size - min_overlap + 1) rarest query trigrams. Only those postings
+        # are scanned; candidates are then verified exactly.
+        query_size = len(query_grams)
+        min_overlap = max(1, math.ceil(threshold * query_size / (2.0 - threshold)))
+        ordered = sorted(query_grams, key=lambda gram: len(self._postings.get(gram, ())))
+        candidates: Set[int] = set()
+        for gram in ordered[:query_size - min_overlap + 1]:
+            candidates.update(self._postings.get(gram, ()))
+
+        scored = []
+        for name_id in candidates:
+            grams = self._grams[name_id]
+            score = 2.0 * len(query_grams & grams) / (query_size + len(grams))
+            if score >= threshold:
+                scored.append((score, name_id))
+        scored.sort(reverse=True)
+
+        results = []
+        for score, name_id in scored:
+            for payment_id in sorted(self._payments[name_id]):
+                results.append((payment_id, score, self._names[name_id]))
+                if len(results) >= limit:
+                    return results
+        return results
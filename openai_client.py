@@ -0,0 +1,237 @@
+"""
+Async OpenAI Client for Dostup Bot
+
+Wraps a single shared `openai.AsyncOpenAI` client (one pooled HTTP connection
+set for the whole bot) with a global concurrency limit, per-user in-flight
+limits, per-call timeouts and retries with exponential backoff on 429/5xx,
+so that waiting for GPT never blocks other updates. Chat completions can
+also be streamed as text deltas. Every call is recorded in the OpenAI
+metrics registry under its call site (see openai_metrics.py).
+"""
+import asyncio
+import contextlib
+import logging
+import os
+import random
+import time
+from collections import defaultdict
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+import openai
+
+from openai_metrics import OpenAIMetrics, get_openai_metrics
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))
+OPENAI_PER_USER_LIMIT = int(os.getenv("OPENAI_PER_USER_LIMIT", "1"))
+OPENAI_REQUEST_TIMEOUT = float(os.getenv("OPENAI_REQUEST_TIMEOUT", "30"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+OPENAI_BACKOFF_BASE = 1.0  # seconds
+OPENAI_BACKOFF_MAX = 20.0  # seconds
+DEFAULT_CALL_SITE = "other"
+
+
+class UserBusyError(Exception):
+    """Raised when a user already has the maximum number of requests in flight"""
+
+
+def _is_retryable(error: Exception) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Read the Retry-After header of a 429/503 response, if any"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class AsyncOpenAIClient:
+    """Shared, rate-limited async access to the OpenAI API"""
+
+    def __init__(self, api_key: str,
+                 max_concurrency: int = OPENAI_MAX_CONCURRENCY,
+                 per_user_limit: int = OPENAI_PER_USER_LIMIT,
+                 timeout: float = OPENAI_REQUEST_TIMEOUT,
+                 max_retries: int = OPENAI_MAX_RETRIES,
+                 metrics: Optional[OpenAIMetrics] = None):
+        """
+        Initialize the OpenAI client wrapper
+
+        Args:
+            api_key: OpenAI API key
+            max_concurrency: Maximum number of OpenAI requests in flight at once
+            per_user_limit: Maximum number of requests in flight per Telegram user
+            timeout: Timeout of a single attempt in seconds
+            max_retries: Retries after the first attempt on 429/5xx/timeouts
+            metrics: Metrics registry (defaults to the process-wide one)
+        """
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self.per_user_limit = per_user_limit
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.metrics = metrics or get_openai_metrics()
+        self._client = None
+        self._client_loop = None
+        self._semaphore = None
+        self._in_flight: Dict[int, int] = defaultdict(int)
+
+    def _bind_loop(self) -> None:
+        # httpx connections and the semaphore belong to the loop that uses them
+        loop = asyncio.get_running_loop()
+        if self._client_loop is not loop:
+            self._client = openai.AsyncOpenAI(
+                api_key=self.api_key,
+                timeout=self.timeout,
+                max_retries=0  # Retries are handled here, with our own backoff
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._client_loop = loop
+
+    @property
+    def client(self) -> "openai.AsyncOpenAI":
+        """The underlying AsyncOpenAI client (for use inside `call`)"""
+        self._bind_loop()
+        return self._client
+
+    @contextlib.contextmanager
+    def _user_slot(self, user_id: Optional[int]):
+        if user_id is None:
+            yield
+            return
+        if self._in_flight[user_id] >= self.per_user_limit:
+            raise UserBusyError(f"User {user_id} already has a request in flight")
+        self._in_flight[user_id] += 1
+        try:
+            yield
+        finally:
+            self._in_flight[user_id] -= 1
+            if self._in_flight[user_id] <= 0:
+                del self._in_flight[user_id]
+
+    async def _run_with_retries(self, func: Callable[["openai.AsyncOpenAI"], Awaitable[Any]],
+                                call_site: str, operation: str) -> Any:
+        """
+        Run `func` with timeout and retries; the semaphore is released between
+        attempts and still held on success (the caller releases it)
+        """
+        attempt = 0
+        while True:
+            await self._semaphore.acquire()
+            try:
+                return await asyncio.wait_for(func(self._client), timeout=self.timeout)
+            except BaseException as e:
+                self._semaphore.release()
+                retry = attempt < self.max_retries and _is_retryable(e)
+                if not isinstance(e, asyncio.CancelledError):
+                    self.metrics.record_attempt_error(call_site, operation, e, retried=retry)
+                if not retry:
+                    raise
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = min(OPENAI_BACKOFF_MAX, OPENAI_BACKOFF_BASE * 2 ** attempt)
+                    delay += random.uniform(0, delay / 2)
+                attempt += 1
+                logger.warning(
+                    f"OpenAI request failed ({type(e).__name__}), "
+                    f"retry {attempt}/{self.max_retries} in {delay:.1f}s"
+                )
+                await asyncio.sleep(delay)
+
+    async def call(self, func: Callable[["openai.AsyncOpenAI"], Awaitable[Any]],
+                   user_id: Optional[int] = None, call_site: str = DEFAULT_CALL_SITE,
+                   operation: str = "call") -> Any:
+        """
+        Run an OpenAI request with concurrency limits, timeout and retries
+
+        Args:
+            func: Coroutine function receiving the AsyncOpenAI client
+            user_id: Optional Telegram user the request is made for
+            call_site: Metrics label of the caller ("question", "reminder", ...)
+            operation: Metrics label of the API operation
+
+        Raises:
+            UserBusyError: if the user already has too many requests in flight
+        """
+        self._bind_loop()
+        with self._user_slot(user_id):
+            start_time = time.monotonic()
+            try:
+                result = await self._run_with_retries(func, call_site, operation)
+            except Exception as e:
+                self.metrics.record_request(call_site, operation, time.monotonic() - start_time, error=e)
+                raise
+            self._semaphore.release()
+            self.metrics.record_request(call_site, operation, time.monotonic() - start_time)
+            self.metrics.record_usage(call_site, getattr(result, "usage", None))
+            return result
+
+    async def chat_completion(self, user_id: Optional[int] = None,
+                              call_site: str = DEFAULT_CALL_SITE, **params) -> Any:
+        """Create a chat completion (params as for `chat.completions.create`)"""
+        return await self.call(
+            lambda client: client.chat.completions.create(**params),
+            user_id=user_id, call_site=call_site, operation="chat.completions"
+        )
+
+    async def stream_chat_completion(self, user_id: Optional[int] = None,
+                                     call_site: str = DEFAULT_CALL_SITE,
+                                     **params) -> AsyncIterator[str]:
+        """
+        Stream a chat completion as text deltas
+
+        Opening the stream is retried like `call`; once tokens are flowing the
+        request keeps its concurrency slot until the stream ends. Reads are
+        bounded by the client timeout.
+
+        Raises:
+            UserBusyError: if the user already has too many requests in flight
+        """
+        operation = "chat.completions.stream"
+        # The last chunk then carries the token usage
+        params.setdefault("stream_options", {"include_usage": True})
+        self._bind_loop()
+        with self._user_slot(user_id):
+            start_time = time.monotonic()
+            try:
+                stream = await self._run_with_retries(
+                    lambda client: client.chat.completions.create(stream=True, **params),
+                    call_site, operation
+                )
+            except Exception as e:
+                self.metrics.record_request(call_site, operation, time.monotonic() - start_time, error=e)
+                raise
+            error = None
+            first_token = True
+            try:
+                async for chunk in stream:
+                    self.metrics.record_usage(call_site, getattr(chunk, "usage", None))
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        if first_token:
+                            first_token = False
+                            self.metrics.record_first_token(call_site, operation, time.monotonic() - start_time)
+                        yield delta
+            except Exception as e:
+                error = e
+                self.metrics.record_attempt_error(call_site, operation, e, retried=False)
+                raise
+            finally:
+                self._semaphore.release()
+                self.metrics.record_request(call_site, operation, time.monotonic() - start_time, error=error)
+                await stream.close()
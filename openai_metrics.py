@@ -0,0 +1,146 @@
+"""
+OpenAI Metrics for Dostup Bot
+
+Thread-safe in-process registry of OpenAI call metrics: latency histograms,
+token counts, retries and error classes, labelled by call site
+("question", "reminder") and operation. Rendered in the Prometheus text
+format by the /metrics endpoint of the web server (cloud_run_adapter.py),
+which runs in a different thread than the bot.
+"""
+import logging
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)  # seconds
+
+Labels = Tuple[Tuple[str, str], ...]
+
+_HELP = {
+    "openai_requests_total": ("counter", "OpenAI calls by outcome"),
+    "openai_request_duration_seconds": ("histogram", "OpenAI call latency including retries"),
+    "openai_time_to_first_token_seconds": ("histogram", "Time until the first streamed token"),
+    "openai_retries_total": ("counter", "Retried OpenAI attempts"),
+    "openai_errors_total": ("counter", "Failed OpenAI attempts by error class"),
+    "openai_tokens_total": ("counter", "Prompt and completion tokens used"),
+}
+
+
+def _labels(**labels) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in items) + "}"
+
+
+def _format_value(value: float) -> str:
+    # Exact integers for counts, full precision for floats (`:g` rounds to 6 digits)
+    value = float(value)
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class OpenAIMetrics:
+    """Counters and histograms of OpenAI calls"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = defaultdict(lambda: defaultdict(float))
+        # name -> labels -> [bucket counts..., +Inf count, sum]
+        self._histograms: Dict[str, Dict[Labels, List[float]]] = defaultdict(dict)
+
+    def _inc(self, name: str, labels: Labels, value: float = 1.0) -> None:
+        with self._lock:
+            self._counters[name][labels] += value
+
+    def _observe(self, name: str, labels: Labels, value: float) -> None:
+        with self._lock:
+            series = self._histograms[name].get(labels)
+            if series is None:
+                series = self._histograms[name][labels] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def record_request(self, call_site: str, operation: str, duration: float,
+                       error: Optional[BaseException] = None) -> None:
+        """Record a finished call (after retries)"""
+        outcome = "error" if error is not None else "success"
+        self._inc("openai_requests_total", _labels(call_site=call_site, operation=operation, outcome=outcome))
+        self._observe("openai_request_duration_seconds", _labels(call_site=call_site, operation=operation), duration)
+
+    def record_first_token(self, call_site: str, operation: str, delay: float) -> None:
+        self._observe("openai_time_to_first_token_seconds", _labels(call_site=call_site, operation=operation), delay)
+
+    def record_attempt_error(self, call_site: str, operation: str, error: BaseException,
+                             retried: bool) -> None:
+        """Record a failed attempt and whether it is retried"""
+        self._inc("openai_errors_total", _labels(call_site=call_site, operation=operation,
+                                                 error=type(error).__name__))
+        if retried:
+            self._inc("openai_retries_total", _labels(call_site=call_site, operation=operation))
+
+    def record_usage(self, call_site: str, usage) -> None:
+        """Record token usage from a response `usage` object (if present)"""
+        if usage is None:
+            return
+        for kind in ("prompt", "completion"):
+            tokens = getattr(usage, f"{kind}_tokens", None)
+            if tokens:
+                self._inc("openai_tokens_total", _labels(call_site=call_site, type=kind), tokens)
+
+    def render(self) -> str:
+        """Metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, (kind, help_text) in _HELP.items():
+                if kind == "counter":
+                    series = self._counters.get(name)
+                    if not series:
+                        continue
+                    lines.append(f"# HELP {name} {help_text}")
+                    lines.append(f"# TYPE {name} counter")
+                    for labels, value in sorted(series.items()):
+                        lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                else:
+                    series = self._histograms.get(name)
+                    if not series:
+                        continue
+                    lines.append(f"# HELP {name} {help_text}")
+                    lines.append(f"# TYPE {name} histogram")
+                    for labels, values in sorted(series.items()):
+                        for bound, count in zip(self.buckets, values):
+                            lines.append(f"{name}_bucket{_format_labels(labels, ('le', _format_value(bound)))} {_format_value(count)}")
+                        lines.append(f"{name}_bucket{_format_labels(labels, ('le', '+Inf'))} {_format_value(values[-2])}")
+                        lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(values[-1])}")
+                        lines.append(f"{name}_count{_format_labels(labels)} {_format_value(values[-2])}")
+        return "\n".join(lines) + "\n"
+
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+
+def get_openai_metrics() -> OpenAIMetrics:
+    """Process-wide metrics registry (shared by the bot and web server threads)"""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = OpenAIMetrics()
+        return _metrics
@@ -0,0 +1,544 @@
+"""
+Payment Index for Dostup Bot
+
+This module keeps a local SQLite mirror of succeeded Stripe payments so that
+payment checks can be answered from the local index instead of re-listing
+PaymentIntents and Checkout Sessions from Stripe on every user request.
+The index is synced incrementally using a `created`-based cursor; the first
+(backfill) sync runs as a background task started with the bot, not inside a
+user's payment check. Database access goes through a SqliteStore connection
+(sqlite_store.py), so syncs and lookups run on its executor thread instead of
+the event loop.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional, Tuple, Any
+
+from name_matcher import DEFAULT_THRESHOLD, NameIndex, tokens_match
+from sqlite_store import SqliteStore
+from stripe_client import STRIPE_PAGE_SIZE, AsyncStripeClient, SingleFlight, get_stripe_client
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+# Concurrent checks share one sync; its result is reused for this many seconds
+SYNC_SNAPSHOT_SECONDS = float(os.getenv("PAYMENT_SYNC_SNAPSHOT_SECONDS", "5"))
+# Minimum similarity for fuzzy (transliterated / misspelled) name candidates;
+# a candidate must also match word for word (name_matcher.tokens_match)
+NAME_MATCH_THRESHOLD = float(os.getenv("PAYMENT_NAME_MATCH_THRESHOLD", str(DEFAULT_THRESHOLD)))
+
+# Objects that are still pending keep the sync cursor from moving past them,
+# but only for this long (abandoned PaymentIntents never reach a final state)
+PENDING_GRACE_SECONDS = 24 * 60 * 60
+
+PENDING_PAYMENT_INTENT_STATUSES = {
+    "requires_payment_method", "requires_confirmation", "requires_action",
+    "processing", "requires_capture",
+}
+
+SOURCE_PAYMENT_INTENT = "payment_intent"
+SOURCE_CHECKOUT_SESSION = "checkout_session"
+
+
+def normalize_email(email: Optional[str]) -> str:
+    """Normalize an email address for index lookups"""
+    return (email or "").strip().lower()
+
+
+def normalize_name(name: Optional[str]) -> str:
+    """Normalize a payer name for index lookups (lowercase, no spaces)"""
+    return (name or "").lower().replace(" ", "")
+
+
+class PaymentMatch(NamedTuple):
+    """Result of a payment lookup"""
+    payment_id: str
+    criterion: str  # "email", "name" or "name_fuzzy" (never enough to grant access)
+    score: float = 1.0
+
+
+def _field(obj, key: str, default=None):
+    """Read a field from a Stripe object or a plain dict (e.g. a webhook payload)"""
+    if obj is None:
+        return default
+    if isinstance(obj, dict):
+        return obj.get(key, default)
+    return getattr(obj, key, default)
+
+
+class PaymentIndex:
+    """Local indexed mirror of succeeded Stripe payments"""
+
+    def __init__(self, db_path: str = "payment_index.db",
+                 backfill_days: Optional[int] = None,
+                 stripe_client: Optional[AsyncStripeClient] = None,
+                 snapshot_ttl: float = SYNC_SNAPSHOT_SECONDS,
+                 name_threshold: float = NAME_MATCH_THRESHOLD):
+        """
+        Initialize the payment index
+
+        Args:
+            db_path: Path to the SQLite database file
+            backfill_days: How far back the very first sync goes (None = full history)
+            stripe_client: Async Stripe client (defaults to the shared one)
+            snapshot_ttl: Seconds a finished sync is reused by later checks
+            name_threshold: Minimum similarity for fuzzy name matches
+        """
+        self.db_path = db_path
+        self.backfill_days = backfill_days
+        self.stripe_client = stripe_client or get_stripe_client()
+        self._sync_flight = SingleFlight(ttl=snapshot_ttl)
+        self.name_threshold = name_threshold
+        self.name_index = NameIndex()
+        self.store = SqliteStore(db_path)
+        self._backfill_task: Optional[asyncio.Task] = None
+        self._init_db()
+        self._load_name_index()
+
+        logger.info(f"Payment index initialized at {self.db_path}")
+
+    def _init_db(self) -> None:
+        """Initialize the SQLite database with required tables"""
+        try:
+            self.store.run_sync(self._create_tables)
+        except sqlite3.Error as e:
+            logger.error(f"Payment index initialization error: {e}")
+
+    @staticmethod
+    def _create_tables(conn: sqlite3.Connection) -> None:
+        cursor = conn.cursor()
+        # One row per succeeded payment
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS payments (
+            payment_id TEXT PRIMARY KEY,
+            source TEXT,  -- payment_intent / checkout_session
+            customer_id TEXT,
+            amount INTEGER,
+            currency TEXT,
+            created INTEGER  -- Unix timestamp
+        )
+        ''')
+
+        # Normalized lookup keys (a payment may carry several emails/names)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS payment_keys (
+            key_type TEXT,  -- email / name
+            key_value TEXT,
+            payment_id TEXT,
+            PRIMARY KEY (key_type, key_value, payment_id),
+            FOREIGN KEY (payment_id) REFERENCES payments(payment_id)
+        )
+        ''')
+
+        # Payer names as entered (feed the fuzzy name index)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS payment_names (
+            payment_id TEXT,
+            name TEXT,
+            PRIMARY KEY (payment_id, name),
+            FOREIGN KEY (payment_id) REFERENCES payments(payment_id)
+        )
+        ''')
+
+        # Incremental sync cursor per Stripe object type
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sync_state (
+            source TEXT PRIMARY KEY,
+            cursor INTEGER,  -- Unix timestamp of the next `created.gte`
+            synced_at INTEGER
+        )
+        ''')
+
+    def _load_name_index(self) -> None:
+        """Build the in-memory fuzzy name index from the database"""
+        start_time = time.time()
+        try:
+            rows = self.store.run_sync(lambda conn: conn.execute(
+                """SELECT name, payment_id FROM payment_names
+                   UNION ALL
+                   SELECT key_value, payment_id FROM payment_keys
+                   WHERE key_type = 'name'
+                     AND payment_id NOT IN (SELECT payment_id FROM payment_names)"""
+            ).fetchall())
+        except sqlite3.Error as e:
+            logger.error(f"Error loading payer names: {e}")
+            return
+
+        for name, payment_id in rows:
+            self.name_index.add(name, payment_id)
+        logger.info(
+            f"Name index built with {len(self.name_index)} names "
+            f"in {(time.time() - start_time) * 1000:.1f} ms"
+        )
+
+    # ------------------------------------------------------------------
+    # Storage
+    # ------------------------------------------------------------------
+    async def _get_cursor(self, source: str) -> Optional[int]:
+        try:
+            row = await self.store.fetchone(
+                "SELECT cursor FROM sync_state WHERE source = ?", (source,)
+            )
+            return row[0] if row else None
+        except sqlite3.Error as e:
+            logger.error(f"Error reading payment index cursor: {e}")
+            return None
+
+    async def _store(self, source: str, records: List[Dict[str, Any]],
+                     new_cursor: Optional[int] = None) -> None:
+        """Upsert indexed payments and advance the cursor in one transaction"""
+        await self.store.run(self._write_records, source, records, new_cursor)
+
+        for record in records:
+            for name in record.get("names", ()):
+                if name:
+                    self.name_index.add(name, record["payment_id"])
+
+    @staticmethod
+    def _write_records(conn: sqlite3.Connection, source: str, records: List[Dict[str, Any]],
+                       new_cursor: Optional[int]) -> None:
+        """Write records and the cursor (runs on the store thread)"""
+        cursor = conn.cursor()
+        for record in records:
+            cursor.execute(
+                """INSERT OR REPLACE INTO payments
+                   (payment_id, source, customer_id, amount, currency, created)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                (record["payment_id"], source, record.get("customer_id"),
+                 record.get("amount"), record.get("currency"), record["created"])
+            )
+            for email in record.get("emails", ()):
+                if email:
+                    cursor.execute(
+                        "INSERT OR IGNORE INTO payment_keys VALUES ('email', ?, ?)",
+                        (email, record["payment_id"])
+                    )
+            for name in record.get("names", ()):
+                if name and normalize_name(name):
+                    cursor.execute(
+                        "INSERT OR IGNORE INTO payment_keys VALUES ('name', ?, ?)",
+                        (normalize_name(name), record["payment_id"])
+                    )
+                    cursor.execute(
+                        "INSERT OR IGNORE INTO payment_names VALUES (?, ?)",
+                        (record["payment_id"], name)
+                    )
+        if new_cursor is not None:
+            cursor.execute(
+                """INSERT OR REPLACE INTO sync_state (source, cursor, synced_at)
+                   VALUES (?, ?, ?)""",
+                (source, new_cursor, int(time.time()))
+            )
+
+    # ------------------------------------------------------------------
+    # Record extraction
+    # ------------------------------------------------------------------
+    async def _payment_intent_record(self, payment) -> Optional[Dict[str, Any]]:
+        if _field(payment, "status") != "succeeded":
+            return None
+
+        emails, names = set(), set()
+        customer_id = _field(payment, "customer")
+        if customer_id:
+            try:
+                customer = await self.stripe_client.retrieve_customer(customer_id)
+                emails.add(normalize_email(_field(customer, "email")))
+                names.add(_field(customer, "name"))
+            except Exception as e:
+                logger.error(f"Error retrieving Stripe customer {customer_id}: {e}")
+
+        metadata = _field(payment, "metadata")
+        if metadata:
+            emails.add(normalize_email(_field(metadata, "email")))
+            names.add(_field(metadata, "name"))
+        emails.add(normalize_email(_field(payment, "receipt_email")))
+
+        return {
+            "payment_id": _field(payment, "id"),
+            "customer_id": customer_id,
+            "amount": _field(payment, "amount"),
+            "currency": _field(payment, "currency"),
+            "created": _field(payment, "created"),
+            "emails": emails,
+            "names": names,
+        }
+
+    def _checkout_session_record(self, session) -> Optional[Dict[str, Any]]:
+        if _field(session, "payment_status") != "paid":
+            return None
+
+        emails, names = set(), set()
+        details = _field(session, "customer_details")
+        if details:
+            emails.add(normalize_email(_field(details, "email")))
+            names.add(_field(details, "name"))
+
+        return {
+            "payment_id": _field(session, "id"),
+            "customer_id": _field(session, "customer"),
+            "amount": _field(session, "amount_total"),
+            "currency": _field(session, "currency"),
+            "created": _field(session, "created"),
+            "emails": emails,
+            "names": names,
+        }
+
+    @staticmethod
+    def _is_pending(source: str, obj) -> bool:
+        status = _field(obj, "status")
+        if source == SOURCE_PAYMENT_INTENT:
+            return status in PENDING_PAYMENT_INTENT_STATUSES
+        return status == "open" or (
+            status == "complete" and _field(obj, "payment_status") == "unpaid"
+        )
+
+    # ------------------------------------------------------------------
+    # Sync
+    # ------------------------------------------------------------------
+    async def _index_page(self, source: str, objects: List[Any]) -> int:
+        """
+        Upsert the succeeded payments of one page of Stripe objects
+
+        Customer lookups of the page run concurrently; the Stripe client's
+        semaphore caps how many requests are in flight.
+
+        Returns:
+            Number of succeeded payments indexed
+        """
+        if source == SOURCE_PAYMENT_INTENT:
+            records = await asyncio.gather(*(self._payment_intent_record(obj) for obj in objects))
+        else:
+            records = [self._checkout_session_record(obj) for obj in objects]
+        records = [record for record in records if record]
+        if records:
+            await self._store(source, records)
+        return len(records)
+
+    async def _sync_source(self, source: str, objects: AsyncIterator, start: int) -> int:
+        """
+        Index one Stripe object stream and advance its cursor
+
+        Payments are upserted page by page, so a long backfill makes them
+        findable as it goes (Stripe lists the newest first). The cursor is only
+        written at the end: it moves to the newest `created` seen, except that
+        objects which may still succeed (and are younger than
+        PENDING_GRACE_SECONDS) hold it back so they are listed again on the
+        next sync.
+
+        Returns:
+            Number of succeeded payments indexed
+        """
+        now = int(time.time())
+        indexed = 0
+        page = []
+        newest = start
+        pending_floor = None
+
+        async for obj in objects:
+            created = _field(obj, "created")
+            newest = max(newest, created)
+            if self._is_pending(source, obj):
+                if created >= now - PENDING_GRACE_SECONDS:
+                    pending_floor = created if pending_floor is None else min(pending_floor, created)
+                continue
+
+            page.append(obj)
+            if len(page) >= STRIPE_PAGE_SIZE:
+                indexed += await self._index_page(source, page)
+                page = []
+        indexed += await self._index_page(source, page)
+
+        new_cursor = pending_floor if pending_floor is not None else newest
+        await self._store(source, [], new_cursor)
+        return indexed
+
+    async def _start_for(self, source: str) -> int:
+        cursor = await self._get_cursor(source)
+        if cursor is not None:
+            return cursor
+        if self.backfill_days is None:
+            return 0
+        return int(time.time() - self.backfill_days * 24 * 60 * 60)
+
+    async def sync(self) -> Tuple[int, int]:
+        """
+        Pull new PaymentIntents and Checkout Sessions from Stripe into the index
+
+        Concurrent callers share one in-flight sync, and a finished sync is
+        reused for `snapshot_ttl` seconds. While the startup backfill is still
+        running this returns at once: the backfill indexes the newest payments
+        first, and a user check must not wait for the full history.
+
+        Returns:
+            Tuple (payment_intents_indexed, checkout_sessions_indexed)
+        """
+        if self.is_backfilling:
+            logger.debug("Payment index backfill in progress, skipping sync")
+            return 0, 0
+        return await self._sync_flight.do("sync", self._sync)
+
+    @property
+    def is_backfilling(self) -> bool:
+        return self._backfill_task is not None and not self._backfill_task.done()
+
+    async def _backfill(self) -> None:
+        start_time = time.time()
+        try:
+            intents, sessions = await self._sync_flight.do("sync", self._sync)
+        except Exception as e:
+            logger.error(f"Payment index backfill failed: {e}")
+            return
+        logger.info(
+            f"Payment index backfill done: {intents} payment intents, {sessions} checkout sessions "
+            f"in {time.time() - start_time:.1f}s"
+        )
+
+    async def start(self) -> None:
+        """Start the initial sync (the backfill on an empty index) in the background"""
+        if not self.is_backfilling:
+            self._backfill_task = asyncio.create_task(self._backfill())
+
+    async def close(self) -> None:
+        """Stop a running backfill and close the database connection"""
+        if self.is_backfilling:
+            self._backfill_task.cancel()
+            try:
+                await self._backfill_task
+            except asyncio.CancelledError:
+                pass
+        await self.store.close()
+
+    async def _sync(self) -> Tuple[int, int]:
+        start = await self._start_for(SOURCE_PAYMENT_INTENT)
+        intents_indexed = await self._sync_source(
+            SOURCE_PAYMENT_INTENT,
+            self.stripe_client.list_payment_intents(created={"gte": start}),
+            start
+        )
+
+        start = await self._start_for(SOURCE_CHECKOUT_SESSION)
+        sessions_indexed = await self._sync_source(
+            SOURCE_CHECKOUT_SESSION,
+            self.stripe_client.list_checkout_sessions(created={"gte": start}),
+            start
+        )
+
+        logger.debug(
+            f"Payment index synced: {intents_indexed} payment intents, "
+            f"{sessions_indexed} checkout sessions"
+        )
+        return intents_indexed, sessions_indexed
+
+    async def add_payment_intent(self, payment) -> bool:
+        """
+        Index a single PaymentIntent (e.g. from a webhook event) without touching the cursor
+
+        Returns:
+            True if the payment succeeded and was indexed
+        """
+        record = await self._payment_intent_record(payment)
+        if record:
+            await self._store(SOURCE_PAYMENT_INTENT, [record])
+        return record is not None
+
+    async def add_checkout_session(self, session) -> bool:
+        """
+        Index a single Checkout Session (e.g. from a webhook event) without touching the cursor
+
+        Returns:
+            True if the session was paid and was indexed
+        """
+        record = self._checkout_session_record(session)
+        if record:
+            await self._store(SOURCE_CHECKOUT_SESSION, [record])
+        return record is not None
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+    async def match(self, email: Optional[str] = None, name: Optional[str] = None) -> Optional[PaymentMatch]:
+        """
+        Evaluate the email and name criteria together in a single query
+
+        An exact email match is the more confident criterion and wins over a
+        name match when both exist. A name matches exactly only as a whole
+        (case and spaces aside): "Elena" does not match "Elena Popova". If
+        neither matches, the name is looked up in the fuzzy trigram index
+        (transliteration and typos) and a candidate must match word for word.
+        A "name_fuzzy" match needs manual confirmation before access is granted.
+
+        Returns:
+            PaymentMatch or None
+        """
+        email_key = normalize_email(email)
+        name_key = normalize_name(name)
+        if not email_key and not name_key:
+            return None
+        try:
+            row = await self.store.fetchone(
+                """SELECT payment_id, key_type FROM payment_keys
+                   WHERE (key_type = 'email' AND key_value = ?)
+                      OR (key_type = 'name' AND key_value = ?)
+                   ORDER BY key_type = 'email' DESC
+                   LIMIT 1""",
+                (email_key, name_key)
+            )
+            if row:
+                return PaymentMatch(row[0], row[1])
+        except sqlite3.Error as e:
+            logger.error(f"Error querying payment index: {e}")
+
+        if name_key:
+            for payment_id, score, matched_name in self.name_index.search(name, threshold=self.name_threshold):
+                if tokens_match(name, matched_name):
+                    logger.debug(f"Fuzzy name match '{name}' ~ '{matched_name}' ({score:.2f})")
+                    return PaymentMatch(payment_id, "name_fuzzy", score)
+        return None
+
+    async def find_by_email(self, email: str) -> Optional[str]:
+        """
+        Find a succeeded payment by payer email
+
+        Returns:
+            Payment id or None
+        """
+        key = normalize_email(email)
+        if not key:
+            return None
+        try:
+            row = await self.store.fetchone(
+                """SELECT payment_id FROM payment_keys
+                   WHERE key_type = 'email' AND key_value = ? LIMIT 1""",
+                (key,)
+            )
+            return row[0] if row else None
+        except sqlite3.Error as e:
+            logger.error(f"Error querying payment index by email: {e}")
+            return None
+
+    async def find_by_name(self, name: str) -> Optional[str]:
+        """
+        Find a succeeded payment by payer name (bidirectional substring match)
+
+        Returns:
+            Payment id or None
+        """
+        key = normalize_name(name)
+        if not key:
+            return None
+        try:
+            row = await self.store.fetchone(
+                """SELECT payment_id FROM payment_keys
+                   WHERE key_type = 'name'
+                     AND (instr(key_value, ?) > 0 OR instr(?, key_value) > 0)
+                   LIMIT 1""",
+                (key, key)
+            )
+            return row[0] if row else None
+        except sqlite3.Error as e:
+            logger.error(f"Error querying payment index by name: {e}")
+            return None
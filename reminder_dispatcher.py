@@ -0,0 +1,176 @@
+"""
+Reminder Dispatcher for Dostup Bot
+
+Sends a wave of reminders with a pool of concurrent sender tasks behind a
+token bucket sized to Telegram's bot limits (about 30 messages per second
+overall, one per second per chat). RetryAfter pauses all senders for the
+time Telegram asks for; transient errors are retried with backoff and
+permanent ones (bot blocked, chat not found, user deactivated) are
+reported so those users can be skipped from then on.
+"""
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+from typing import Awaitable, Callable, Dict, Iterable, Tuple
+
+from aiogram.utils.exceptions import (BotBlocked, BotKicked, CantInitiateConversation,
+                                      CantTalkWithBots, ChatNotFound, NetworkError,
+                                      RestartingTelegram, RetryAfter, UserDeactivated)
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))  # messages per second
+TELEGRAM_PER_CHAT_INTERVAL = 1.0  # seconds between messages to the same chat
+REMINDER_SENDERS = int(os.getenv("REMINDER_SENDERS", "8"))
+REMINDER_SEND_RETRIES = 3
+REMINDER_BACKOFF_BASE = 2.0  # seconds
+
+PERMANENT_ERRORS = (BotBlocked, BotKicked, CantInitiateConversation, CantTalkWithBots,
+                    ChatNotFound, UserDeactivated)
+TRANSIENT_ERRORS = (NetworkError, RestartingTelegram, asyncio.TimeoutError, ConnectionError)
+
+RESULT_SENT = "sent"
+RESULT_BLOCKED = "blocked"
+RESULT_FAILED = "failed"
+
+
+class TokenBucket:
+    """Async token bucket; `pause` empties it for a while (flood control)"""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        # No bursts by default: Telegram counts messages per rolling second
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class ReminderDispatcher:
+    """Concurrent, rate-limited sender of reminder jobs (user_id, reminder_index)"""
+
+    def __init__(self, send: Callable[[int, int], Awaitable[None]],
+                 on_permanent_failure: Callable[[int, Exception], Awaitable[None]],
+                 senders: int = REMINDER_SENDERS,
+                 global_rate: float = TELEGRAM_GLOBAL_RATE,
+                 per_chat_interval: float = TELEGRAM_PER_CHAT_INTERVAL,
+                 max_retries: int = REMINDER_SEND_RETRIES):
+        """
+        Initialize the dispatcher
+
+        Args:
+            send: Coroutine function (user_id, reminder_index) sending one reminder; raises on failure
+            on_permanent_failure: Called for users that can never be reached
+            senders: Number of concurrent sender tasks
+            global_rate: Messages per second across all chats
+            per_chat_interval: Minimum seconds between messages to one chat
+            max_retries: Retries of a reminder after transient errors
+        """
+        self.send = send
+        self.on_permanent_failure = on_permanent_failure
+        self.senders = senders
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+        self.bucket = TokenBucket(global_rate)
+        self._chat_ready: Dict[int, float] = {}
+
+    async def _wait_for_chat(self, user_id: int) -> None:
+        delay = self._chat_ready.get(user_id, 0.0) - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        self._chat_ready[user_id] = time.monotonic() + self.per_chat_interval
+
+    async def _deliver(self, user_id: int, reminder_index: int) -> str:
+        attempt = 0
+        while True:
+            await self._wait_for_chat(user_id)
+            await self.bucket.acquire()
+            try:
+                await self.send(user_id, reminder_index)
+                return RESULT_SENT
+            except RetryAfter as e:
+                # Flood control applies to the whole bot: pause every sender
+                logger.warning(f"Telegram flood control, pausing reminders for {e.timeout}s")
+                self.bucket.pause(e.timeout)
+            except PERMANENT_ERRORS as e:
+                logger.info(f"User {user_id} cannot receive reminders: {e}")
+                try:
+                    await self.on_permanent_failure(user_id, e)
+                except Exception as callback_error:
+                    logger.error(f"Error marking user {user_id} unreachable: {callback_error}")
+                return RESULT_BLOCKED
+            except TRANSIENT_ERRORS as e:
+                if attempt >= self.max_retries:
+                    logger.error(f"Giving up on reminder {reminder_index} for user {user_id}: {e}")
+                    return RESULT_FAILED
+                delay = REMINDER_BACKOFF_BASE * 2 ** attempt
+                logger.warning(f"Reminder to {user_id} failed ({e}), retrying in {delay:.0f}s")
+                await asyncio.sleep(delay)
+            except Exception as e:
+                logger.error(f"Error sending reminder {reminder_index} to user {user_id}: {e}")
+                return RESULT_FAILED
+            attempt += 1
+
+    async def _sender(self, queue: asyncio.Queue, results: Counter) -> None:
+        while True:
+            user_id, reminder_index = await queue.get()
+            try:
+                results[await self._deliver(user_id, reminder_index)] += 1
+            finally:
+                queue.task_done()
+
+    async def dispatch(self, jobs: Iterable[Tuple[int, int]]) -> Dict[str, int]:
+        """
+        Send all jobs and wait for them to finish
+
+        Returns:
+            Counts per result ("sent", "blocked", "failed")
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        for job in jobs:
+            queue.put_nowait(job)
+        if queue.empty():
+            return {}
+
+        start_time = time.monotonic()
+        total = queue.qsize()
+        results: Counter = Counter()
+        senders = [
+            asyncio.create_task(self._sender(queue, results))
+            for _ in range(min(self.senders, total))
+        ]
+        try:
+            await queue.join()
+        finally:
+            for sender in senders:
+                sender.cancel()
+            await asyncio.gather(*senders, return_exceptions=True)
+            self._chat_ready.clear()
+
+        logger.info(
+            f"Reminder wave of {total} done in {time.monotonic() - start_time:.1f}s: {dict(results)}"
+        )
+        return dict(results)
@@ -0,0 +1,187 @@
+"""
+Reminder Outbox for Dostup Bot
+
+Transactional outbox for reminder sends. Every claimed reminder becomes a
+row keyed by "user_id:reminder_index" that moves through
+
+    pending -> sending -> sent
+                       -> failed   (user blocked the bot, chat gone, ...)
+                       -> pending  (transient error, retried)
+
+A row is moved to "sending" in its own transaction right before the
+Telegram call, and to "sent" in the same transaction that advances the
+user's reminder index and writes reminder_history. A key that is already
+"sending" or "sent" is never sent again, so the crash window between the
+Telegram call and the database write can no longer produce a duplicate.
+
+Telegram offers no idempotent send, so the outcome of a row left in
+"sending" by a crashed worker is unknown. Such rows are recovered as sent
+(at most once) once their lease has expired: a reminder that may have been
+lost is preferred to one the user receives twice.
+"""
+import logging
+import sqlite3
+from typing import List, Optional, Sequence, Tuple
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# States
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+
+def outbox_key(user_id: int, reminder_index: int) -> str:
+    """Idempotency key of a reminder"""
+    return f"{user_id}:{reminder_index}"
+
+
+def create_outbox_table(conn: sqlite3.Connection) -> None:
+    """Create the outbox table and its recovery index"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS reminder_outbox (
+        idempotency_key TEXT PRIMARY KEY,  -- user_id:reminder_index
+        user_id INTEGER,
+        reminder_index INTEGER,
+        state TEXT,  -- pending, sending, sent, failed
+        message_text TEXT,  -- text of the last send attempt
+        was_ai_generated INTEGER DEFAULT 0,  -- Boolean flag
+        attempts INTEGER DEFAULT 0,
+        claimed_by TEXT,  -- Worker of the last send attempt
+        error TEXT,
+        created_at INTEGER,  -- Unix timestamp
+        updated_at INTEGER  -- Unix timestamp of the last state change
+    )
+    ''')
+    conn.execute('''
+    CREATE INDEX IF NOT EXISTS idx_reminder_outbox_state
+    ON reminder_outbox (state, updated_at)
+    ''')
+
+
+def enqueue(conn: sqlite3.Connection, reminders: Sequence[Tuple[int, int]],
+            current_time: int) -> List[Tuple[int, int]]:
+    """
+    Materialize claimed reminders as pending rows (inside the claim transaction)
+
+    Existing rows keep their state, except failed ones, which are retried
+    (the user viewed a lesson again after blocking the bot).
+
+    Args:
+        conn: Connection holding the claim transaction
+        reminders: (user_id, reminder_index) pairs
+        current_time: Unix timestamp
+
+    Returns:
+        The pairs whose row is pending, i.e. may be sent
+    """
+    if not reminders:
+        return []
+    conn.executemany(
+        f"""INSERT INTO reminder_outbox
+                (idempotency_key, user_id, reminder_index, state, created_at, updated_at)
+            VALUES (?, ?, ?, '{PENDING}', ?, ?)
+            ON CONFLICT(idempotency_key) DO UPDATE
+            SET state = '{PENDING}', updated_at = excluded.updated_at
+            WHERE state = '{FAILED}'""",
+        [(outbox_key(user_id, reminder_index), user_id, reminder_index, current_time, current_time)
+         for user_id, reminder_index in reminders]
+    )
+    keys = [outbox_key(user_id, reminder_index) for user_id, reminder_index in reminders]
+    pending = set()
+    for start in range(0, len(keys), 500):  # stay below SQLite's variable limit
+        chunk = keys[start:start + 500]
+        pending.update(row[0] for row in conn.execute(
+            f"""SELECT idempotency_key FROM reminder_outbox
+                WHERE state = '{PENDING}' AND idempotency_key IN ({', '.join('?' * len(chunk))})""",
+            chunk
+        ))
+    return [pair for pair, key in zip(reminders, keys) if key in pending]
+
+
+def begin_send(conn: sqlite3.Connection, user_id: int, reminder_index: int, message_text: str,
+               was_ai_generated: bool, worker_id: str, current_time: int) -> bool:
+    """
+    Move a reminder to "sending" right before the Telegram call
+
+    Reminders sent without a claim get their row here.
+
+    Returns:
+        False if the reminder is already being sent or was sent (skip it)
+    """
+    cursor = conn.execute(
+        f"""INSERT INTO reminder_outbox
+                (idempotency_key, user_id, reminder_index, state, message_text, was_ai_generated,
+                 attempts, claimed_by, created_at, updated_at)
+            VALUES (?, ?, ?, '{SENDING}', ?, ?, 1, ?, ?, ?)
+            ON CONFLICT(idempotency_key) DO UPDATE
+            SET state = '{SENDING}', message_text = excluded.message_text,
+                was_ai_generated = excluded.was_ai_generated, attempts = attempts + 1,
+                claimed_by = excluded.claimed_by, updated_at = excluded.updated_at
+            WHERE state IN ('{PENDING}', '{FAILED}')""",
+        (outbox_key(user_id, reminder_index), user_id, reminder_index, message_text,
+         1 if was_ai_generated else 0, worker_id, current_time, current_time)
+    )
+    return cursor.rowcount == 1
+
+
+def mark_sent(conn: sqlite3.Connection, user_id: int, reminder_index: int,
+              current_time: int) -> bool:
+    """
+    Move a reminder to "sent" (inside the transaction that records it)
+
+    Returns:
+        False if it was already sent, i.e. it must not be recorded again
+    """
+    cursor = conn.execute(
+        f"""INSERT INTO reminder_outbox
+                (idempotency_key, user_id, reminder_index, state, created_at, updated_at)
+            VALUES (?, ?, ?, '{SENT}', ?, ?)
+            ON CONFLICT(idempotency_key) DO UPDATE
+            SET state = '{SENT}', error = NULL, updated_at = excluded.updated_at
+            WHERE state != '{SENT}'""",
+        (outbox_key(user_id, reminder_index), user_id, reminder_index, current_time, current_time)
+    )
+    return cursor.rowcount == 1
+
+
+def mark_failed(conn: sqlite3.Connection, user_id: int, reminder_index: int, permanent: bool,
+                error: Optional[str], current_time: int) -> None:
+    """Record a failed send: "failed" for permanent errors, back to "pending" otherwise"""
+    conn.execute(
+        f"""UPDATE reminder_outbox SET state = ?, error = ?, updated_at = ?
+            WHERE idempotency_key = ? AND state = '{SENDING}'""",
+        (FAILED if permanent else PENDING, error, current_time, outbox_key(user_id, reminder_index))
+    )
+
+
+def stale_sends(conn: sqlite3.Connection, stale_before: int) -> List[Tuple[int, int, bool, int]]:
+    """
+    Rows left in "sending" since before `stale_before` (their worker died)
+
+    Returns:
+        List of tuples (user_id, reminder_index, was_ai_generated, updated_at)
+    """
+    return [
+        (user_id, reminder_index, bool(was_ai_generated), updated_at)
+        for user_id, reminder_index, was_ai_generated, updated_at in conn.execute(
+            f"""SELECT user_id, reminder_index, was_ai_generated, updated_at FROM reminder_outbox
+                WHERE state = '{SENDING}' AND updated_at <= ?""",
+            (stale_before,)
+        )
+    ]
+
+
+def purge(conn: sqlite3.Connection, before: int) -> int:
+    """
+    Delete finished rows last changed before `before`
+
+    Returns:
+        Number of deleted rows
+    """
+    return conn.execute(
+        f"DELETE FROM reminder_outbox WHERE state IN ('{SENT}', '{FAILED}') AND updated_at < ?",
+        (before,)
+    ).rowcount
@@ -0,0 +1,234 @@
+"""
+Reminder Text Pool for Dostup Bot
+
+Keeps a pool of pre-generated (AI) reminder texts per reminder index and
+cohort in SQLite (via the shared SQLite store). Texts are generated ahead
+of time by a background refill task, expire after a while and are rotated
+least-used-first, so sending a reminder never waits on OpenAI. Personal details are filled in locally from
+placeholders such as {first_name}.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from typing import Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+from sqlite_store import SqliteStore
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+POOL_SIZE = int(os.getenv("REMINDER_POOL_SIZE", "5"))  # texts per (reminder_index, cohort)
+POOL_TTL = int(os.getenv("REMINDER_POOL_TTL", str(3 * 24 * 60 * 60)))  # seconds
+POOL_REFILL_INTERVAL = int(os.getenv("REMINDER_POOL_REFILL_INTERVAL", str(60 * 60)))  # seconds
+# A reminder sent this many days after its due day goes to the "late" cohort
+LATE_AFTER_DAYS = 2
+
+COHORT_ON_TIME = "on_time"
+COHORT_LATE = "late"
+COHORTS = (COHORT_ON_TIME, COHORT_LATE)
+
+DEFAULT_FIRST_NAME = "друг"
+
+
+def cohort_for(days_since_view: float, due_days: float) -> str:
+    """Cohort of a user by how long after the due day the reminder is sent"""
+    return COHORT_LATE if days_since_view - due_days >= LATE_AFTER_DAYS else COHORT_ON_TIME
+
+
+def render(template: str, first_name: Optional[str] = None) -> str:
+    """Fill in personal placeholders (plain replacement, other braces are kept)"""
+    return template.replace("{first_name}", (first_name or "").strip() or DEFAULT_FIRST_NAME)
+
+
+class ReminderPool:
+    """SQLite-backed pool of pre-generated reminder texts"""
+
+    def __init__(self, store: SqliteStore,
+                 generate: Callable[[int, str], Awaitable[Optional[str]]],
+                 reminder_count: int,
+                 pool_size: int = POOL_SIZE,
+                 ttl: int = POOL_TTL,
+                 refill_interval: int = POOL_REFILL_INTERVAL,
+                 cohorts: Iterable[str] = COHORTS):
+        """
+        Initialize the reminder pool
+
+        Args:
+            store: SQLite store of the reminder database (holds the pool table)
+            generate: Coroutine function (reminder_index, cohort) -> text template or None
+            reminder_count: Number of reminder intervals
+            pool_size: Number of valid texts to keep per (reminder_index, cohort)
+            ttl: Lifetime of a generated text in seconds
+            refill_interval: Seconds between background refills
+            cohorts: Cohorts texts are generated for
+        """
+        self.store = store
+        self.generate = generate
+        self.reminder_count = reminder_count
+        self.pool_size = pool_size
+        self.ttl = ttl
+        self.refill_interval = refill_interval
+        self.cohorts = tuple(cohorts)
+        self.is_running = False
+        self.task = None
+        self._init_db()
+
+    def _init_db(self) -> None:
+        """Initialize the SQLite database with required tables"""
+        try:
+            self.store.run_sync(self._create_tables)
+        except sqlite3.Error as e:
+            logger.error(f"Reminder pool initialization error: {e}")
+
+    @staticmethod
+    def _create_tables(conn: sqlite3.Connection) -> None:
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS reminder_pool (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            reminder_index INTEGER,
+            cohort TEXT,
+            template TEXT,  -- text with placeholders such as {first_name}
+            created_at INTEGER,  -- Unix timestamp
+            expires_at INTEGER,  -- Unix timestamp
+            uses INTEGER DEFAULT 0,
+            last_used_at INTEGER DEFAULT 0  -- Unix timestamp
+        )
+        ''')
+        conn.execute(
+            """CREATE INDEX IF NOT EXISTS idx_reminder_pool_slot
+               ON reminder_pool (reminder_index, cohort, expires_at)"""
+        )
+
+    @staticmethod
+    def _pick(conn: sqlite3.Connection, reminder_index: int, cohort: str, now: int) -> Optional[str]:
+        row = conn.execute(
+            """SELECT id, template FROM reminder_pool
+               WHERE reminder_index = ? AND cohort = ? AND expires_at > ?
+               ORDER BY uses, last_used_at, RANDOM() LIMIT 1""",
+            (reminder_index, cohort, now)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            "UPDATE reminder_pool SET uses = uses + 1, last_used_at = ? WHERE id = ?",
+            (now, row[0])
+        )
+        return row[1]
+
+    async def pick(self, reminder_index: int, cohort: str = COHORT_ON_TIME) -> Optional[str]:
+        """
+        Take the least used valid text for a slot (rotation)
+
+        Returns:
+            Text template or None if the slot is empty
+        """
+        try:
+            return await self.store.run(self._pick, reminder_index, cohort, int(time.time()))
+        except sqlite3.Error as e:
+            logger.error(f"Error picking reminder text: {e}")
+            return None
+
+    @staticmethod
+    def _slot_counts(conn: sqlite3.Connection, now: int) -> Dict[Tuple[int, str], int]:
+        """Valid texts per slot; drops expired texts"""
+        conn.execute("DELETE FROM reminder_pool WHERE expires_at <= ?", (now,))
+        return dict(
+            ((reminder_index, cohort), count)
+            for reminder_index, cohort, count in conn.execute(
+                """SELECT reminder_index, cohort, COUNT(*) FROM reminder_pool
+                   GROUP BY reminder_index, cohort"""
+            )
+        )
+
+    async def _missing(self) -> Dict[Tuple[int, str], int]:
+        """Number of texts to generate per slot"""
+        counts = await self.store.run(self._slot_counts, int(time.time()))
+        missing = {}
+        for reminder_index in range(self.reminder_count):
+            for cohort in self.cohorts:
+                count = self.pool_size - counts.get((reminder_index, cohort), 0)
+                if count > 0:
+                    missing[(reminder_index, cohort)] = count
+        return missing
+
+    async def _add(self, reminder_index: int, cohort: str, template: str) -> None:
+        now = int(time.time())
+        await self.store.execute(
+            """INSERT INTO reminder_pool
+               (reminder_index, cohort, template, created_at, expires_at)
+               VALUES (?, ?, ?, ?, ?)""",
+            (reminder_index, cohort, template, now, now + self.ttl)
+        )
+
+    async def _generate_one(self, reminder_index: int, cohort: str) -> bool:
+        try:
+            template = await self.generate(reminder_index, cohort)
+        except Exception as e:
+            logger.error(f"Error generating reminder text ({reminder_index}/{cohort}): {e}")
+            return False
+        if not template or not template.strip():
+            return False
+        await self._add(reminder_index, cohort, template.strip())
+        return True
+
+    async def refill(self) -> int:
+        """
+        Generate texts for every slot below the pool size
+
+        Returns:
+            Number of texts added
+        """
+        try:
+            missing = await self._missing()
+        except sqlite3.Error as e:
+            logger.error(f"Error checking reminder pool: {e}")
+            return 0
+        if not missing:
+            return 0
+
+        start_time = time.time()
+        jobs = [
+            self._generate_one(reminder_index, cohort)
+            for (reminder_index, cohort), count in missing.items()
+            for _ in range(count)
+        ]
+        added = sum(await asyncio.gather(*jobs))
+        logger.info(
+            f"Reminder pool refilled: {added}/{len(jobs)} texts in {time.time() - start_time:.1f}s"
+        )
+        return added
+
+    async def _refill_loop(self) -> None:
+        logger.info("Starting reminder pool refill loop")
+        self.is_running = True
+
+        while self.is_running:
+            try:
+                await self.refill()
+                await asyncio.sleep(self.refill_interval)
+            except asyncio.CancelledError:
+                logger.info("Reminder pool refill loop cancelled")
+                break
+            except Exception as e:
+                logger.error(f"Error in reminder pool refill loop: {e}")
+                await asyncio.sleep(60)  # Sleep for a minute on error
+
+    async def start(self) -> None:
+        """Start refilling the pool in the background"""
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._refill_loop())
+            logger.info("Reminder pool started")
+
+    async def stop(self) -> None:
+        """Stop the background refill"""
+        if self.task and not self.task.done():
+            self.is_running = False
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            logger.info("Reminder pool stopped")
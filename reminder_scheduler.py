@@ -0,0 +1,100 @@
+"""
+Reminder Scheduler for Dostup Bot
+
+In-memory min-heap of upcoming reminder deadlines per user. The reminder
+loop sleeps exactly until the earliest deadline and is woken early when a
+lesson view, purchase or sent reminder changes the schedule, so reminders
+go out within seconds of being due and no database work happens while
+nothing is due.
+"""
+import asyncio
+import heapq
+import logging
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+
+class ReminderScheduler:
+    """Min-heap of (due_at, user_id) with lazy removal of outdated entries"""
+
+    def __init__(self):
+        self._heap: List[Tuple[int, int]] = []
+        self._due: Dict[int, int] = {}  # user_id -> current due_at
+        self._changed = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    def load(self, entries: Iterable[Tuple[int, int]]) -> None:
+        """Replace the schedule with (user_id, due_at) pairs"""
+        self._due = {user_id: due_at for user_id, due_at in entries if due_at is not None}
+        self._heap = [(due_at, user_id) for user_id, due_at in self._due.items()]
+        heapq.heapify(self._heap)
+        self._changed.set()
+        logger.info(f"Reminder schedule loaded with {len(self._due)} users")
+
+    def update(self, user_id: int, due_at: Optional[int]) -> None:
+        """Set (or with None, remove) the next deadline of a user and wake the loop"""
+        if due_at is None:
+            if self._due.pop(user_id, None) is None:
+                return
+        else:
+            if self._due.get(user_id) == due_at:
+                return
+            self._due[user_id] = due_at
+            heapq.heappush(self._heap, (due_at, user_id))
+        self._changed.set()
+
+    def next_due(self) -> Optional[int]:
+        """Earliest current deadline (drops outdated heap entries)"""
+        while self._heap:
+            due_at, user_id = self._heap[0]
+            if self._due.get(user_id) == due_at:
+                return due_at
+            heapq.heappop(self._heap)
+        return None
+
+    def defer_due(self, now: int, delay: int) -> int:
+        """
+        Move deadlines that are still due (e.g. failed sends) `delay` seconds ahead
+
+        Returns:
+            Number of deferred users
+        """
+        deferred = []
+        while True:
+            due_at = self.next_due()
+            if due_at is None or due_at > now:
+                break
+            _, user_id = heapq.heappop(self._heap)
+            deferred.append(user_id)
+        for user_id in deferred:
+            self.update(user_id, now + delay)
+        return len(deferred)
+
+    async def sleep_until_due(self, max_wait: Optional[float] = None) -> bool:
+        """
+        Wait until the earliest deadline has passed
+
+        Returns:
+            True when a deadline is due, False if `max_wait` seconds passed first
+        """
+        give_up_at = None if max_wait is None else time.time() + max_wait
+        while True:
+            self._changed.clear()
+            due_at = self.next_due()
+            now = time.time()
+            if due_at is not None and due_at <= now:
+                return True
+            if give_up_at is not None and give_up_at <= now:
+                return False
+            timeout = None if due_at is None else due_at - now
+            if give_up_at is not None:
+                timeout = give_up_at - now if timeout is None else min(timeout, give_up_at - now)
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
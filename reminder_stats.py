@@ -0,0 +1,244 @@
+"""
+Reminder Statistics for Dostup Bot
+
+Materialized counters for the reminder system. Every write path (lesson
+views, sent reminders, purchases) adds to the counters in the same
+transaction as its own change, so reading the statistics touches a handful
+of small rows instead of scanning lesson_views and reminder_history.
+
+Counters are kept per metric and reminder index (-1 = not tied to a
+reminder), as totals and as daily rollups for trends. Purchases are
+attributed to the last reminder the user received before buying. Sent
+reminders and purchases are also counted per message variant
+(reminder_variants.py), for conversion per variant.
+"""
+import logging
+import sqlite3
+import time
+from typing import Dict, Optional
+
+from reminder_variants import DEFAULT_VARIANT  # also the variant of reminders sent before variants
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Metrics
+VIEWS = "views"  # lesson views (repeat views of a user within one flush count once)
+NEW_USERS = "new_users"
+USERS_WITH_REMINDERS = "users_with_reminders"
+REMINDERS_SENT = "reminders_sent"
+PURCHASES = "purchases"
+
+NO_REMINDER = -1
+TREND_DAYS = 7
+
+
+def day_of(timestamp: int) -> str:
+    """Rollup day (server local time) of a Unix timestamp"""
+    return time.strftime("%Y-%m-%d", time.localtime(timestamp))
+
+
+def create_stats_tables(conn: sqlite3.Connection) -> None:
+    """Create the counter tables; fill them from existing data the first time"""
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS reminder_stats (
+        metric TEXT,
+        reminder_index INTEGER,  -- -1 = not tied to a reminder
+        value INTEGER DEFAULT 0,
+        PRIMARY KEY (metric, reminder_index)
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS reminder_stats_daily (
+        day TEXT,  -- YYYY-MM-DD
+        metric TEXT,
+        reminder_index INTEGER,
+        value INTEGER DEFAULT 0,
+        PRIMARY KEY (day, metric, reminder_index)
+    )
+    ''')
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS reminder_variant_stats (
+        reminder_index INTEGER,
+        variant_id TEXT,
+        sent INTEGER DEFAULT 0,
+        purchases INTEGER DEFAULT 0,  -- purchases after this was the last reminder
+        PRIMARY KEY (reminder_index, variant_id)
+    )
+    ''')
+    if conn.execute("SELECT 1 FROM reminder_stats LIMIT 1").fetchone() is None:
+        _backfill(conn)
+    if conn.execute("SELECT 1 FROM reminder_variant_stats LIMIT 1").fetchone() is None:
+        _backfill_variants(conn)
+
+
+def _backfill(conn: sqlite3.Connection) -> None:
+    """Initialize the counters from lesson_views and reminder_history"""
+    totals = conn.execute(
+        """SELECT COUNT(*),
+                  COALESCE(SUM(last_reminder_index >= 0), 0),
+                  COALESCE(SUM(has_purchased = 1), 0)
+           FROM lesson_views"""
+    ).fetchone()
+    for metric, value in ((NEW_USERS, totals[0]), (USERS_WITH_REMINDERS, totals[1])):
+        _add(conn, "reminder_stats", (metric, NO_REMINDER), value)
+
+    # Purchase times are not stored - attribute them to the last reminder only
+    for reminder_index, value in conn.execute(
+        "SELECT last_reminder_index, COUNT(*) FROM lesson_views WHERE has_purchased = 1 GROUP BY 1"
+    ):
+        _add(conn, "reminder_stats", (PURCHASES, reminder_index), value)
+
+    for sent_time, reminder_index, value in conn.execute(
+        """SELECT MIN(sent_time), reminder_index, COUNT(*) FROM reminder_history
+           GROUP BY date(sent_time, 'unixepoch', 'localtime'), reminder_index"""
+    ).fetchall():
+        _add(conn, "reminder_stats", (REMINDERS_SENT, reminder_index), value)
+        _add(conn, "reminder_stats_daily", (day_of(sent_time), REMINDERS_SENT, reminder_index), value)
+    logger.info(f"Reminder statistics initialized from {totals[0]} users")
+
+
+def _columns(conn: sqlite3.Connection, table: str) -> set:
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+
+def _backfill_variants(conn: sqlite3.Connection) -> None:
+    """Initialize the variant counters; reminders without a variant count as the default"""
+    history_variant = "variant_id" if "variant_id" in _columns(conn, "reminder_history") else "NULL"
+    for reminder_index, variant_id, sent in conn.execute(
+        f"""SELECT reminder_index, COALESCE({history_variant}, ?), COUNT(*) FROM reminder_history
+            GROUP BY 1, 2""",
+        (DEFAULT_VARIANT,)
+    ).fetchall():
+        record_variant(conn, reminder_index, variant_id, sent=sent)
+
+    user_variant = "last_variant_id" if "last_variant_id" in _columns(conn, "lesson_views") else "NULL"
+    for reminder_index, variant_id, purchases in conn.execute(
+        f"""SELECT last_reminder_index, COALESCE({user_variant}, ?), COUNT(*) FROM lesson_views
+            WHERE has_purchased = 1 AND last_reminder_index >= 0 GROUP BY 1, 2""",
+        (DEFAULT_VARIANT,)
+    ).fetchall():
+        record_variant(conn, reminder_index, variant_id, purchases=purchases)
+
+
+def _add(conn: sqlite3.Connection, table: str, key: tuple, value: int) -> None:
+    columns = "metric, reminder_index" if table == "reminder_stats" else "day, metric, reminder_index"
+    conn.execute(
+        f"""INSERT INTO {table} ({columns}, value) VALUES ({', '.join('?' * len(key))}, ?)
+            ON CONFLICT({columns}) DO UPDATE SET value = value + excluded.value""",
+        key + (value,)
+    )
+
+
+def record(conn: sqlite3.Connection, metric: str, timestamp: int, count: int = 1,
+           reminder_index: int = NO_REMINDER) -> None:
+    """
+    Add to a counter and its daily rollup (inside the caller's transaction)
+
+    Args:
+        conn: Connection with the write that is being counted
+        metric: Metric name
+        timestamp: Unix timestamp of the event (selects the day)
+        count: Amount to add
+        reminder_index: Reminder the event belongs to
+    """
+    if count:
+        _add(conn, "reminder_stats", (metric, reminder_index), count)
+        _add(conn, "reminder_stats_daily", (day_of(timestamp), metric, reminder_index), count)
+
+
+def record_variant(conn: sqlite3.Connection, reminder_index: int, variant_id: str,
+                   sent: int = 0, purchases: int = 0) -> None:
+    """Add sent reminders and purchases to a variant (inside the caller's transaction)"""
+    if sent or purchases:
+        conn.execute(
+            """INSERT INTO reminder_variant_stats (reminder_index, variant_id, sent, purchases)
+               VALUES (?, ?, ?, ?)
+               ON CONFLICT(reminder_index, variant_id) DO UPDATE
+               SET sent = sent + excluded.sent, purchases = purchases + excluded.purchases""",
+            (reminder_index, variant_id, sent, purchases)
+        )
+
+
+def read_stats(conn: sqlite3.Connection, days: int = TREND_DAYS,
+               now: Optional[int] = None) -> Dict:
+    """
+    Statistics from the counters (cost independent of the number of users)
+
+    Returns:
+        Dict with totals, per-reminder and per-variant conversion
+        ("by_reminder", "by_variant") and daily trends for the last `days`
+        days ("daily", oldest first)
+    """
+    totals: Dict[str, Dict[int, int]] = {}
+    for metric, reminder_index, value in conn.execute(
+        "SELECT metric, reminder_index, value FROM reminder_stats"
+    ):
+        totals.setdefault(metric, {})[reminder_index] = value
+
+    def total(metric: str) -> int:
+        return sum(totals.get(metric, {}).values())
+
+    stats = {
+        "total_users": total(NEW_USERS),
+        "users_with_reminders": total(USERS_WITH_REMINDERS),
+        "reminders_sent": total(REMINDERS_SENT),
+        "purchases": total(PURCHASES),
+        "conversion_rate": 0.0,
+    }
+    if stats["total_users"] > 0:
+        stats["conversion_rate"] = (stats["purchases"] / stats["total_users"]) * 100
+
+    by_reminder = []
+    reminder_indexes = set(totals.get(REMINDERS_SENT, {})) | set(totals.get(PURCHASES, {}))
+    for reminder_index in sorted(reminder_indexes):
+        sent = totals.get(REMINDERS_SENT, {}).get(reminder_index, 0)
+        purchases = totals.get(PURCHASES, {}).get(reminder_index, 0)
+        by_reminder.append({
+            "reminder_index": reminder_index,
+            "sent": sent,
+            "purchases": purchases,
+            "conversion_rate": (purchases / sent * 100) if sent else 0.0,
+        })
+    stats["by_reminder"] = by_reminder
+
+    # Conversion per message sent, for comparing the variants of a reminder
+    stats["by_variant"] = [
+        {
+            "reminder_index": reminder_index,
+            "variant_id": variant_id,
+            "sent": sent,
+            "purchases": purchases,
+            "conversion_rate": (purchases / sent * 100) if sent else 0.0,
+        }
+        for reminder_index, variant_id, sent, purchases in conn.execute(
+            """SELECT reminder_index, variant_id, sent, purchases FROM reminder_variant_stats
+               ORDER BY reminder_index, variant_id"""
+        )
+    ]
+
+    now = int(time.time()) if now is None else now
+    day_list = [day_of(now - offset * 24 * 60 * 60) for offset in range(days - 1, -1, -1)]
+    daily = {day: {"day": day, VIEWS: 0, NEW_USERS: 0, REMINDERS_SENT: 0, PURCHASES: 0} for day in day_list}
+    for day, metric, value in conn.execute(
+        """SELECT day, metric, SUM(value) FROM reminder_stats_daily
+           WHERE day >= ? GROUP BY day, metric""",
+        (day_list[0],)
+    ):
+        if day in daily and metric in daily[day]:
+            daily[day][metric] = value
+    stats["daily"] = [daily[day] for day in day_list]
+    return stats
+
+
+def empty_stats() -> Dict:
+    return {
+        "total_users": 0,
+        "users_with_reminders": 0,
+        "reminders_sent": 0,
+        "purchases": 0,
+        "conversion_rate": 0.0,
+        "by_reminder": [],
+        "by_variant": [],
+        "daily": [],
+    }
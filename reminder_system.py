@@ -3,22 +3,60 @@ Reminder System for Dostup Bot
 
 This module handles tracking users who viewed free lessons and sending
 reminder messages at configured intervals to encourage course purchases.
+Due reminders are claimed in batches under a lease, so several workers
+(or a separate reminder_worker.py process) can share one database without
+sending a reminder twice.
+AI reminder texts come from a pre-generated pool (see reminder_pool.py),
+so sending never waits on OpenAI. All database access goes through the
+shared WAL connection of sqlite_store.py, off the event loop. Sends go
+through a transactional outbox (reminder_outbox.py), so a crash between the
+Telegram call and the database write does not send a reminder twice.
+Each reminder slot can have weighted A/B variants (reminder_variants.py).
+Reminders are only sent inside each user's daily send window
+(reminder_windows.py); due times outside it are deferred into the next one.
 """
 import asyncio
 import datetime
 import logging
 import os
+import socket
 import sqlite3
 import time
+import uuid
 from typing import Dict, List, Optional, Tuple, Any
 
 from aiogram import Bot
 import openai
 
+from assistant_runs import RUN_DEADLINE, RunManager, RunTimeoutError
+from reminder_dispatcher import PERMANENT_ERRORS, ReminderDispatcher
+from reminder_outbox import begin_send, create_outbox_table, enqueue, mark_failed, mark_sent, purge, stale_sends
+from reminder_pool import COHORT_ON_TIME, ReminderPool, cohort_for, render
+from reminder_scheduler import ReminderScheduler
+from reminder_stats import (NEW_USERS, PURCHASES, REMINDERS_SENT, USERS_WITH_REMINDERS, VIEWS,
+                            create_stats_tables, empty_stats, read_stats, record, record_variant)
+from reminder_variants import (DEFAULT_VARIANT, REMINDER_VARIANTS, Variant, apply_variants, assign_variant,
+                               parse_variants_config, slot_variants)
+from reminder_windows import SendWindows
+from sqlite_store import SqliteStore
+
 # Setup logging
 logger = logging.getLogger(__name__)
 
 # Configuration
+REMINDER_RETRY_DELAY = 5 * 60  # seconds before a reminder that failed to send is retried
+# Users behind schedule get their next reminder no sooner than this after the previous one
+REMINDER_MIN_GAP = max(1, int(os.getenv("REMINDER_MIN_GAP", str(24 * 60 * 60))))  # seconds
+# Due reminders are claimed in batches; a claim not acknowledged within the lease
+# (crashed worker, failed send) is taken over by the next claim after it expires
+REMINDER_CLAIM_BATCH = int(os.getenv("REMINDER_CLAIM_BATCH", "100"))
+REMINDER_LEASE = int(os.getenv("REMINDER_LEASE", str(REMINDER_RETRY_DELAY)))  # seconds
+OUTBOX_RETENTION_DAYS = int(os.getenv("REMINDER_OUTBOX_RETENTION_DAYS", "30"))  # finished outbox rows
+# Seconds between schedule reloads when other processes write the database (0 = never)
+REMINDER_RESYNC_INTERVAL = int(os.getenv("REMINDER_RESYNC_INTERVAL", "0"))
+# Lesson views are buffered in memory and written in one transaction per batch
+VIEW_FLUSH_SIZE = int(os.getenv("REMINDER_VIEW_FLUSH_SIZE", "500"))  # views per batch
+VIEW_FLUSH_INTERVAL = float(os.getenv("REMINDER_VIEW_FLUSH_INTERVAL", "2"))  # seconds
 DEFAULT_REMINDER_INTERVALS = [
     {"days": 1, "template": "Привет! Как тебе бесплатный урок? Готов ли ты углубиться в тему и получить полный доступ к курсу?"},
     {"days": 3, "template": "Здравствуй! Прошло несколько дней с того момента, как ты посмотрел наш бесплатный урок. Не хочешь получить доступ к полному курсу, чтобы узнать все секреты?"},
@@ -30,135 +68,354 @@ class ReminderSystem:
     
     def __init__(self, bot: Bot, db_path: str = "reminder_data.db", 
                  reminder_intervals: List[Dict[str, Any]] = None,
-                 openai_client = None, openai_assistant_id: str = None):
+                 openai_client = None, openai_assistant_id: str = None,
+                 resync_interval: int = REMINDER_RESYNC_INTERVAL,
+                 send_windows: SendWindows = None,
+                 reminder_variants: str = REMINDER_VARIANTS):
         """
         Initialize the reminder system
         
         Args:
             bot: Aiogram Bot instance for sending messages
             db_path: Path to the SQLite database file
-            reminder_intervals: List of dicts with 'days' and 'template' keys
-            openai_client: Optional OpenAI client for AI-generated reminders
+            reminder_intervals: List of dicts with 'days' and 'template' keys and
+                optional weighted 'variants' (see reminder_variants.py)
+            openai_client: Optional AsyncOpenAIClient for AI-generated reminders
             openai_assistant_id: Optional OpenAI Assistant ID
+            resync_interval: Seconds between schedule reloads from the database, for
+                when other processes record views or send reminders (0 = never)
+            send_windows: Daily send windows (default: from the environment)
+            reminder_variants: JSON (or JSON file) of variants by reminder index,
+                replacing those of `reminder_intervals` (see reminder_variants.py)
         """
         self.bot = bot
         self.db_path = db_path
-        self.reminder_intervals = reminder_intervals or DEFAULT_REMINDER_INTERVALS
+        self.reminder_intervals = apply_variants(reminder_intervals or DEFAULT_REMINDER_INTERVALS,
+                                                 parse_variants_config(reminder_variants))
+        self.variants = [slot_variants(interval) for interval in self.reminder_intervals]
         self.openai_client = openai_client
         self.openai_assistant_id = openai_assistant_id
         self.is_running = False
         self.task = None
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.resync_interval = resync_interval
+        self.scheduler = ReminderScheduler()
+        self.windows = send_windows or SendWindows()
+        # send_window(due, window_start, user_id) keeps SQL-computed due times in the window
+        self.store = SqliteStore(db_path, functions={"send_window": (3, self.windows.defer)})
+        # Write-behind buffer: user_id -> (username, first_name, last_name, language_code, view_time)
+        self._pending_views: Dict[int, Tuple[Optional[str], Optional[str], Optional[str], Optional[str], int]] = {}
+        self._flush_tasks = set()
+        self.flush_task = None
+        self._upsert_view_sql = self._build_upsert_view_sql()
+        self.dispatcher = ReminderDispatcher(
+            send=lambda user_id, reminder_index: self._deliver_reminder(
+                user_id, reminder_index, use_ai=self.pool is not None
+            ),
+            on_permanent_failure=self.mark_user_blocked
+        )
         self._init_db()
         
+        # Pool of pre-generated AI texts, refilled in the background
+        self.pool = None
+        self.run_manager = None
+        if self.openai_client and self.openai_assistant_id:
+            self.run_manager = RunManager(self.openai_client, call_site="reminder")
+            self.pool = ReminderPool(
+                store=self.store,
+                generate=self._generate_reminder_template,
+                reminder_count=len(self.reminder_intervals)
+            )
+        
         logger.info(f"Reminder system initialized with {len(self.reminder_intervals)} intervals")
     
     def _init_db(self) -> None:
         """Initialize the SQLite database with required tables"""
         try:
-            # Ensure the directory for the database file exists
-            db_dir = os.path.dirname(os.path.abspath(self.db_path))
-            try:
-                if not os.path.exists(db_dir):
-                    os.makedirs(db_dir, exist_ok=True)
-                    logger.debug(f"Created directory for database: {db_dir}")
-            except Exception as dir_error:
-                logger.warning(f"Could not create database directory: {dir_error}")
-            
-            # Now connect and initialize tables
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                # Create table for tracking lesson views and reminders
-                cursor.execute('''
-                CREATE TABLE IF NOT EXISTS lesson_views (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    first_name TEXT,
-                    last_name TEXT,
-                    view_time INTEGER,  -- Unix timestamp
-                    has_purchased INTEGER DEFAULT 0,  -- Boolean flag
-                    last_reminder_index INTEGER DEFAULT -1  -- Last reminder sent (-1 = none)
-                )
-                ''')
-                
-                # Create table for reminder history
-                cursor.execute('''
-                CREATE TABLE IF NOT EXISTS reminder_history (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    reminder_index INTEGER,
-                    sent_time INTEGER,  -- Unix timestamp
-                    was_ai_generated INTEGER DEFAULT 0,  -- Boolean flag
-                    FOREIGN KEY (user_id) REFERENCES lesson_views(user_id)
-                )
-                ''')
-                conn.commit()
-                logger.debug(f"Database initialized successfully at {self.db_path}")
+            self.store.run_sync(self._create_tables)
+            logger.debug(f"Database initialized successfully at {self.db_path}")
         except sqlite3.Error as e:
             logger.error(f"Database initialization error: {e}")
             logger.warning("Reminder system will operate in limited mode without database")
     
+    def _create_tables(self, conn: sqlite3.Connection) -> None:
+        cursor = conn.cursor()
+        # Create table for tracking lesson views and reminders
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS lesson_views (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            view_time INTEGER,  -- Unix timestamp
+            has_purchased INTEGER DEFAULT 0,  -- Boolean flag
+            last_reminder_index INTEGER DEFAULT -1,  -- Last reminder sent (-1 = none)
+            next_reminder_at INTEGER,  -- Unix timestamp of the next reminder (NULL = none)
+            is_blocked INTEGER DEFAULT 0,  -- Boolean flag: user cannot be messaged
+            claimed_by TEXT,  -- Worker sending the due reminder (NULL = unclaimed)
+            lease_until INTEGER,  -- Unix timestamp the claim expires
+            last_variant_id TEXT,  -- Variant of the last reminder sent
+            language_code TEXT,  -- Telegram language code
+            send_window_start INTEGER,  -- Minute of the UTC day the send window opens (NULL = any time)
+            last_reminder_at INTEGER  -- Unix timestamp the last reminder was sent
+        )
+        ''')
+        self._migrate_lesson_views(cursor)
+        # Covering index for the due-reminder query
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_lesson_views_due
+        ON lesson_views (has_purchased, next_reminder_at, last_reminder_index, view_time)
+        ''')
+        
+        # Create table for reminder history
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS reminder_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            reminder_index INTEGER,
+            sent_time INTEGER,  -- Unix timestamp
+            was_ai_generated INTEGER DEFAULT 0,  -- Boolean flag
+            variant_id TEXT,  -- Message variant (see reminder_variants.py)
+            FOREIGN KEY (user_id) REFERENCES lesson_views(user_id)
+        )
+        ''')
+        columns = [row[1] for row in cursor.execute("PRAGMA table_info(reminder_history)")]
+        if "variant_id" not in columns:
+            logger.info("Migrating reminder_history: adding variant_id")
+            cursor.execute("ALTER TABLE reminder_history ADD COLUMN variant_id TEXT")
+        
+        # Outbox of reminder sends (idempotency keys and send states)
+        create_outbox_table(conn)
+        
+        # Materialized counters, kept up to date by every write below
+        create_stats_tables(conn)
+    
+    def _migrate_lesson_views(self, cursor: sqlite3.Cursor) -> None:
+        """Add columns missing in databases created by older versions"""
+        columns = [row[1] for row in cursor.execute("PRAGMA table_info(lesson_views)")]
+        if "is_blocked" not in columns:
+            logger.info("Migrating lesson_views: adding is_blocked")
+            cursor.execute("ALTER TABLE lesson_views ADD COLUMN is_blocked INTEGER DEFAULT 0")
+        if "claimed_by" not in columns:
+            logger.info("Migrating lesson_views: adding claimed_by, lease_until")
+            cursor.execute("ALTER TABLE lesson_views ADD COLUMN claimed_by TEXT")
+            cursor.execute("ALTER TABLE lesson_views ADD COLUMN lease_until INTEGER")
+        if "last_variant_id" not in columns:
+            logger.info("Migrating lesson_views: adding last_variant_id")
+            cursor.execute("ALTER TABLE lesson_views ADD COLUMN last_variant_id TEXT")
+        if "send_window_start" not in columns:
+            logger.info("Migrating lesson_views: adding language_code, send_window_start")
+            cursor.execute("ALTER TABLE lesson_views ADD COLUMN language_code TEXT")
+            cursor.execute("ALTER TABLE lesson_views ADD COLUMN send_window_start INTEGER")
+            # Windows of existing users follow their last lesson view
+            cursor.execute("SELECT user_id, view_time FROM lesson_views")
+            cursor.executemany(
+                "UPDATE lesson_views SET send_window_start = ? WHERE user_id = ?",
+                [(self.windows.window_start(view_time), user_id) for user_id, view_time in cursor.fetchall()]
+            )
+        if "last_reminder_at" not in columns:
+            logger.info("Migrating lesson_views: adding last_reminder_at")
+            cursor.execute("ALTER TABLE lesson_views ADD COLUMN last_reminder_at INTEGER")
+            history = cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'reminder_history'"
+            ).fetchone()
+            if history:
+                cursor.execute(
+                    """UPDATE lesson_views SET last_reminder_at = (
+                           SELECT MAX(sent_time) FROM reminder_history
+                           WHERE reminder_history.user_id = lesson_views.user_id
+                       ) WHERE last_reminder_index >= 0"""
+                )
+        if "next_reminder_at" not in columns:
+            logger.info("Migrating lesson_views: adding next_reminder_at")
+            cursor.execute("ALTER TABLE lesson_views ADD COLUMN next_reminder_at INTEGER")
+        if {"send_window_start", "last_reminder_at", "next_reminder_at"}.issubset(columns):
+            return
+        
+        # Reschedule with the send windows and the gap after the last reminder
+        cursor.execute(
+            """SELECT user_id, view_time, last_reminder_index, send_window_start, last_reminder_at
+               FROM lesson_views WHERE has_purchased = 0 AND is_blocked = 0"""
+        )
+        updates = [
+            (self._next_reminder_at(view_time, last_reminder_index, send_window_start, user_id,
+                                    last_reminder_at), user_id)
+            for user_id, view_time, last_reminder_index, send_window_start, last_reminder_at in cursor.fetchall()
+        ]
+        cursor.executemany("UPDATE lesson_views SET next_reminder_at = ? WHERE user_id = ?", updates)
+        logger.info(f"Backfilled next_reminder_at for {len(updates)} users")
+    
+    def _next_reminder_offset(self, last_reminder_index: int) -> Optional[int]:
+        """
+        Seconds after the lesson view when the next reminder is due
+        
+        Returns:
+            Offset in seconds or None if all reminders have been sent
+        """
+        next_reminder_index = last_reminder_index + 1
+        if next_reminder_index >= len(self.reminder_intervals):
+            return None
+        return int(self.reminder_intervals[next_reminder_index]["days"] * 60 * 60 * 24)
+    
+    def _next_reminder_at(self, view_time: Optional[int], last_reminder_index: int,
+                          send_window_start: Optional[int] = None, user_id: int = 0,
+                          last_reminder_at: Optional[int] = None) -> Optional[int]:
+        """
+        Time the next reminder is due, inside the user's send window
+        
+        Users behind schedule (e.g. a late first view of an old database)
+        get it REMINDER_MIN_GAP after the previous reminder at the earliest,
+        instead of receiving the reminders they missed back to back.
+        
+        Returns:
+            Unix timestamp or None if all reminders have been sent
+        """
+        offset = self._next_reminder_offset(last_reminder_index)
+        if view_time is None or offset is None:
+            return None
+        due = view_time + offset
+        if last_reminder_at is not None:
+            due = max(due, last_reminder_at + REMINDER_MIN_GAP)
+        return self.windows.defer(due, send_window_start, user_id)
+    
+    def _build_upsert_view_sql(self) -> str:
+        """UPSERT of a lesson view; the next reminder follows the stored last_reminder_index"""
+        offsets = " ".join(
+            f"WHEN {index} THEN {self._next_reminder_offset(index)}"
+            for index in range(-1, len(self.reminder_intervals) - 1)
+        )
+        return f"""INSERT INTO lesson_views 
+                   (user_id, username, first_name, last_name, language_code, send_window_start,
+                    view_time, next_reminder_at) 
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(user_id) DO UPDATE SET
+                       view_time = excluded.view_time, username = excluded.username,
+                       first_name = excluded.first_name, last_name = excluded.last_name,
+                       language_code = COALESCE(excluded.language_code, lesson_views.language_code),
+                       send_window_start = excluded.send_window_start,
+                       next_reminder_at = CASE WHEN lesson_views.has_purchased = 1 THEN NULL
+                           ELSE send_window(
+                               MAX(excluded.view_time + (CASE lesson_views.last_reminder_index {offsets} END),
+                                   COALESCE(lesson_views.last_reminder_at + {REMINDER_MIN_GAP}, 0)),
+                               excluded.send_window_start, excluded.user_id
+                           )
+                       END,
+                       is_blocked = 0"""
+    
+    def _write_views(self, conn: sqlite3.Connection,
+                     views: Dict[int, Tuple[Optional[str], Optional[str], Optional[str], Optional[str], int]]
+                     ) -> List[Tuple[int, Optional[int]]]:
+        """
+        Write a batch of lesson views in one transaction
+        
+        Returns:
+            List of tuples (user_id, next_reminder_at) for the scheduler
+        """
+        user_ids = list(views)
+        existing = 0
+        for start in range(0, len(user_ids), 500):
+            chunk = user_ids[start:start + 500]
+            existing += conn.execute(
+                f"SELECT COUNT(*) FROM lesson_views WHERE user_id IN ({','.join('?' * len(chunk))})",
+                chunk
+            ).fetchone()[0]
+        
+        rows = []
+        for user_id, (username, first_name, last_name, language_code, view_time) in views.items():
+            # The window follows the user's latest activity (or their language)
+            window_start = self.windows.window_start(view_time, language_code)
+            rows.append((user_id, username, first_name, last_name, language_code, window_start, view_time,
+                         self._next_reminder_at(view_time, -1, window_start, user_id)))
+        conn.executemany(self._upsert_view_sql, rows)
+        flush_time = max(view[-1] for view in views.values())
+        record(conn, VIEWS, flush_time, len(views))
+        record(conn, NEW_USERS, flush_time, len(views) - existing)
+        
+        schedule = []
+        for start in range(0, len(user_ids), 500):
+            chunk = user_ids[start:start + 500]
+            schedule.extend(conn.execute(
+                f"SELECT user_id, next_reminder_at FROM lesson_views "
+                f"WHERE user_id IN ({','.join('?' * len(chunk))})",
+                chunk
+            ))
+        return schedule
+    
+    async def flush_views(self) -> int:
+        """
+        Write all buffered lesson views to the database
+        
+        Returns:
+            Number of users written
+        """
+        if not self._pending_views:
+            return 0
+        views, self._pending_views = self._pending_views, {}
+        start_time = time.perf_counter()
+        try:
+            schedule = await self.store.run(self._write_views, views)
+        except sqlite3.Error as e:
+            logger.error(f"Database error writing {len(views)} lesson views: {e}")
+            # Keep them for the next flush unless the user has viewed again meanwhile
+            for user_id, view in views.items():
+                self._pending_views.setdefault(user_id, view)
+            return 0
+        for user_id, next_reminder_at in schedule:
+            self.scheduler.update(user_id, next_reminder_at)
+        logger.debug(f"Flushed {len(views)} lesson views in {(time.perf_counter() - start_time) * 1000:.1f}ms")
+        return len(views)
+    
+    def _schedule_flush(self) -> None:
+        """Flush in the background once the buffer is full"""
+        task = asyncio.create_task(self.flush_views())
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+    
+    async def _flush_pending_view(self, user_id: int) -> None:
+        """Write a buffered view of a user (and batches in flight) before its row is changed"""
+        if self._flush_tasks:
+            await asyncio.gather(*self._flush_tasks, return_exceptions=True)
+        if user_id in self._pending_views:
+            await self.flush_views()
+    
+    async def _flush_loop(self) -> None:
+        """Flush buffered lesson views every VIEW_FLUSH_INTERVAL seconds"""
+        while True:
+            try:
+                await asyncio.sleep(VIEW_FLUSH_INTERVAL)
+                await self.flush_views()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error flushing lesson views: {e}")
+    
     async def track_lesson_view(self, user_id: int, username: str = None, 
-                               first_name: str = None, last_name: str = None) -> None:
+                               first_name: str = None, last_name: str = None,
+                               language_code: str = None) -> None:
         """
         Record that a user has viewed the free lesson
         
+        The view is buffered in memory (repeated views of a user coalesce) and
+        written by the next flush, so this never waits on the database.
+        
         Args:
             user_id: Telegram user ID
             username: Optional Telegram username
             first_name: Optional user first name
             last_name: Optional user last name
+            language_code: Optional Telegram language code (selects the send window)
         """
         logger.debug(f"Recording lesson view for user {user_id}")
-        current_time = int(time.time())
         
         # Make sure we have a valid user_id
         if not user_id:
             logger.error("Cannot track lesson view: user_id is required")
             return
-            
-        try:
-            # Verify database path exists
-            db_dir = os.path.dirname(os.path.abspath(self.db_path))
-            if not os.path.exists(db_dir):
-                try:
-                    os.makedirs(db_dir, exist_ok=True)
-                    logger.debug(f"Created directory for database: {db_dir}")
-                except Exception as dir_error:
-                    logger.error(f"Could not create database directory: {dir_error}")
-                    return
-                    
-            # Connect to database and record view
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                # Check if user already exists
-                cursor.execute(
-                    "SELECT user_id FROM lesson_views WHERE user_id = ?", 
-                    (user_id,)
-                )
-                if cursor.fetchone():
-                    # Update existing record
-                    cursor.execute(
-                        """UPDATE lesson_views 
-                           SET view_time = ?, username = ?, first_name = ?, last_name = ? 
-                           WHERE user_id = ?""",
-                        (current_time, username, first_name, last_name, user_id)
-                    )
-                    logger.debug(f"Updated existing record for user {user_id}")
-                else:
-                    # Create new record
-                    cursor.execute(
-                        """INSERT INTO lesson_views 
-                           (user_id, username, first_name, last_name, view_time) 
-                           VALUES (?, ?, ?, ?, ?)""",
-                        (user_id, username, first_name, last_name, current_time)
-                    )
-                    logger.debug(f"Created new record for user {user_id}")
-                conn.commit()
-                logger.info(f"Successfully recorded lesson view for user {user_id}")
-        except sqlite3.Error as e:
-            logger.error(f"Database error tracking lesson view: {e}")
-        except Exception as e:
-            logger.error(f"Unexpected error tracking lesson view: {e}")
+        
+        self._pending_views[user_id] = (username, first_name, last_name, language_code, int(time.time()))
+        # One size-triggered flush at a time; views arriving meanwhile join the next batch
+        if len(self._pending_views) >= VIEW_FLUSH_SIZE and not self._flush_tasks:
+            self._schedule_flush()
     
     async def mark_user_purchased(self, user_id: int) -> None:
         """
@@ -168,99 +425,201 @@ class ReminderSystem:
             user_id: Telegram user ID
         """
         logger.debug(f"Marking user {user_id} as purchased")
+        # A buffered view written later must not resurrect reminders
+        await self._flush_pending_view(user_id)
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    "UPDATE lesson_views SET has_purchased = 1 WHERE user_id = ?",
-                    (user_id,)
-                )
-                conn.commit()
-                logger.debug(f"User {user_id} marked as purchased")
+            await self.store.run(self._record_purchase, user_id, int(time.time()))
+            self.scheduler.update(user_id, None)
+            logger.debug(f"User {user_id} marked as purchased")
         except sqlite3.Error as e:
             logger.error(f"Error marking purchase: {e}")
     
-    async def _get_users_needing_reminders(self) -> List[Tuple[int, int, int]]:
+    def _record_purchase(self, conn: sqlite3.Connection, user_id: int, current_time: int) -> bool:
+        """
+        Mark a user as purchased and count the purchase once
+        
+        Returns:
+            True if the user had not purchased before
+        """
+        row = conn.execute(
+            """SELECT last_reminder_index, last_variant_id FROM lesson_views
+               WHERE user_id = ? AND has_purchased = 0""",
+            (user_id,)
+        ).fetchone()
+        if row is None:
+            return False
+        conn.execute(
+            "UPDATE lesson_views SET has_purchased = 1, next_reminder_at = NULL WHERE user_id = ?",
+            (user_id,)
+        )
+        # Attributed to the last reminder the user received (-1 = none)
+        record(conn, PURCHASES, current_time, reminder_index=row[0])
+        if row[0] >= 0:
+            record_variant(conn, row[0], row[1] or DEFAULT_VARIANT, purchases=1)
+        return True
+    
+    async def mark_user_blocked(self, user_id: int, reason: Exception = None) -> None:
+        """
+        Stop reminders for a user the bot cannot message (blocked, deleted, ...)
+        
+        Args:
+            user_id: Telegram user ID
+            reason: Optional error that revealed it
+        """
+        logger.info(f"Marking user {user_id} as unreachable: {reason}")
+        await self._flush_pending_view(user_id)
+        try:
+            await self.store.execute(
+                "UPDATE lesson_views SET is_blocked = 1, next_reminder_at = NULL WHERE user_id = ?",
+                (user_id,)
+            )
+            self.scheduler.update(user_id, None)
+        except sqlite3.Error as e:
+            logger.error(f"Error marking user blocked: {e}")
+    
+    def _claim_due(self, conn: sqlite3.Connection, current_time: int, limit: int,
+                   due_before: Optional[int] = None) -> Tuple[int, List[Tuple[int, int, int]]]:
         """
-        Get list of users who need reminders
+        Claim a batch of due reminders for this worker (runs on the store thread)
+        
+        BEGIN IMMEDIATE takes the write lock before reading, so concurrent
+        workers - also in other processes - never claim the same row. The
+        claimed reminders are added to the outbox in the same transaction.
+        Only reminders due at `due_before` (default: now) are claimed.
         
         Returns:
-            List of tuples (user_id, last_reminder_index, view_time)
+            Tuple (number of claimed rows, sendable reminders); rows without a
+            sendable reminder are claimed too, so the count can be larger
         """
-        current_time = int(time.time())
+        if due_before is None:
+            due_before = current_time
+        conn.execute("BEGIN IMMEDIATE")
+        # Sends of dead workers first: they advance their users past the reminder
+        self._recover_stale_sends(conn, current_time)
+        # Only rows that are due are read (idx_lesson_views_due)
+        rows = conn.execute(
+            """SELECT user_id, last_reminder_index, view_time 
+               FROM lesson_views 
+               WHERE has_purchased = 0 AND next_reminder_at <= ?
+                 AND (lease_until IS NULL OR lease_until <= ?)
+               ORDER BY next_reminder_at
+               LIMIT ?""",
+            (due_before, current_time, limit)
+        ).fetchall()
+        conn.executemany(
+            "UPDATE lesson_views SET claimed_by = ?, lease_until = ? WHERE user_id = ?",
+            [(self.worker_id, current_time + REMINDER_LEASE, user_id) for user_id, _, _ in rows]
+        )
+        
         users_needing_reminders = []
+        for user_id, last_reminder_index, view_time in rows:
+            next_reminder_index = last_reminder_index + 1
+            if next_reminder_index >= len(self.reminder_intervals):
+                continue  # All reminders already sent
+            users_needing_reminders.append((user_id, next_reminder_index, view_time))
+            logger.debug(f"User {user_id} needs reminder {next_reminder_index}")
+        
+        # Reminders already being sent keep their claim until it expires
+        sendable = set(enqueue(
+            conn, [(user_id, reminder_index) for user_id, reminder_index, _ in users_needing_reminders],
+            current_time
+        ))
+        return len(rows), [user for user in users_needing_reminders if (user[0], user[1]) in sendable]
+    
+    def _recover_stale_sends(self, conn: sqlite3.Connection, current_time: int) -> int:
+        """
+        Settle outbox rows left in "sending" by a worker that died mid-send
+        
+        Whether Telegram delivered them is unknown; they are recorded as sent
+        (at most once) rather than sent a second time.
         
+        Returns:
+            Number of recovered sends
+        """
+        stale = stale_sends(conn, current_time - REMINDER_LEASE)
+        for user_id, reminder_index, was_ai_generated, sent_time in stale:
+            # Assignment is deterministic, so the variant is the one that was being sent
+            self._record_reminder_sent(conn, user_id, reminder_index, was_ai_generated, sent_time,
+                                       self._variant_for(user_id, reminder_index).id)
+            logger.warning(f"Recovered unconfirmed reminder {reminder_index} to user {user_id} as sent")
+        return len(stale)
+    
+    def _recover_outbox(self, conn: sqlite3.Connection, current_time: int) -> Tuple[int, int]:
+        """Startup recovery: settle stale sends and purge old finished rows"""
+        recovered = self._recover_stale_sends(conn, current_time)
+        purged = purge(conn, current_time - OUTBOX_RETENTION_DAYS * 24 * 60 * 60)
+        return recovered, purged
+    
+    async def recover_outbox(self) -> None:
+        """Recover the outbox left behind by a previous run"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    """SELECT user_id, last_reminder_index, view_time 
-                       FROM lesson_views 
-                       WHERE has_purchased = 0"""
-                )
-                for user_id, last_reminder_index, view_time in cursor.fetchall():
-                    next_reminder_index = last_reminder_index + 1
-                    if next_reminder_index >= len(self.reminder_intervals):
-                        continue  # All reminders already sent
-                    
-                    # Calculate time since view
-                    days_since_view = (current_time - view_time) / (60 * 60 * 24)
-                    days_needed = self.reminder_intervals[next_reminder_index]["days"]
-                    
-                    if days_since_view >= days_needed:
-                        users_needing_reminders.append((user_id, next_reminder_index, view_time))
-                        logger.debug(f"User {user_id} needs reminder {next_reminder_index}")
+            recovered, purged = await self.store.run(self._recover_outbox, int(time.time()))
+        except sqlite3.Error as e:
+            logger.error(f"Error recovering reminder outbox: {e}")
+            return
+        if recovered or purged:
+            logger.info(f"Reminder outbox: recovered {recovered} unconfirmed sends, purged {purged} old rows")
+    
+    async def _claim_users_needing_reminders(self, limit: int = REMINDER_CLAIM_BATCH,
+                                             due_before: Optional[int] = None
+                                             ) -> Tuple[int, List[Tuple[int, int, int]]]:
+        """
+        Claim users who need reminders (at most `limit`)
+        
+        Args:
+            limit: Maximum number of users to claim
+            due_before: Only claim reminders due at this Unix timestamp (default: now)
+        
+        Returns:
+            Tuple (number of claimed rows, list of tuples (user_id, next_reminder_index, view_time))
+        """
+        try:
+            return await self.store.run(self._claim_due, int(time.time()), limit, due_before)
         except sqlite3.Error as e:
-            logger.error(f"Error getting users needing reminders: {e}")
+            logger.error(f"Error claiming users needing reminders: {e}")
+            return 0, []
+    
+    async def _release_claims(self) -> int:
+        """
+        Give up the unacknowledged claims of this worker (e.g. on shutdown)
         
-        return users_needing_reminders
+        Returns:
+            Number of released claims
+        """
+        try:
+            return await self.store.execute(
+                "UPDATE lesson_views SET claimed_by = NULL, lease_until = NULL WHERE claimed_by = ?",
+                (self.worker_id,)
+            )
+        except sqlite3.Error as e:
+            logger.error(f"Error releasing reminder claims: {e}")
+            return 0
     
-    async def _generate_ai_reminder(self, user_id: int, reminder_index: int) -> str:
+    async def _generate_reminder_template(self, reminder_index: int, cohort: str) -> Optional[str]:
         """
-        Generate a personalized reminder message using OpenAI
+        Generate a reminder text template for the pool using OpenAI
         
         Args:
-            user_id: Telegram user ID
             reminder_index: Index of the reminder (determines tone and urgency)
+            cohort: Reminder pool cohort ("on_time" or "late")
             
         Returns:
-            AI-generated reminder message
+            AI-generated text with a {first_name} placeholder, or None on failure
         """
         if not self.openai_client or not self.openai_assistant_id:
-            return self.reminder_intervals[reminder_index]["template"]
+            return None
         
         try:
-            logger.debug(f"Generating AI reminder for user {user_id}, index {reminder_index}")
+            logger.debug(f"Generating AI reminder template, index {reminder_index}, cohort {cohort}")
+            days = self.reminder_intervals[reminder_index]["days"]
+            days_text = f"{days}" if cohort == COHORT_ON_TIME else f"больше {days}"
             
-            # Get user data
-            user_info = {}
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute(
-                    "SELECT username, first_name, last_name, view_time FROM lesson_views WHERE user_id = ?",
-                    (user_id,)
-                )
-                result = cursor.fetchone()
-                if result:
-                    username, first_name, last_name, view_time = result
-                    user_info = {
-                        "username": username,
-                        "first_name": first_name,
-                        "last_name": last_name,
-                        "days_since_view": (int(time.time()) - view_time) / (60 * 60 * 24)
-                    }
-            
-            # Create a thread
-            thread = self.openai_client.beta.threads.create()
-            
-            # Add message to the thread
             prompt_text = f"""
             Сгенерируй напоминание для пользователя, который посмотрел бесплатный урок нашего курса,
             но еще не купил полный курс. Это {reminder_index + 1}-е напоминание.
             
-            Информация о пользователе:
-            Имя: {user_info.get("first_name", "Пользователь")}
-            Прошло дней с просмотра урока: {user_info.get("days_since_view", "несколько")}
+            Прошло дней с просмотра урока: {days_text}
+            Вместо имени пользователя напиши плейсхолдер {{first_name}} (ровно так, в фигурных скобках).
             
             Курс: "Успешный YouTube-бизнес с нуля"
             Цена: 149 евро
@@ -272,131 +631,211 @@ class ReminderSystem:
             Сообщение должно быть коротким (до 200 символов), убедительным и побуждать к покупке.
             """
             
-            self.openai_client.beta.threads.messages.create(
-                thread_id=thread.id,
-                role="user",
-                content=prompt_text
-            )
-            
-            # Run the Assistant
-            run = self.openai_client.beta.threads.runs.create(
-                thread_id=thread.id,
-                assistant_id=self.openai_assistant_id
+            # Thread, run and polling are handled by the shared run manager
+            reminder_text = await self.run_manager.run_prompt(
+                self.openai_assistant_id, prompt_text, deadline=RUN_DEADLINE
             )
+            if reminder_text:
+                logger.debug(f"Generated AI reminder template: {reminder_text[:50]}...")
+            return reminder_text
             
-            # Wait for the run to complete (with timeout)
-            max_wait_time = 30  # seconds
-            start_time = time.time()
-            while True:
-                if time.time() - start_time > max_wait_time:
-                    logger.warning(f"OpenAI request timed out for user {user_id}")
-                    return self.reminder_intervals[reminder_index]["template"]
-                
-                run_status = self.openai_client.beta.threads.runs.retrieve(
-                    thread_id=thread.id,
-                    run_id=run.id
-                )
-                
-                if run_status.status == "completed":
-                    break
-                elif run_status.status in ["failed", "cancelled", "expired"]:
-                    logger.warning(f"OpenAI run failed with status: {run_status.status}")
-                    return self.reminder_intervals[reminder_index]["template"]
-                
-                await asyncio.sleep(1)
+        except RunTimeoutError:
+            logger.warning(f"OpenAI request timed out for reminder {reminder_index}/{cohort}")
+            return None
+        except Exception as e:
+            logger.error(f"Error generating AI reminder template: {e}")
+            return None
+    
+    def _variant_for(self, user_id: int, reminder_index: int) -> Variant:
+        """Message variant a user receives for a reminder"""
+        return assign_variant(user_id, reminder_index, self.variants[reminder_index])
+    
+    async def _reminder_text(self, user_id: int, reminder_index: int,
+                             fallback: str = None) -> Tuple[str, bool]:
+        """
+        Pick the reminder text for a user from the pool (no OpenAI calls)
+        
+        Args:
+            user_id: Telegram user ID
+            reminder_index: Index of the reminder
+            fallback: Text used when the pool has none (default: the reminder template)
             
-            # Get the assistant's response
-            messages = self.openai_client.beta.threads.messages.list(
-                thread_id=thread.id
+        Returns:
+            Tuple (message text, was_ai_generated)
+        """
+        first_name, view_time = None, None
+        try:
+            row = await self.store.fetchone(
+                "SELECT first_name, view_time FROM lesson_views WHERE user_id = ?",
+                (user_id,)
             )
-            
-            for message in messages.data:
-                if message.role == "assistant":
-                    # Get the text content
-                    for content_item in message.content:
-                        if hasattr(content_item, "text"):
-                            reminder_text = content_item.text.value
-                            logger.debug(f"Generated AI reminder: {reminder_text[:50]}...")
-                            return reminder_text
-            
-            # Fallback to template if no response
-            return self.reminder_intervals[reminder_index]["template"]
-            
-        except Exception as e:
-            logger.error(f"Error generating AI reminder: {e}")
-            return self.reminder_intervals[reminder_index]["template"]
+            if row:
+                first_name, view_time = row
+        except sqlite3.Error as e:
+            logger.error(f"Error reading user for reminder: {e}")
+        
+        if self.pool and view_time is not None:
+            days_since_view = (int(time.time()) - view_time) / (60 * 60 * 24)
+            cohort = cohort_for(days_since_view, self.reminder_intervals[reminder_index]["days"])
+            template = await self.pool.pick(reminder_index, cohort)
+            if template:
+                return render(template, first_name), True
+        return fallback or self.reminder_intervals[reminder_index]["template"], False
     
-    async def _send_reminder(self, user_id: int, reminder_index: int, use_ai: bool = False) -> bool:
+    async def _deliver_reminder(self, user_id: int, reminder_index: int, use_ai: bool = False) -> None:
         """
-        Send a reminder message to a user
+        Send a reminder message to a user and record it
         
         Args:
             user_id: Telegram user ID
             reminder_index: Index of the reminder to send
             use_ai: Whether to use AI to generate the message
             
-        Returns:
-            True if reminder was sent successfully
+        Raises:
+            Telegram errors of the send (classified by the dispatcher)
         """
+        # Generate message text for the user's variant (AI texts come from the pre-generated pool)
+        variant = self._variant_for(user_id, reminder_index)
+        if use_ai and variant.ai and self.pool:
+            message_text, use_ai = await self._reminder_text(user_id, reminder_index, variant.template)
+        else:
+            message_text = variant.template
+            use_ai = False
+        
+        # Add a call to action button
+        message_text += "\n\n💳 Нажми кнопку 'Оплатить 149€' в меню, чтобы получить полный доступ к курсу!"
+        
+        # Mark the send in the outbox first; a reminder already in flight or sent is skipped
+        if not await self.store.run(begin_send, user_id, reminder_index, message_text, use_ai,
+                                    self.worker_id, int(time.time())):
+            logger.warning(f"Reminder {reminder_index} to user {user_id} was already sent, skipping")
+            return
+        
+        # Send the message
         try:
-            # Generate message text
-            if use_ai and self.openai_client and self.openai_assistant_id:
-                message_text = await self._generate_ai_reminder(user_id, reminder_index)
-            else:
-                message_text = self.reminder_intervals[reminder_index]["template"]
-            
-            # Add a call to action button
-            message_text += "\n\n💳 Нажми кнопку 'Оплатить 149€' в меню, чтобы получить полный доступ к курсу!"
-            
-            # Send the message
             await self.bot.send_message(user_id, message_text)
-            logger.info(f"Sent reminder {reminder_index} to user {user_id}")
-            
-            # Record that reminder was sent
-            current_time = int(time.time())
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                # Update the last reminder index
-                cursor.execute(
-                    "UPDATE lesson_views SET last_reminder_index = ? WHERE user_id = ?",
-                    (reminder_index, user_id)
-                )
-                # Record in history
-                cursor.execute(
-                    """INSERT INTO reminder_history 
-                       (user_id, reminder_index, sent_time, was_ai_generated) 
-                       VALUES (?, ?, ?, ?)""",
-                    (user_id, reminder_index, current_time, 1 if use_ai else 0)
-                )
-                conn.commit()
-            
-            return True
         except Exception as e:
-            logger.error(f"Error sending reminder: {e}")
-            return False
+            try:
+                await self.store.run(mark_failed, user_id, reminder_index,
+                                     isinstance(e, PERMANENT_ERRORS), str(e), int(time.time()))
+            except sqlite3.Error as db_error:
+                logger.error(f"Error recording failed reminder in outbox: {db_error}")
+            raise
+        logger.info(f"Sent reminder {reminder_index} to user {user_id}")
+        
+        # Record that reminder was sent (same transaction as the outbox state)
+        next_reminder_at = await self.store.run(
+            self._record_reminder_sent, user_id, reminder_index, use_ai, int(time.time()), variant.id
+        )
+        self.scheduler.update(user_id, next_reminder_at)
+    
+    def _record_reminder_sent(self, conn: sqlite3.Connection, user_id: int, reminder_index: int,
+                              was_ai_generated: bool, current_time: int,
+                              variant_id: str = DEFAULT_VARIANT) -> Optional[int]:
+        """
+        Advance a user to the next reminder and add the sent one to the history
+        
+        Also moves the reminder's outbox row to "sent"; a reminder that was
+        already recorded (e.g. recovered by another worker) is not recorded again.
+        
+        Returns:
+            Time the next reminder is due (None if none)
+        """
+        cursor = conn.cursor()
+        if not mark_sent(conn, user_id, reminder_index, current_time):
+            cursor.execute("SELECT next_reminder_at FROM lesson_views WHERE user_id = ?", (user_id,))
+            row = cursor.fetchone()
+            return row[0] if row else None
+        cursor.execute(
+            "SELECT last_reminder_index, view_time, send_window_start FROM lesson_views WHERE user_id = ?",
+            (user_id,)
+        )
+        previous = cursor.fetchone()
+        next_reminder_at = None
+        if previous is not None:
+            next_reminder_at = self._next_reminder_at(previous[1], reminder_index, previous[2], user_id,
+                                                      current_time)
+        # Update the last reminder index, schedule the next one and acknowledge the claim
+        cursor.execute(
+            """UPDATE lesson_views
+               SET last_reminder_index = ?,
+                   next_reminder_at = ?,
+                   last_reminder_at = ?,
+                   last_variant_id = ?,
+                   claimed_by = NULL, lease_until = NULL
+               WHERE user_id = ?""",
+            (reminder_index, next_reminder_at, current_time, variant_id, user_id)
+        )
+        # Record in history
+        cursor.execute(
+            """INSERT INTO reminder_history 
+               (user_id, reminder_index, sent_time, was_ai_generated, variant_id) 
+               VALUES (?, ?, ?, ?, ?)""",
+            (user_id, reminder_index, current_time, 1 if was_ai_generated else 0, variant_id)
+        )
+        record(conn, REMINDERS_SENT, current_time, reminder_index=reminder_index)
+        record_variant(conn, reminder_index, variant_id, sent=1)
+        if previous is not None and previous[0] < 0:
+            record(conn, USERS_WITH_REMINDERS, current_time)
+        return next_reminder_at
     
     async def process_reminders(self) -> None:
-        """Process all pending reminders"""
+        """Process all pending reminders, one claimed batch at a time"""
         logger.debug("Processing reminders")
-        users_needing_reminders = await self._get_users_needing_reminders()
-        
-        for user_id, reminder_index, _ in users_needing_reminders:
-            use_ai = bool(self.openai_client and self.openai_assistant_id)
-            await self._send_reminder(user_id, reminder_index, use_ai)
+        # Reminders that fall due during the run (e.g. the next one of a user who was
+        # just reminded) wait for the next run, so no user is reminded twice in one run
+        run_started = int(time.time())
+        while True:
+            claimed, users_needing_reminders = await self._claim_users_needing_reminders(
+                REMINDER_CLAIM_BATCH, due_before=run_started
+            )
+            if not claimed:
+                break
             
-            # Add small delay to prevent flooding Telegram API
-            await asyncio.sleep(0.5)
+            # Concurrent, rate-limited sending (Telegram limits, RetryAfter, blocked users).
+            # Sent reminders acknowledge their claim; failed ones go back to "pending" in the
+            # outbox and keep the claim until the lease expires, which doubles as their retry delay.
+            await self.dispatcher.dispatch(
+                (user_id, reminder_index) for user_id, reminder_index, _ in users_needing_reminders
+            )
+    
+    async def _load_schedule(self) -> List[Tuple[int, int]]:
+        """
+        Read upcoming reminder deadlines from the database
+        
+        Returns:
+            List of tuples (user_id, next_reminder_at)
+        """
+        try:
+            return await self.store.fetchall(
+                """SELECT user_id, next_reminder_at FROM lesson_views
+                   WHERE has_purchased = 0 AND next_reminder_at IS NOT NULL"""
+            )
+        except sqlite3.Error as e:
+            logger.error(f"Error loading reminder schedule: {e}")
+            return []
     
     async def _reminder_loop(self) -> None:
         """Main reminder processing loop"""
         logger.info("Starting reminder processing loop")
         self.is_running = True
+        self.scheduler.load(await self._load_schedule())
         
         while self.is_running:
             try:
+                # Sleep until the earliest deadline (woken early on schedule changes)
+                if not await self.scheduler.sleep_until_due(max_wait=self.resync_interval or None):
+                    # Views and sends of other processes only show up in the database
+                    self.scheduler.load(await self._load_schedule())
+                    continue
+                now = int(time.time())
                 await self.process_reminders()
-                # Check every hour
-                await asyncio.sleep(60 * 60)
+                # Whatever is still due failed to send (or is claimed by another worker) -
+                # look again once its lease has expired instead of spinning
+                retry_delay = max(REMINDER_RETRY_DELAY, REMINDER_LEASE + int(time.time()) - now + 1)
+                deferred = self.scheduler.defer_due(now, retry_delay)
+                if deferred:
+                    logger.warning(f"{deferred} reminders could not be sent, retrying in {retry_delay}s")
             except asyncio.CancelledError:
                 logger.info("Reminder loop cancelled")
                 break
@@ -404,14 +843,32 @@ class ReminderSystem:
                 logger.error(f"Error in reminder loop: {e}")
                 await asyncio.sleep(60)  # Sleep for a minute on error
     
-    async def start(self) -> None:
-        """Start the reminder system"""
+    async def start(self, send_reminders: bool = True) -> None:
+        """
+        Start the reminder system
+        
+        Args:
+            send_reminders: Whether this process sends reminders; with False only
+                lesson views and purchases are recorded (reminder_worker.py sends)
+        """
+        self.is_running = True
+        if self.flush_task is None or self.flush_task.done():
+            self.flush_task = asyncio.create_task(self._flush_loop())
+        if not send_reminders:
+            logger.info("Reminder system started without sending (external reminder worker)")
+            return
+        await self.recover_outbox()
+        if self.pool:
+            await self.pool.start()
         if self.task is None or self.task.done():
             self.task = asyncio.create_task(self._reminder_loop())
-            logger.info("Reminder system started")
+            logger.info(f"Reminder system started (worker {self.worker_id})")
     
     async def stop(self) -> None:
         """Stop the reminder system"""
+        if self.pool:
+            await self.pool.stop()
+            await self.run_manager.close()
         if self.task and not self.task.done():
             self.is_running = False
             self.task.cancel()
@@ -420,46 +877,54 @@ class ReminderSystem:
             except asyncio.CancelledError:
                 pass
             logger.info("Reminder system stopped")
+        self.is_running = False
+        released = await self._release_claims()
+        if released:
+            logger.info(f"Released {released} reminder claims")
+        if self.flush_task and not self.flush_task.done():
+            self.flush_task.cancel()
+            try:
+                await self.flush_task
+            except asyncio.CancelledError:
+                pass
+        # Write what is still buffered before the connection goes away
+        if self._flush_tasks:
+            await asyncio.gather(*self._flush_tasks, return_exceptions=True)
+        flushed = await self.flush_views()
+        if flushed:
+            logger.info(f"Flushed {flushed} buffered lesson views on shutdown")
+        await self.store.close()
+    
+    async def get_stats(self) -> Dict:
+        """
+        Get statistics about the reminder system from the materialized counters
+        
+        Returns:
+            Dict with stats (see reminder_stats.read_stats)
+        """
+        try:
+            return await self.store.run(read_stats)
+        except sqlite3.Error as e:
+            logger.error(f"Error getting reminder stats: {e}")
+            return empty_stats()
 
 # Helper function to get reminder system stats
 async def get_reminder_stats(db_path: str = "reminder_data.db") -> Dict:
     """
     Get statistics about the reminder system
     
+    Reads the counters through a short-lived store (off the event loop);
+    a running system should use ReminderSystem.get_stats
+    
     Returns:
         Dict with stats
     """
-    stats = {
-        "total_users": 0,
-        "users_with_reminders": 0,
-        "reminders_sent": 0,
-        "conversion_rate": 0.0,
-    }
-    
+    store = SqliteStore(db_path)
     try:
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.cursor()
-            
-            # Total users
-            cursor.execute("SELECT COUNT(*) FROM lesson_views")
-            stats["total_users"] = cursor.fetchone()[0]
-            
-            # Users with reminders
-            cursor.execute("SELECT COUNT(*) FROM lesson_views WHERE last_reminder_index >= 0")
-            stats["users_with_reminders"] = cursor.fetchone()[0]
-            
-            # Total reminders sent
-            cursor.execute("SELECT COUNT(*) FROM reminder_history")
-            stats["reminders_sent"] = cursor.fetchone()[0]
-            
-            # Purchased users
-            cursor.execute("SELECT COUNT(*) FROM lesson_views WHERE has_purchased = 1")
-            purchased_users = cursor.fetchone()[0]
-            
-            # Calculate conversion rate
-            if stats["total_users"] > 0:
-                stats["conversion_rate"] = (purchased_users / stats["total_users"]) * 100
+        return await store.run(read_stats)
     except sqlite3.Error as e:
         logger.error(f"Error getting reminder stats: {e}")
+    finally:
+        await store.close()
     
-    return stats
+    return empty_stats()
@@ -0,0 +1,191 @@
+"""
+Reminder Variants for Dostup Bot
+
+A/B variants of the reminder messages. Each reminder slot (an entry of the
+reminder intervals) may list weighted variants:
+
+    {"days": 1, "template": "...", "variants": [
+        {"id": "short", "weight": 2, "template": "Привет! ..."},
+        {"id": "ai", "weight": 1, "ai": True},
+    ]}
+
+A variant sends its own template (the slot template if it has none), or a
+text from the AI pool with "ai": True, falling back to the template when the
+pool has nothing. Slots without "variants" have the single variant "default":
+the AI pool when it is configured, the slot template otherwise.
+
+Users are assigned by hashing (reminder index, user id), so a user gets the
+same variant of a slot in every process and after restarts, and assignments
+of different slots are independent. The variant of every sent reminder is
+stored in reminder_history and counted per variant (see reminder_stats.py).
+
+Variants can also be configured without code changes: REMINDER_VARIANTS
+holds JSON (or the path of a JSON file) mapping reminder indexes to variant
+lists, which replace the variants of those slots:
+
+    {"0": [{"id": "short", "weight": 2, "template": "Привет! ..."},
+           {"id": "ai", "ai": true}]}
+"""
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Dict, List, NamedTuple
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+REMINDER_VARIANTS = os.getenv("REMINDER_VARIANTS", "")  # JSON or path to a JSON file, "" = none
+
+DEFAULT_VARIANT = "default"
+VARIANT_KEYS = {"id", "weight", "template", "ai"}
+
+
+class Variant(NamedTuple):
+    id: str
+    weight: float
+    template: str
+    ai: bool
+
+
+def slot_variants(interval: Dict[str, Any]) -> List[Variant]:
+    """
+    Variants of one reminder slot
+
+    Args:
+        interval: Reminder interval dict ('days', 'template', optional 'variants')
+
+    Returns:
+        List of variants (at least one)
+
+    Raises:
+        ValueError: On duplicate ids or non-positive weights
+    """
+    configured = interval.get("variants")
+    if not configured:
+        return [Variant(DEFAULT_VARIANT, 1.0, interval["template"], True)]
+
+    variants = []
+    for config in configured:
+        variant = Variant(
+            id=str(config["id"]),
+            weight=float(config.get("weight", 1)),
+            template=config.get("template") or interval["template"],
+            ai=bool(config.get("ai", False))
+        )
+        if variant.weight <= 0:
+            raise ValueError(f"Reminder variant {variant.id!r} needs a positive weight")
+        if any(existing.id == variant.id for existing in variants):
+            raise ValueError(f"Duplicate reminder variant {variant.id!r}")
+        variants.append(variant)
+    return variants
+
+
+def assign_variant(user_id: int, reminder_index: int, variants: List[Variant]) -> Variant:
+    """
+    Deterministically pick the variant a user receives for a slot
+
+    Args:
+        user_id: Telegram user ID
+        reminder_index: Index of the reminder slot
+        variants: Variants of the slot (see slot_variants)
+
+    Returns:
+        The user's variant, chosen with probability proportional to its weight
+    """
+    if len(variants) == 1:
+        return variants[0]
+    digest = hashlib.blake2b(f"{reminder_index}:{user_id}".encode(), digest_size=8).digest()
+    point = int.from_bytes(digest, "big") / 2 ** 64 * sum(variant.weight for variant in variants)
+    for variant in variants:
+        point -= variant.weight
+        if point < 0:
+            return variant
+    return variants[-1]
+
+
+def parse_variants_config(spec: str) -> Dict[int, List[Dict[str, Any]]]:
+    """
+    Parse and validate the REMINDER_VARIANTS configuration
+
+    Args:
+        spec: JSON object {reminder index: [variant, ...]}, or the path of a file holding it
+
+    Returns:
+        Dict {reminder index: list of variant dicts}
+
+    Raises:
+        ValueError: On invalid JSON or variants
+    """
+    if not spec or not spec.strip():
+        return {}
+    text = spec.strip()
+    if not text.startswith("{"):
+        try:
+            with open(text, encoding="utf-8") as config_file:
+                text = config_file.read()
+        except OSError as e:
+            raise ValueError(f"Cannot read reminder variants file {text!r}: {e}") from e
+    try:
+        config = json.loads(text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid reminder variants JSON: {e}") from e
+    if not isinstance(config, dict):
+        raise ValueError("Reminder variants must be a JSON object {reminder index: [variants]}")
+
+    slots = {}
+    for key, variants in config.items():
+        try:
+            index = int(key)
+        except ValueError:
+            raise ValueError(f"Reminder variants key {key!r} is not a reminder index") from None
+        if index < 0:
+            raise ValueError(f"Reminder variants key {key!r} is not a reminder index")
+        if not isinstance(variants, list) or not variants:
+            raise ValueError(f"Reminder {index} needs a non-empty list of variants")
+        for variant in variants:
+            if not isinstance(variant, dict):
+                raise ValueError(f"Variant of reminder {index} must be an object")
+            unknown = set(variant) - VARIANT_KEYS
+            if unknown:
+                raise ValueError(f"Unknown keys {sorted(unknown)} in variant of reminder {index}")
+            if not isinstance(variant.get("id"), str) or not variant["id"]:
+                raise ValueError(f"Variant of reminder {index} needs a string 'id'")
+            weight = variant.get("weight", 1)
+            if isinstance(weight, bool) or not isinstance(weight, (int, float)):
+                raise ValueError(f"Reminder variant {variant['id']!r} needs a numeric weight")
+            if not isinstance(variant.get("template", ""), str):
+                raise ValueError(f"Reminder variant {variant['id']!r} needs a string template")
+            if not isinstance(variant.get("ai", False), bool):
+                raise ValueError(f"Reminder variant {variant['id']!r} needs a boolean 'ai'")
+        slot_variants({"template": "", "variants": variants})  # weights and duplicate ids
+        slots[index] = variants
+    return slots
+
+
+def apply_variants(intervals: List[Dict[str, Any]],
+                   config: Dict[int, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    Reminder intervals with the configured variants of their slots
+
+    Args:
+        intervals: Reminder interval dicts
+        config: Variants by reminder index (see parse_variants_config)
+
+    Returns:
+        New list of interval dicts; the given ones are not modified
+
+    Raises:
+        ValueError: If a configured reminder index does not exist
+    """
+    missing = sorted(index for index in config if index >= len(intervals))
+    if missing:
+        raise ValueError(f"Reminder variants configured for missing reminders {missing} "
+                         f"(there are {len(intervals)})")
+    if config:
+        logger.info(f"Reminder variants configured for reminders {sorted(config)}")
+    return [
+        dict(interval, variants=config[index]) if index in config else interval
+        for index, interval in enumerate(intervals)
+    ]
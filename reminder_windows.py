@@ -0,0 +1,131 @@
+"""
+Reminder Send Windows for Dostup Bot
+
+Keeps reminders out of the night. Every user gets a daily send window of
+REMINDER_SEND_WINDOW local hours (default 10-21), stored as the minute of
+the UTC day it opens:
+
+  - users whose Telegram language has a UTC offset in
+    REMINDER_LANGUAGE_UTC_OFFSETS (default "ru:3,uk:2,be:3,kk:5,de:1")
+    get the window in that local time;
+  - everyone else gets it in REMINDER_DEFAULT_UTC_OFFSET (default 3, the
+    bot's Russian-speaking audience);
+  - with REMINDER_DEFAULT_UTC_OFFSET="" they get a window of the same
+    length centred on the time of day of their own activity (the lesson
+    view) instead. Reminders are due whole days after the view, so this
+    only defers reminders whose due time drifts away from the view time.
+
+A reminder due outside the window is deferred into the next one, at a
+point derived from the user id, so deferred reminders spread evenly over
+the window instead of all firing when it opens.
+"""
+import hashlib
+import logging
+import os
+from typing import Dict, Optional, Tuple
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+REMINDER_SEND_WINDOW = os.getenv("REMINDER_SEND_WINDOW", "10-21")  # local hours "start-end", "" = any time
+REMINDER_LANGUAGE_UTC_OFFSETS = os.getenv("REMINDER_LANGUAGE_UTC_OFFSETS",
+                                          "ru:3,uk:2,be:3,kk:5,de:1")  # "lang:hours,..."
+REMINDER_DEFAULT_UTC_OFFSET = os.getenv("REMINDER_DEFAULT_UTC_OFFSET", "3")  # hours, "" = follow activity
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def parse_window(spec: str) -> Optional[Tuple[int, int]]:
+    """
+    Parse a "start-end" window of local hours (end may wrap past midnight)
+
+    Returns:
+        Tuple (start minute, length in minutes) or None for "send any time"
+    """
+    if not spec or not spec.strip():
+        return None
+    start, end = (float(part) for part in spec.split("-"))
+    start_minute = int(start * 60) % MINUTES_PER_DAY
+    length = int((end - start) * 60) % MINUTES_PER_DAY
+    if length == 0:
+        return None  # e.g. "0-24"
+    return start_minute, length
+
+
+def parse_language_offsets(spec: str) -> Dict[str, float]:
+    """Parse "lang:hours,..." into {language code: UTC offset in hours}"""
+    offsets = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        language, hours = item.split(":")
+        offsets[language.strip().lower()] = float(hours)
+    return offsets
+
+
+def _spread(user_id: int) -> float:
+    """Stable position of a user within a window, uniform in [0, 1)"""
+    digest = hashlib.blake2b(str(user_id).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big") / 2 ** 64
+
+
+class SendWindows:
+    """Per-user daily send windows"""
+
+    def __init__(self, window: str = REMINDER_SEND_WINDOW,
+                 language_offsets: str = REMINDER_LANGUAGE_UTC_OFFSETS,
+                 default_offset: str = REMINDER_DEFAULT_UTC_OFFSET):
+        """
+        Args:
+            window: Local hours "start-end" reminders may be sent in ("" = any time)
+            language_offsets: "lang:hours,..." UTC offsets by Telegram language code
+            default_offset: UTC offset in hours of other languages ("" = follow the user's activity)
+        """
+        self.window = parse_window(window)
+        self.language_offsets = parse_language_offsets(language_offsets)
+        self.default_offset = float(default_offset) if default_offset and default_offset.strip() else None
+        if self.window:
+            default = "by activity" if self.default_offset is None else f"UTC{self.default_offset:+g}"
+            logger.info(f"Reminder send window {window} (local), "
+                        f"{len(self.language_offsets)} languages with fixed offsets, others {default}")
+
+    def window_start(self, activity_time: Optional[int], language_code: Optional[str] = None) -> Optional[int]:
+        """
+        Minute of the UTC day the user's send window opens
+
+        Args:
+            activity_time: Unix timestamp of the user's latest activity
+            language_code: Telegram language code of the user
+
+        Returns:
+            Minute 0-1439, or None if the user may be messaged at any time
+        """
+        if self.window is None:
+            return None
+        start, length = self.window
+        offset = self.language_offsets.get((language_code or "").split("-")[0].lower(), self.default_offset)
+        if offset is not None:
+            return int(start - offset * 60) % MINUTES_PER_DAY
+        if activity_time is None:
+            return None
+        activity_minute = (activity_time // 60) % MINUTES_PER_DAY
+        return int(activity_minute - length // 2) % MINUTES_PER_DAY
+
+    def defer(self, due: Optional[int], window_start: Optional[int], user_id: int) -> Optional[int]:
+        """
+        Move a due time into the user's send window
+
+        Also registered as the SQL function send_window(due, window_start, user_id).
+
+        Returns:
+            `due` if it falls inside the window, else a time in the next window
+        """
+        if due is None or window_start is None or self.window is None:
+            return due
+        length = self.window[1] * 60
+        day = due - due % (MINUTES_PER_DAY * 60)
+        opens = day + window_start * 60
+        if opens > due:
+            opens -= MINUTES_PER_DAY * 60  # the window of the previous UTC day may still be open
+        if due < opens + length:
+            return due
+        return opens + MINUTES_PER_DAY * 60 + int(_spread(user_id) * length)
@@ -0,0 +1,87 @@
+"""
+Reminder Worker for Dostup Bot
+
+Sends reminders from a process of its own instead of the bot process.
+Several workers can share one reminder database: due reminders are claimed
+in batches under a lease (see ReminderSystem.process_reminders), so each
+one is sent once, and the claims of a worker that dies are taken over when
+their lease expires. Lesson views and purchases are still recorded by the
+bot; workers reload the schedule from the database every
+REMINDER_RESYNC_INTERVAL seconds to pick them up.
+
+All workers share the bot's Telegram rate limit, so with N workers set
+TELEGRAM_GLOBAL_RATE to about 30/N.
+
+Usage:
+    REMINDERS_IN_BOT=0 python bot.py
+    python reminder_worker.py
+"""
+import asyncio
+import logging
+import os
+import signal
+
+from aiogram import Bot
+from dotenv import load_dotenv
+
+from openai_client import AsyncOpenAIClient
+from reminder_system import ReminderSystem
+
+# Setup logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("reminder_worker")
+
+# Configuration
+WORKER_RESYNC_INTERVAL = int(os.getenv("REMINDER_RESYNC_INTERVAL", "60"))  # seconds
+
+
+def default_db_path() -> str:
+    """Reminder database used by bot.py"""
+    if os.path.exists("/app"):
+        return "/app/reminder_data.db"
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), "reminder_data.db")
+
+
+async def main() -> None:
+    load_dotenv()
+    token = os.getenv("BOT_TOKEN")
+    if not token:
+        logger.error("BOT_TOKEN is not set")
+        raise SystemExit(1)
+
+    openai_client = None
+    openai_api_key = os.getenv("OPENAI_API_KEY")
+    openai_assistant_id = os.getenv("OPENAI_ASSISTANT_ID")
+    if openai_api_key and openai_assistant_id:
+        openai_client = AsyncOpenAIClient(api_key=openai_api_key)
+
+    bot = Bot(token)
+    reminder_system = ReminderSystem(
+        bot=bot,
+        db_path=default_db_path(),
+        openai_client=openai_client,
+        openai_assistant_id=openai_assistant_id,
+        resync_interval=WORKER_RESYNC_INTERVAL
+    )
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    await reminder_system.start()
+    logger.info(f"Reminder worker {reminder_system.worker_id} running on {reminder_system.db_path}")
+    try:
+        await stop_event.wait()
+    finally:
+        logger.info("Reminder worker stopping")
+        # Releases unacknowledged claims so other workers take them over at once
+        await reminder_system.stop()
+        await bot.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
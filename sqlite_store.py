@@ -0,0 +1,130 @@
+"""
+SQLite Store for Dostup Bot
+
+Long-lived SQLite connection used by the reminder system, the payment
+index and the answer cache, opened once in WAL mode with tuned pragmas.
+Every query runs on a single dedicated executor thread, so the aiogram
+event loop never blocks on disk, and SQL statements are compiled once and
+reused from the connection's statement cache.
+Python functions used in SQL are registered on the connection when it opens.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+SQLITE_BUSY_TIMEOUT = 5000  # milliseconds to wait for locks held by other connections
+SQLITE_CACHE_KB = 8 * 1024  # page cache size
+SQLITE_MMAP_BYTES = 64 * 1024 * 1024
+STATEMENT_CACHE_SIZE = 256  # compiled statements kept per connection
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",
+    # Durable across application crashes; only a power loss can drop the last commits
+    "PRAGMA synchronous = NORMAL",
+    f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT}",
+    "PRAGMA temp_store = MEMORY",
+    f"PRAGMA cache_size = -{SQLITE_CACHE_KB}",
+    f"PRAGMA mmap_size = {SQLITE_MMAP_BYTES}",
+)
+
+
+class SqliteStore:
+    """Shared SQLite connection whose queries run on one executor thread"""
+
+    def __init__(self, db_path: str, functions: Optional[Dict[str, Tuple[int, Callable]]] = None):
+        """
+        Initialize the store (the connection is opened on first use)
+
+        Args:
+            db_path: Path to the SQLite database file
+            functions: Deterministic SQL functions, {name: (number of arguments, function)}
+        """
+        self.db_path = db_path
+        self.functions = functions or {}
+        # One worker: the connection is only ever touched by this thread
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-store")
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open the connection (executor thread only)"""
+        if self._conn is None:
+            db_dir = os.path.dirname(os.path.abspath(self.db_path))
+            try:
+                os.makedirs(db_dir, exist_ok=True)
+            except OSError as dir_error:
+                logger.warning(f"Could not create database directory: {dir_error}")
+
+            conn = sqlite3.connect(self.db_path, cached_statements=STATEMENT_CACHE_SIZE)
+            try:
+                for pragma in PRAGMAS:
+                    conn.execute(pragma)
+                for name, (num_params, func) in self.functions.items():
+                    conn.create_function(name, num_params, func, deterministic=True)
+            except sqlite3.Error:
+                conn.close()
+                raise
+            self._conn = conn
+            logger.info(f"SQLite store opened at {self.db_path} (WAL)")
+        return self._conn
+
+    def _call(self, func: Callable[..., Any], args: Tuple) -> Any:
+        """Run `func(conn, *args)` as one transaction (executor thread only)"""
+        conn = self._connect()
+        try:
+            result = func(conn, *args)
+            conn.commit()
+            return result
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def run_sync(self, func: Callable[..., Any], *args) -> Any:
+        """
+        Run `func(conn, *args)` in a transaction and wait for it (blocking)
+
+        For startup code outside the event loop, such as schema creation.
+        """
+        return self._executor.submit(self._call, func, args).result()
+
+    async def run(self, func: Callable[..., Any], *args) -> Any:
+        """
+        Run `func(conn, *args)` in a transaction on the store thread
+
+        Returns:
+            Whatever `func` returns
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._call, func, args)
+
+    async def execute(self, sql: str, params: Sequence = ()) -> int:
+        """
+        Execute one statement
+
+        Returns:
+            Number of changed rows
+        """
+        return await self.run(lambda conn: conn.execute(sql, params).rowcount)
+
+    async def fetchone(self, sql: str, params: Sequence = ()) -> Optional[Tuple]:
+        return await self.run(lambda conn: conn.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql: str, params: Sequence = ()) -> List[Tuple]:
+        return await self.run(lambda conn: conn.execute(sql, params).fetchall())
+
+    def _close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+            logger.info(f"SQLite store closed ({self.db_path})")
+
+    async def close(self) -> None:
+        """Close the connection; it is reopened if the store is used again"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._close)
@@ -0,0 +1,235 @@
+"""
+Async Stripe Client for Dostup Bot
+
+The Stripe SDK is synchronous. This module runs every Stripe request on a
+bounded thread pool so that payment checks never block the aiogram event loop,
+caps the number of concurrent requests, applies per-request timeouts and
+reuses keep-alive HTTP connections (one requests session per worker thread).
+The HTTP client is installed once at bot setup with configure_http_client().
+"""
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+import stripe
+
+from customer_cache import CustomerCache
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+STRIPE_MAX_WORKERS = int(os.getenv("STRIPE_MAX_WORKERS", "8"))
+STRIPE_MAX_CONCURRENCY = int(os.getenv("STRIPE_MAX_CONCURRENCY", "8"))
+STRIPE_REQUEST_TIMEOUT = float(os.getenv("STRIPE_REQUEST_TIMEOUT", "20"))
+STRIPE_PAGE_SIZE = 100
+
+
+def _make_http_client(timeout: float):
+    """Create a keep-alive Stripe HTTP client if `requests` is available"""
+    try:
+        import requests  # noqa: F401
+    except ImportError:
+        logger.warning("requests is not installed - Stripe connections will not be reused")
+        return None
+
+    client_cls = getattr(stripe, "RequestsClient", None)
+    if client_cls is None:
+        from stripe.http_client import RequestsClient as client_cls
+    # Without an explicit session RequestsClient keeps one session per thread,
+    # so each pool worker holds its own pooled connections
+    return client_cls(timeout=timeout)
+
+
+def configure_http_client(timeout: float = STRIPE_REQUEST_TIMEOUT) -> bool:
+    """
+    Install a keep-alive HTTP client with a request timeout for the Stripe SDK
+
+    Call once at startup; it replaces stripe.default_http_client for the process.
+
+    Returns:
+        True if the client was installed
+    """
+    http_client = _make_http_client(timeout)
+    if http_client is None:
+        return False
+    stripe.default_http_client = http_client
+    return True
+
+
+class AsyncStripeClient:
+    """Runs Stripe SDK calls off the event loop with bounded concurrency"""
+
+    def __init__(self, max_workers: int = STRIPE_MAX_WORKERS,
+                 max_concurrency: int = STRIPE_MAX_CONCURRENCY,
+                 timeout: float = STRIPE_REQUEST_TIMEOUT,
+                 customer_cache: Optional[CustomerCache] = None):
+        """
+        Initialize the async Stripe client
+
+        Args:
+            max_workers: Size of the thread pool running Stripe requests
+            max_concurrency: Maximum number of Stripe requests in flight at once
+            timeout: Seconds a caller waits for a request (the HTTP timeout itself is
+                set by configure_http_client)
+            customer_cache: Optional cache for Customer lookups
+        """
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.customer_cache = customer_cache
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stripe")
+        self._semaphore = None
+        self._semaphore_loop = None
+        self.request_count = 0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # The semaphore must belong to the loop that awaits it (the bot may
+        # run in a different thread than the one that imported this module)
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    async def call(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        Run a synchronous Stripe SDK function in the worker pool
+
+        A worker thread cannot be interrupted, so a request keeps its
+        concurrency slot until the thread has finished, even after the
+        caller timed out or was cancelled.
+
+        Raises:
+            asyncio.TimeoutError: if the request takes longer than the timeout
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = self._get_semaphore()
+        await semaphore.acquire()
+        try:
+            self.request_count += 1
+            future = loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+        except BaseException:
+            semaphore.release()
+            raise
+
+        def finished(done: asyncio.Future) -> None:
+            semaphore.release()
+            if not done.cancelled():
+                done.exception()  # retrieved, also when nobody awaits it any more
+
+        future.add_done_callback(finished)
+        return await asyncio.wait_for(asyncio.shield(future), timeout=self.timeout)
+
+    async def iter_list(self, list_func: Callable, **params) -> AsyncIterator[Any]:
+        """
+        Stream all objects of a Stripe list endpoint, one page request at a time
+
+        Args:
+            list_func: e.g. stripe.PaymentIntent.list
+            params: List filters (created, customer, ...)
+        """
+        params.setdefault("limit", STRIPE_PAGE_SIZE)
+        while True:
+            page = await self.call(list_func, **params)
+            data = page.data
+            for obj in data:
+                yield obj
+            if not page.has_more or not data:
+                break
+            params["starting_after"] = data[-1].id
+
+    async def list_payment_intents(self, **params) -> AsyncIterator[Any]:
+        async for obj in self.iter_list(stripe.PaymentIntent.list, **params):
+            yield obj
+
+    async def list_checkout_sessions(self, **params) -> AsyncIterator[Any]:
+        async for obj in self.iter_list(stripe.checkout.Session.list, **params):
+            yield obj
+
+    async def retrieve_customer(self, customer_id: str) -> Any:
+        """Retrieve a customer, served from the customer cache when possible"""
+        if self.customer_cache is None:
+            return await self.call(stripe.Customer.retrieve, customer_id)
+
+        customer = self.customer_cache.get_memory(customer_id)
+        if customer is not None:
+            return customer
+
+        # The SQLite tier is read and written on the worker pool, never on the loop
+        loop = asyncio.get_running_loop()
+        customer = await loop.run_in_executor(self._executor, self.customer_cache.get, customer_id)
+        if customer is None:
+            fetched = await self.call(stripe.Customer.retrieve, customer_id)
+            customer = await loop.run_in_executor(self._executor, self.customer_cache.set, fetched)
+        return customer
+
+    def close(self) -> None:
+        """Shut down the worker pool"""
+        self._executor.shutdown(wait=False)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into one in-flight request and
+    keeps the result as a snapshot for a short time, so Stripe traffic grows
+    with time rather than with the number of concurrent users
+    """
+
+    def __init__(self, ttl: float = 0.0):
+        """
+        Args:
+            ttl: How long (seconds) a finished result is reused
+        """
+        self.ttl = ttl
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._results: Dict[Hashable, Tuple[float, Any]] = {}
+        self.calls = 0
+        self.shared = 0
+
+    def _finish(self, key: Hashable, task: asyncio.Future) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if self.ttl > 0 and not task.cancelled() and task.exception() is None:
+            self._results[key] = (time.monotonic() + self.ttl, task.result())
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drop the snapshot for a key (the next call fetches again)"""
+        self._results.pop(key, None)
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run `func` for `key`, or join the call already in flight / reuse a fresh snapshot
+        """
+        snapshot = self._results.get(key)
+        if snapshot is not None:
+            if snapshot[0] > time.monotonic():
+                self.shared += 1
+                return snapshot[1]
+            del self._results[key]
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        else:
+            self.shared += 1
+        # One caller giving up must not cancel the fetch for everyone else
+        return await asyncio.shield(task)
+
+
+# Shared client instance
+_client = None
+
+
+def get_stripe_client() -> AsyncStripeClient:
+    """Return the process-wide async Stripe client"""
+    global _client
+    if _client is None:
+        _client = AsyncStripeClient()
+    return _client
@@ -0,0 +1,429 @@
+"""
+Stripe Webhook Ingestion for Dostup Bot
+
+This module receives Stripe webhook events on the aiohttp server, verifies
+their signature with the Stripe SDK, stores them de-duplicated by event id in
+a durable SQLite queue and processes them in a background worker that grants
+course access as soon as a payment completes - without the user having to run
+a payment check. Queue reads and writes run on the executor thread of a
+SqliteStore (sqlite_store.py), never on the event loop.
+
+Local testing with a signed fixture payload:
+    STRIPE_WEBHOOK_SECRET=whsec_test python stripe_webhook.py fixture.json
+    STRIPE_WEBHOOK_SECRET=whsec_test python stripe_webhook.py --user-id 123456789
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import sqlite3
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import stripe
+
+from sqlite_store import SqliteStore
+
+try:
+    from stripe import SignatureVerificationError
+except ImportError:  # stripe < 8
+    from stripe.error import SignatureVerificationError
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Configuration
+STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")
+WEBHOOK_PATH = "/stripe/webhook"
+
+if os.path.exists("/app"):
+    DEFAULT_DB_PATH = "/app/stripe_webhook.db"
+else:
+    DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stripe_webhook.db")
+WEBHOOK_DB_PATH = os.getenv("STRIPE_WEBHOOK_DB_PATH", DEFAULT_DB_PATH)
+
+# Maximum allowed age of a signed payload (same default as the Stripe SDK)
+SIGNATURE_TOLERANCE_SECONDS = 300
+MAX_ATTEMPTS = 5
+
+HANDLED_EVENT_TYPES = {
+    "checkout.session.completed",
+    "checkout.session.async_payment_succeeded",
+    "payment_intent.succeeded",
+}
+
+
+def sign_payload(payload: bytes, secret: str, timestamp: Optional[int] = None) -> str:
+    """
+    Build a `Stripe-Signature` header value for a payload
+
+    Only for signing local test fixtures; incoming webhooks are verified by
+    the Stripe SDK (see verify_signature).
+
+    Args:
+        payload: Raw request body
+        secret: Webhook signing secret (whsec_...)
+        timestamp: Optional Unix timestamp (defaults to now)
+
+    Returns:
+        Header value in Stripe's `t=...,v1=...` format
+    """
+    timestamp = int(timestamp if timestamp is not None else time.time())
+    signed = f"{timestamp}.".encode("utf-8") + payload
+    signature = hmac.new(secret.encode("utf-8"), signed, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def verify_signature(payload: bytes, sig_header: Optional[str], secret: str,
+                     tolerance: int = SIGNATURE_TOLERANCE_SECONDS) -> Dict[str, Any]:
+    """
+    Verify a Stripe webhook signature and decode the event
+
+    Args:
+        payload: Raw request body
+        sig_header: Value of the `Stripe-Signature` header
+        secret: Webhook signing secret
+        tolerance: Maximum age of the signature in seconds
+
+    Returns:
+        Decoded event dict
+
+    Raises:
+        SignatureVerificationError: if the header is missing, stale or does not match
+        ValueError: if the signed payload is not valid JSON
+    """
+    stripe.Webhook.construct_event(payload, sig_header, secret, tolerance=tolerance)
+    # The queue stores plain JSON; the verified payload is exactly the event
+    return json.loads(payload.decode("utf-8"))
+
+
+def extract_telegram_user_id(obj: Dict[str, Any]) -> Optional[int]:
+    """
+    Find the Telegram user id attached to a Checkout Session or PaymentIntent
+
+    The payment link is opened with `client_reference_id=<telegram id>`; custom
+    integrations may put it into `metadata.telegram_user_id` instead.
+    """
+    candidates = [
+        obj.get("client_reference_id"),
+        (obj.get("metadata") or {}).get("telegram_user_id"),
+    ]
+    for value in candidates:
+        try:
+            if value:
+                return int(value)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+class WebhookEventQueue:
+    """Durable SQLite queue of Stripe webhook events, de-duplicated by event id"""
+
+    def __init__(self, db_path: str = WEBHOOK_DB_PATH):
+        """
+        Initialize the webhook event queue
+
+        Args:
+            db_path: Path to the SQLite database file
+        """
+        self.db_path = db_path
+        # (loop, asyncio.Event) pairs of workers waiting for new events
+        self._listeners: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+        self.store = SqliteStore(db_path)
+        self._init_db()
+
+    def _init_db(self) -> None:
+        """Initialize the SQLite database with required tables"""
+        try:
+            self.store.run_sync(self._create_tables)
+        except sqlite3.Error as e:
+            logger.error(f"Webhook queue initialization error: {e}")
+
+    @staticmethod
+    def _create_tables(conn: sqlite3.Connection) -> None:
+        conn.execute('''
+        CREATE TABLE IF NOT EXISTS stripe_events (
+            event_id TEXT PRIMARY KEY,
+            event_type TEXT,
+            payload TEXT,  -- JSON of event.data.object
+            status TEXT DEFAULT 'pending',  -- pending / done / failed
+            attempts INTEGER DEFAULT 0,
+            last_error TEXT,
+            received_at INTEGER,  -- Unix timestamp
+            processed_at INTEGER
+        )
+        ''')
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_stripe_events_status "
+            "ON stripe_events (status, received_at)"
+        )
+
+    def add_listener(self, loop: asyncio.AbstractEventLoop, event: asyncio.Event) -> None:
+        """Register a worker event that is set whenever a new event is queued"""
+        self._listeners.append((loop, event))
+
+    def remove_listener(self, event: asyncio.Event) -> None:
+        self._listeners = [(l, e) for l, e in self._listeners if e is not event]
+
+    def _notify(self) -> None:
+        # Workers may live on another thread's loop (see cloud_run_adapter)
+        for loop, event in list(self._listeners):
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # Loop already closed
+                self.remove_listener(event)
+
+    async def enqueue(self, event: Dict[str, Any]) -> bool:
+        """
+        Store an event unless it was already received
+
+        Returns:
+            True if the event is new
+        """
+        obj = (event.get("data") or {}).get("object") or {}
+        is_new = await self.store.execute(
+            """INSERT OR IGNORE INTO stripe_events
+               (event_id, event_type, payload, received_at)
+               VALUES (?, ?, ?, ?)""",
+            (event["id"], event.get("type"), json.dumps(obj), int(time.time()))
+        ) == 1
+
+        if is_new:
+            self._notify()
+        return is_new
+
+    async def fetch_pending(self, limit: int = 50) -> List[Tuple[str, str, Dict[str, Any]]]:
+        """
+        Returns:
+            List of tuples (event_id, event_type, data_object) in arrival order
+        """
+        rows = await self.store.fetchall(
+            """SELECT event_id, event_type, payload FROM stripe_events
+               WHERE status = 'pending'
+               ORDER BY received_at LIMIT ?""",
+            (limit,)
+        )
+        return [(event_id, event_type, json.loads(payload)) for event_id, event_type, payload in rows]
+
+    async def mark_done(self, event_id: str) -> None:
+        await self.store.execute(
+            "UPDATE stripe_events SET status = 'done', processed_at = ? WHERE event_id = ?",
+            (int(time.time()), event_id)
+        )
+
+    async def mark_failed(self, event_id: str, error: str) -> None:
+        """Record a failed attempt; the event stays pending until MAX_ATTEMPTS is reached"""
+        await self.store.execute(
+            """UPDATE stripe_events
+               SET attempts = attempts + 1, last_error = ?,
+                   status = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'pending' END
+               WHERE event_id = ?""",
+            (error, MAX_ATTEMPTS, event_id)
+        )
+
+    async def close(self) -> None:
+        """Close the database connection"""
+        await self.store.close()
+
+
+def create_webhook_handler(queue: WebhookEventQueue, secret: str):
+    """
+    Create an aiohttp request handler for Stripe webhooks
+
+    Args:
+        queue: Queue that stores verified events
+        secret: Webhook signing secret
+    """
+    from aiohttp import web
+
+    async def stripe_webhook_handler(request):
+        payload = await request.read()
+        try:
+            event = verify_signature(payload, request.headers.get("Stripe-Signature"), secret)
+        except (SignatureVerificationError, ValueError) as e:
+            logger.warning(f"Rejected Stripe webhook: {e}")
+            return web.Response(status=400, text="Invalid signature")
+
+        event_type = event.get("type")
+        if event_type not in HANDLED_EVENT_TYPES:
+            # Acknowledge so Stripe does not retry events we do not care about
+            return web.Response(text="Ignored")
+
+        try:
+            is_new = await queue.enqueue(event)
+        except (sqlite3.Error, KeyError) as e:
+            logger.error(f"Could not queue Stripe event: {e}")
+            # Non-2xx makes Stripe retry the delivery later
+            return web.Response(status=500, text="Queue error")
+
+        logger.info(f"Stripe event {event.get('id')} ({event_type}) {'queued' if is_new else 'duplicate'}")
+        return web.Response(text="OK")
+
+    return stripe_webhook_handler
+
+
+class WebhookWorker:
+    """Processes queued Stripe events and grants course access"""
+
+    def __init__(self, queue: WebhookEventQueue,
+                 grant_access: Callable[[int], Awaitable[Any]],
+                 payment_index=None, poll_interval: float = 5.0):
+        """
+        Initialize the webhook worker
+
+        Args:
+            queue: Queue with received events
+            grant_access: Coroutine function called with the Telegram user id
+            payment_index: Optional PaymentIndex that is fed with every paid object
+            poll_interval: Fallback polling interval in seconds (new events wake the worker immediately)
+        """
+        self.queue = queue
+        self.grant_access = grant_access
+        self.payment_index = payment_index
+        self.poll_interval = poll_interval
+        self.is_running = False
+        self.task = None
+        self._wakeup = None
+
+    async def _process_event(self, event_type: str, obj: Dict[str, Any]) -> None:
+        if event_type.startswith("checkout.session."):
+            if obj.get("payment_status") != "paid":
+                logger.info(f"Checkout session {obj.get('id')} not paid yet, skipping")
+                return
+            if self.payment_index:
+                await self.payment_index.add_checkout_session(obj)
+        elif event_type == "payment_intent.succeeded":
+            if self.payment_index:
+                await self.payment_index.add_payment_intent(obj)
+
+        user_id = extract_telegram_user_id(obj)
+        if user_id is None:
+            # Still indexed above, so the manual payment check finds it instantly
+            logger.info(f"Stripe object {obj.get('id')} has no Telegram user id")
+            return
+
+        logger.info(f"Granting access to user {user_id} from Stripe object {obj.get('id')}")
+        await self.grant_access(user_id)
+
+    async def process_pending(self) -> int:
+        """
+        Process all pending events
+
+        Returns:
+            Number of events processed successfully
+        """
+        processed = 0
+        for event_id, event_type, obj in await self.queue.fetch_pending():
+            try:
+                await self._process_event(event_type, obj)
+                await self.queue.mark_done(event_id)
+                processed += 1
+            except Exception as e:
+                logger.error(f"Error processing Stripe event {event_id}: {e}")
+                await self.queue.mark_failed(event_id, str(e))
+        return processed
+
+    async def _worker_loop(self) -> None:
+        """Main webhook processing loop"""
+        logger.info("Starting Stripe webhook worker")
+        self.is_running = True
+
+        while self.is_running:
+            try:
+                self._wakeup.clear()
+                await self.process_pending()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                logger.info("Stripe webhook worker cancelled")
+                break
+            except Exception as e:
+                logger.error(f"Error in Stripe webhook worker: {e}")
+                await asyncio.sleep(self.poll_interval)
+
+    async def start(self) -> None:
+        """Start the webhook worker"""
+        if self.task is None or self.task.done():
+            self._wakeup = asyncio.Event()
+            self.queue.add_listener(asyncio.get_running_loop(), self._wakeup)
+            self.task = asyncio.create_task(self._worker_loop())
+            logger.info("Stripe webhook worker started")
+
+    async def stop(self) -> None:
+        """Stop the webhook worker"""
+        if self.task and not self.task.done():
+            self.is_running = False
+            self.queue.remove_listener(self._wakeup)
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            logger.info("Stripe webhook worker stopped")
+
+
+# Shared queue instance used by both the web server and the bot worker
+_queue = None
+
+
+def get_webhook_queue() -> WebhookEventQueue:
+    """Return the process-wide webhook queue"""
+    global _queue
+    if _queue is None:
+        _queue = WebhookEventQueue(WEBHOOK_DB_PATH)
+    return _queue
+
+
+def _fixture_event(user_id: int) -> Dict[str, Any]:
+    now = int(time.time())
+    return {
+        "id": f"evt_test_{now}",
+        "type": "checkout.session.completed",
+        "created": now,
+        "data": {"object": {
+            "id": f"cs_test_{now}",
+            "object": "checkout.session",
+            "client_reference_id": str(user_id),
+            "payment_status": "paid",
+            "status": "complete",
+            "created": now,
+            "amount_total": 14900,
+            "currency": "eur",
+            "customer_details": {"email": "test@example.com", "name": "Test User"},
+        }},
+    }
+
+
+if __name__ == "__main__":
+    # Send a locally signed fixture to a running server
+    import argparse
+    import urllib.request
+
+    parser = argparse.ArgumentParser(description="Send a signed Stripe webhook fixture")
+    parser.add_argument("fixture", nargs="?", help="Path to a JSON event fixture")
+    parser.add_argument("--user-id", type=int, help="Generate a checkout.session.completed event for this user")
+    parser.add_argument("--url", default=f"http://localhost:{os.getenv('PORT', 8080)}{WEBHOOK_PATH}")
+    args = parser.parse_args()
+
+    if not STRIPE_WEBHOOK_SECRET:
+        raise SystemExit("STRIPE_WEBHOOK_SECRET is not set")
+    if args.fixture:
+        with open(args.fixture, "rb") as f:
+            body = f.read()
+    elif args.user_id:
+        body = json.dumps(_fixture_event(args.user_id)).encode("utf-8")
+    else:
+        raise SystemExit("Pass a fixture file or --user-id")
+
+    request = urllib.request.Request(args.url, data=body, method="POST", headers={
+        "Content-Type": "application/json",
+        "Stripe-Signature": sign_payload(body, STRIPE_WEBHOOK_SECRET),
+    })
+    with urllib.request.urlopen(request) as response:
+        print(response.status, response.read().decode("utf-8"))
@@ -0,0 +1,42 @@
+import asyncio
+import sqlite3
+
+from answer_cache import AnswerCache, normalize_question
+
+QUESTION = "Нужно ли платить налоги с дохода YouTube?"
+NEGATED = "Не нужно ли платить налоги с дохода YouTube?"
+
+
+def test_negation_is_part_of_the_key():
+    assert normalize_question(QUESTION) != normalize_question(NEGATED)
+    assert "не" in normalize_question(NEGATED).split()
+
+
+def test_negated_question_does_not_hit_the_plain_answer(tmp_path):
+    async def scenario():
+        cache = AnswerCache(db_path=str(tmp_path / "cache.db"))
+        await cache.put(QUESTION, "Да, нужно.")
+        assert await cache.get(QUESTION) == "Да, нужно."
+        # Neither an exact nor a near-duplicate hit
+        assert await cache.get(NEGATED) is None
+        await cache.store.close()
+
+    asyncio.run(scenario())
+
+
+def test_keys_from_the_old_normalization_are_dropped(tmp_path):
+    db_path = str(tmp_path / "cache.db")
+    AnswerCache(db_path=db_path)
+    with sqlite3.connect(db_path) as conn:
+        # Stored before negations were kept: the key lost the "не"
+        conn.execute(
+            "INSERT INTO answer_cache VALUES (?, ?, ?, strftime('%s', 'now'), 0, 0)",
+            (normalize_question(QUESTION), NEGATED, "Нет, не нужно.")
+        )
+
+    async def scenario():
+        cache = AnswerCache(db_path=db_path)
+        assert await cache.get(QUESTION) is None
+        await cache.store.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,41 @@
+import os
+
+import pytest
+
+from faq_index import FaqIndex, parse_faq
+
+DOCUMENTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "documents")
+FAQ_PATH = os.path.join(DOCUMENTS_DIR, "faq.txt")
+VARIABLES = {"COURSE_TITLE": "Курс", "COURSE_PRICE_EUR": "149"}
+
+
+@pytest.fixture(scope="module")
+def index():
+    return FaqIndex.build(
+        faq_path=FAQ_PATH,
+        documents_dir=DOCUMENTS_DIR,
+        variables=VARIABLES
+    )
+
+
+def faq_entries():
+    """(question wording, expected answer) pairs of the FAQ file"""
+    with open(FAQ_PATH, encoding="utf-8") as f:
+        return [(passage.text, passage.answer) for passage in parse_faq(f.read(), VARIABLES)]
+
+
+@pytest.mark.parametrize("question, expected", faq_entries())
+def test_faq_wordings_are_answered_directly(index, question, expected):
+    answer, _ = index.lookup(question)
+    assert answer == expected
+
+
+@pytest.mark.parametrize("question", ["курс", "курс?", "доступ", "цена", "канал", "Как оплатить?"])
+def test_short_ambiguous_queries_go_to_the_assistant(index, question):
+    answer, _ = index.lookup(question)
+    assert answer is None
+
+
+def test_short_query_still_supplies_context(index):
+    _, context = index.lookup("доступ")
+    assert context
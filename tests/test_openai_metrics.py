@@ -0,0 +1,33 @@
+"""Tests for the /metrics output of openai_metrics.py and its access check"""
+from aiohttp.test_utils import make_mocked_request
+
+from cloud_run_adapter import metrics_allowed
+from openai_metrics import OpenAIMetrics
+
+
+def test_render_keeps_counts_exact_and_floats_precise():
+    metrics = OpenAIMetrics(buckets=(0.5,))
+    metrics._inc("openai_retries_total", (("call_site", "question"),), 1234567)
+    metrics.record_request("question", "chat.completions", 0.123456789)
+
+    lines = metrics.render().splitlines()
+
+    assert 'openai_retries_total{call_site="question"} 1234567' in lines
+    assert ('openai_request_duration_seconds_bucket'
+            '{call_site="question",operation="chat.completions",le="0.5"} 1') in lines
+    assert ('openai_request_duration_seconds_sum'
+            '{call_site="question",operation="chat.completions"} 0.123456789') in lines
+
+
+def test_metrics_require_token_when_configured(monkeypatch):
+    monkeypatch.setenv("METRICS_TOKEN", "secret")
+
+    assert metrics_allowed(make_mocked_request("GET", "/metrics", headers={"Authorization": "Bearer secret"}))
+    assert not metrics_allowed(make_mocked_request("GET", "/metrics", headers={"Authorization": "Bearer other"}))
+    assert not metrics_allowed(make_mocked_request("GET", "/metrics"))
+
+
+def test_metrics_without_token_are_not_public(monkeypatch):
+    monkeypatch.delenv("METRICS_TOKEN", raising=False)
+
+    assert not metrics_allowed(make_mocked_request("GET", "/metrics"))
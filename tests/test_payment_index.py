@@ -0,0 +1,65 @@
+"""Tests for payment lookups by name in payment_index.py and name_matcher.py"""
+import asyncio
+
+import pytest
+
+from name_matcher import tokens_match
+from payment_index import PaymentIndex
+
+PAYERS = {
+    "cs_marina": "Marina Ivanova",
+    "cs_elena": "Elena Popova",
+    "cs_ivan": "Ivan Petrov",
+    "cs_yulia": "Юлия Петрова",
+}
+
+
+def match_all(tmp_path, queries):
+    """Index the PAYERS sessions and run match() for every (email, name) query"""
+    async def scenario():
+        index = PaymentIndex(str(tmp_path / "payments.db"), stripe_client=object())
+        for payment_id, name in PAYERS.items():
+            await index.add_checkout_session({
+                "id": payment_id, "payment_status": "paid", "created": 1700000000,
+                "amount_total": 14900, "currency": "eur",
+                "customer_details": {"email": f"{payment_id}@example.com", "name": name},
+            })
+        results = [await index.match(email=email, name=name) for email, name in queries]
+        await index.close()
+        return results
+
+    return asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("query", ["Anna Ivanova", "Maria Ivanova", "Elena", "Petrov"])
+def test_similar_names_of_other_people_do_not_match(tmp_path, query):
+    assert match_all(tmp_path, [(None, query)]) == [None]
+
+
+def test_exact_and_transliterated_names(tmp_path):
+    exact, reordered, transliterated = match_all(tmp_path, [
+        (None, "marina  IVANOVA"), (None, "Ivanova Marina"), (None, "Yulia Petrova"),
+    ])
+
+    assert (exact.payment_id, exact.criterion) == ("cs_marina", "name")
+    assert (reordered.payment_id, reordered.criterion) == ("cs_marina", "name_fuzzy")
+    assert (transliterated.payment_id, transliterated.criterion) == ("cs_yulia", "name_fuzzy")
+
+
+def test_email_wins_over_name(tmp_path):
+    [match] = match_all(tmp_path, [("CS_ELENA@example.com ", "Marina Ivanova")])
+
+    assert (match.payment_id, match.criterion) == ("cs_elena", "email")
+
+
+@pytest.mark.parametrize("query, name, expected", [
+    ("Julia Petrowa", "Юлия Петрова", True),
+    ("Petrova Yulia", "Yulia Petrova", True),
+    ("Anna Ivanova", "Marina Ivanova", False),
+    ("Maria Ivanova", "Marina Ivanova", False),
+    ("Ivan Ivanov", "Ivan Ivanova", False),
+    ("Elena", "Elena Popova", False),
+    ("Petrov", "Ivan Petrov", False),
+])
+def test_tokens_match(query, name, expected):
+    assert tokens_match(query, name) is expected
@@ -0,0 +1,109 @@
+"""Tests for reminder scheduling in reminder_system.py"""
+import asyncio
+import sqlite3
+import time
+
+import pytest
+
+from reminder_system import REMINDER_MIN_GAP, ReminderSystem
+from reminder_windows import SendWindows
+
+DAY = 24 * 60 * 60
+
+
+@pytest.fixture
+def make_system(tmp_path):
+    systems = []
+
+    def make(db_path=None):
+        system = ReminderSystem(None, str(db_path or tmp_path / "reminders.db"), send_windows=SendWindows(""))
+        systems.append(system)
+        return system
+
+    yield make
+    for system in systems:
+        asyncio.run(system.store.close())
+
+
+def test_next_reminder_keeps_gap_after_previous_send(make_system):
+    system = make_system()
+    now = int(time.time())
+    view_time = now - 30 * DAY  # every reminder is long overdue
+
+    assert system._next_reminder_at(view_time, 0) < now
+    assert system._next_reminder_at(view_time, 0, last_reminder_at=now) == now + REMINDER_MIN_GAP
+
+
+def test_migration_spaces_out_overdue_reminders(make_system, tmp_path):
+    db_path = tmp_path / "old.db"
+    now = int(time.time())
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("""CREATE TABLE lesson_views (
+            user_id INTEGER PRIMARY KEY, username TEXT, first_name TEXT, last_name TEXT,
+            view_time INTEGER, has_purchased INTEGER DEFAULT 0, last_reminder_index INTEGER DEFAULT -1)""")
+        conn.execute("""CREATE TABLE reminder_history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, reminder_index INTEGER,
+            sent_time INTEGER, was_ai_generated INTEGER DEFAULT 0)""")
+        conn.execute("INSERT INTO lesson_views (user_id, view_time, last_reminder_index) VALUES (1, ?, 0)",
+                     (now - 30 * DAY,))
+        conn.execute("INSERT INTO lesson_views (user_id, view_time) VALUES (2, ?)", (now - 30 * DAY,))
+        conn.execute("INSERT INTO reminder_history (user_id, reminder_index, sent_time) VALUES (1, 0, ?)",
+                     (now - 60,))
+    conn.close()
+
+    system = make_system(db_path)
+    rows = dict(system.store.run_sync(
+        lambda conn: conn.execute("SELECT user_id, next_reminder_at FROM lesson_views").fetchall()
+    ))
+
+    assert rows[1] == now - 60 + REMINDER_MIN_GAP
+    assert rows[2] < now  # never reminded: the first reminder is due right away
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, user_id, text):
+        self.sent.append(user_id)
+
+
+def test_process_reminders_reminds_each_user_once_per_run(tmp_path, monkeypatch):
+    monkeypatch.setattr("reminder_system.REMINDER_CLAIM_BATCH", 2)
+    monkeypatch.setattr("reminder_system.REMINDER_MIN_GAP", 1)
+    bot = FakeBot()
+    system = ReminderSystem(bot, str(tmp_path / "reminders.db"), send_windows=SendWindows(""))
+    view_time = int(time.time()) - 30 * DAY  # all three reminders are overdue
+    system.store.run_sync(lambda conn: conn.executemany(
+        "INSERT INTO lesson_views (user_id, view_time, next_reminder_at) VALUES (?, ?, ?)",
+        [(user_id, view_time, view_time) for user_id in (1, 2, 3)]
+    ))
+
+    async def scenario():
+        await system.process_reminders()
+        await system.store.close()
+
+    asyncio.run(scenario())
+
+    assert sorted(bot.sent) == [1, 2, 3]
+
+
+def test_process_reminders_continues_past_batches_without_sendable_reminders(tmp_path, monkeypatch):
+    monkeypatch.setattr("reminder_system.REMINDER_CLAIM_BATCH", 2)
+    bot = FakeBot()
+    system = ReminderSystem(bot, str(tmp_path / "reminders.db"), send_windows=SendWindows(""))
+    view_time = int(time.time()) - 30 * DAY
+    # Users 1 and 2 have had every reminder and fill the first batch
+    system.store.run_sync(lambda conn: conn.executemany(
+        """INSERT INTO lesson_views (user_id, view_time, last_reminder_index, next_reminder_at)
+           VALUES (?, ?, ?, ?)""",
+        [(1, view_time, 2, view_time - 2), (2, view_time, 2, view_time - 1), (3, view_time, -1, view_time)]
+    ))
+
+    async def scenario():
+        await system.process_reminders()
+        await system.store.close()
+
+    asyncio.run(scenario())
+
+    assert bot.sent == [3]
@@ -0,0 +1,59 @@
+"""Tests for the REMINDER_VARIANTS configuration in reminder_variants.py"""
+import json
+
+import pytest
+
+from reminder_variants import apply_variants, parse_variants_config, slot_variants
+
+INTERVALS = [{"days": 1, "template": "first"}, {"days": 3, "template": "second"}]
+
+
+def test_parses_json_and_applies_to_slots():
+    config = parse_variants_config(json.dumps({
+        "1": [{"id": "short", "weight": 2, "template": "Привет!"}, {"id": "ai", "ai": True}]
+    }))
+    intervals = apply_variants(INTERVALS, config)
+
+    assert [variant.id for variant in slot_variants(intervals[0])] == ["default"]
+    assert slot_variants(intervals[1]) == [
+        ("short", 2.0, "Привет!", False),
+        ("ai", 1.0, "second", True),
+    ]
+    assert "variants" not in INTERVALS[1]
+
+
+def test_reads_config_file(tmp_path):
+    path = tmp_path / "variants.json"
+    path.write_text(json.dumps({"0": [{"id": "a"}, {"id": "b"}]}), encoding="utf-8")
+
+    assert list(parse_variants_config(str(path))) == [0]
+
+
+def test_empty_config():
+    assert parse_variants_config("") == {}
+    assert apply_variants(INTERVALS, {}) == INTERVALS
+
+
+@pytest.mark.parametrize("spec", [
+    "{not json",
+    "[]",
+    '{"first": [{"id": "a"}]}',
+    '{"-1": [{"id": "a"}]}',
+    '{"0": []}',
+    '{"0": ["a"]}',
+    '{"0": [{"weight": 1}]}',
+    '{"0": [{"id": "a", "weight": 0}]}',
+    '{"0": [{"id": "a", "weight": "2"}]}',
+    '{"0": [{"id": "a", "ai": "yes"}]}',
+    '{"0": [{"id": "a", "text": "typo"}]}',
+    '{"0": [{"id": "a"}, {"id": "a"}]}',
+    "/nonexistent/variants.json",
+])
+def test_rejects_invalid_config(spec):
+    with pytest.raises(ValueError):
+        parse_variants_config(spec)
+
+
+def test_rejects_missing_reminder():
+    with pytest.raises(ValueError):
+        apply_variants(INTERVALS, parse_variants_config('{"2": [{"id": "a"}]}'))
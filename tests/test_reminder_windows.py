@@ -0,0 +1,59 @@
+"""Tests for the reminder send windows in reminder_windows.py"""
+import calendar
+
+from reminder_windows import SendWindows
+
+DAY = 24 * 60 * 60
+
+
+def utc(hour, minute=0):
+    return calendar.timegm((2026, 3, 2, hour, minute, 0))
+
+
+def local_hour(timestamp, offset):
+    return (timestamp + offset * 3600) // 3600 % 24
+
+
+def test_night_view_is_deferred_into_local_daytime():
+    windows = SendWindows()  # defaults: 10-21 local, Moscow time for Russian
+    view_time = utc(20, 30)  # 23:30 in Moscow
+    window_start = windows.window_start(view_time, "ru")
+    due = view_time + DAY
+
+    sent = windows.defer(due, window_start, user_id=42)
+
+    assert sent > due
+    assert sent - due < DAY
+    assert 10 <= local_hour(sent, 3) < 21
+
+
+def test_daytime_reminder_is_not_deferred():
+    windows = SendWindows()
+    view_time = utc(9)  # 12:00 in Moscow
+    due = view_time + DAY
+
+    assert windows.defer(due, windows.window_start(view_time, "ru"), user_id=42) == due
+
+
+def test_language_offset_and_default_offset():
+    windows = SendWindows("10-21", "de:1", "3")
+
+    assert windows.window_start(utc(12), "de-DE") == 9 * 60
+    assert windows.window_start(utc(12), "es") == 7 * 60
+    assert windows.window_start(utc(12), None) == 7 * 60
+
+
+def test_activity_window_without_default_offset():
+    windows = SendWindows("10-21", "", "")
+
+    assert windows.window_start(utc(12), "es") == 12 * 60 - 11 * 60 // 2
+    assert windows.window_start(None, "es") is None
+
+
+def test_deferred_reminders_spread_over_the_window():
+    windows = SendWindows()
+    due = utc(22)  # 01:00 in Moscow
+    sent = {windows.defer(due, windows.window_start(due, "ru"), user_id) for user_id in range(100)}
+
+    assert len(sent) > 50
+    assert all(10 <= local_hour(timestamp, 3) < 21 for timestamp in sent)
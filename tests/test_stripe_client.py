@@ -0,0 +1,38 @@
+"""Tests for the concurrency cap of stripe_client.AsyncStripeClient"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from stripe_client import AsyncStripeClient
+
+
+def test_timed_out_request_keeps_its_slot_until_the_thread_finishes():
+    client = AsyncStripeClient(max_workers=4, max_concurrency=1, timeout=0.05)
+    lock = threading.Lock()
+    running = []
+    overlaps = []
+
+    def slow_request():
+        with lock:
+            running.append(1)
+            overlaps.append(len(running))
+        time.sleep(0.3)
+        with lock:
+            running.pop()
+
+    async def scenario():
+        with pytest.raises(asyncio.TimeoutError):
+            await client.call(slow_request)
+        # The first thread is still running: this one must wait for its slot
+        started = time.monotonic()
+        with pytest.raises(asyncio.TimeoutError):
+            await client.call(slow_request)
+        return time.monotonic() - started
+
+    waited = asyncio.run(scenario())
+    client.close()
+
+    assert max(overlaps) == 1
+    assert waited >= 0.2
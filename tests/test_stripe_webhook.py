@@ -0,0 +1,81 @@
+"""Tests for the Stripe webhook endpoint in stripe_webhook.py"""
+import asyncio
+import json
+import time
+
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from stripe_webhook import (WEBHOOK_PATH, WebhookEventQueue, WebhookWorker, _fixture_event,
+                            create_webhook_handler, sign_payload)
+
+SECRET = "whsec_test"
+
+
+def post_fixture(tmp_path, body, signature):
+    """POST a payload to the webhook handler; returns (status, pending events)"""
+    async def scenario():
+        queue = WebhookEventQueue(str(tmp_path / "webhook.db"))
+        app = web.Application()
+        app.router.add_post(WEBHOOK_PATH, create_webhook_handler(queue, SECRET))
+        async with TestClient(TestServer(app)) as client:
+            response = await client.post(WEBHOOK_PATH, data=body, headers={"Stripe-Signature": signature})
+            status = response.status
+        pending = await queue.fetch_pending()
+        await queue.close()
+        return status, pending
+
+    return asyncio.run(scenario())
+
+
+def test_signed_fixture_is_queued_and_grants_access(tmp_path):
+    body = json.dumps(_fixture_event(123456789)).encode("utf-8")
+
+    status, pending = post_fixture(tmp_path, body, sign_payload(body, SECRET))
+
+    assert status == 200
+    assert [(event_type, obj["client_reference_id"]) for _, event_type, obj in pending] == [
+        ("checkout.session.completed", "123456789")
+    ]
+
+    granted = []
+
+    async def grant_access(user_id):
+        granted.append(user_id)
+
+    async def process():
+        queue = WebhookEventQueue(str(tmp_path / "webhook.db"))
+        processed = await WebhookWorker(queue, grant_access).process_pending()
+        remaining = await queue.fetch_pending()
+        await queue.close()
+        return processed, remaining
+
+    assert asyncio.run(process()) == (1, [])
+    assert granted == [123456789]
+
+
+def test_bad_signature_is_rejected(tmp_path):
+    body = json.dumps(_fixture_event(123456789)).encode("utf-8")
+
+    status, pending = post_fixture(tmp_path, body, sign_payload(body, "whsec_other"))
+
+    assert status == 400
+    assert pending == []
+
+
+def test_stale_signature_is_rejected(tmp_path):
+    body = json.dumps(_fixture_event(123456789)).encode("utf-8")
+
+    status, pending = post_fixture(tmp_path, body, sign_payload(body, SECRET, int(time.time()) - 3600))
+
+    assert status == 400
+    assert pending == []
+
+
+def test_missing_signature_is_rejected(tmp_path):
+    body = json.dumps(_fixture_event(123456789)).encode("utf-8")
+
+    status, pending = post_fixture(tmp_path, body, "")
+
+    assert status == 400
+    assert pending == []